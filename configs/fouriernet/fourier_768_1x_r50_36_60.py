@@ -38,7 +38,7 @@ model = dict(
         loss_centerness=dict(
             type='CrossEntropyLoss', use_sigmoid=True, loss_weight=1.0),
         loss_on_coe=False,
-        loss_mask=dict(type='PolarIOULoss'),
+        loss_mask=dict(type='PolarIOULoss', fused=True),
         norm_cfg=dict(type='GN', num_groups=32, requires_grad=True),
         contour_points=contour_points,
         use_fourier=True,
@@ -63,7 +63,12 @@ test_cfg = dict(
     min_bbox_size=0,
     score_thr=0.05,
     nms=dict(type='nms', iou_thr=0.5),
-    max_per_img=100)
+    max_per_img=100,
+    # decode small detections with fewer coefficients, sizes are sqrt(area),
+    # only used together with decode_after_nms
+    # adaptive_coe=dict(sizes=[32, 96], num_coe=[12, 24, 36]),
+    # decode contours only for the detections kept by nms
+    decode_after_nms=True)
 # dataset settings
 dataset_type = 'CocoDataset'
 data_root = '~/coco/'
@@ -71,7 +76,7 @@ img_norm_cfg = dict(
     mean=[102.9801, 115.9465, 122.7717], std=[1.0, 1.0, 1.0], to_rgb=False)
 train_pipeline = [
     dict(type='LoadImageFromFile'),
-    dict(type='LoadAnnotations', with_bbox=True, with_mask=True),
+    dict(type='LoadAnnotations', with_bbox=True, with_contour=True),
     dict(
         type='Resize',
         img_scale=[(1333, 640), (1333, 800)],
@@ -80,17 +85,20 @@ train_pipeline = [
     dict(type='RandomFlip', flip_ratio=0.5),
     dict(type='Normalize', **img_norm_cfg),
     dict(type='Pad', size_divisor=32),
-    dict(type='ConvertToContour', contour_points=contour_points,
-         use_max_only=True,
-         return_centerness=True),
+    dict(type='FormatContours', contour_points=contour_points),
+    dict(type='PackContours'),
     dict(type='ToTensor', keys=['gt_centers', 'gt_max_centerness']),
-    dict(type='ToDataContainer', fields=(dict(key='gt_centers'),
-                                         dict(key='gt_max_centerness'))),
+    dict(type='ToDataContainer', fields=(
+        dict(key='gt_centers'),
+        dict(key='gt_max_centerness'),
+        dict(key='gt_contour_points', stack=True, pad_dims=1),
+        dict(key='gt_contour_offsets', stack=True, pad_dims=1))),
     dict(type='DefaultFormatBundle'),
     dict(type='Collect', keys=['img',
                                'gt_bboxes',
                                'gt_labels',
-                               'gt_masks',
+                               'gt_contour_points',
+                               'gt_contour_offsets',
                                'gt_centers',
                                'gt_max_centerness']),
 ]
@@ -105,7 +113,7 @@ test_pipeline = [
             dict(type='RandomFlip'),
             dict(type='Normalize', **img_norm_cfg),
             dict(type='Pad', size_divisor=32),
-            dict(type='ImageToTensor', keys=['img']),
+            dict(type='DefaultFormatBundle'),
             dict(type='Collect', keys=['img']),
         ])
 ]
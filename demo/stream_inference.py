@@ -0,0 +1,99 @@
+import argparse
+import os.path as osp
+import threading
+import time
+
+import mmcv
+
+from mmdet.apis import StreamingInference, init_detector, show_result
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Detect the objects of all images in a directory')
+    parser.add_argument('config', help='test config file path')
+    parser.add_argument('checkpoint', help='checkpoint file')
+    parser.add_argument('img_dir', help='directory of the images')
+    parser.add_argument('out_dir', help='directory of the json results')
+    parser.add_argument(
+        '--device', default='cuda:0', help='device used for inference')
+    parser.add_argument(
+        '--batch-size', type=int, default=8, help='images per forward')
+    parser.add_argument(
+        '--loaders', type=int, default=4, help='number of loading threads')
+    parser.add_argument(
+        '--writers', type=int, default=2, help='number of writing threads')
+    parser.add_argument(
+        '--score-thr', type=float, default=0.3, help='bbox score threshold')
+    parser.add_argument(
+        '--show-dir', help='directory to save the visualised results')
+    args = parser.parse_args()
+    return args
+
+
+def result2json(result, class_names, score_thr):
+    """Detections above score_thr with boxes as [x, y, w, h]."""
+    bbox_result, segm_result = result
+    dets = []
+    for label, (bboxes, segms) in enumerate(zip(bbox_result, segm_result)):
+        for bbox, segm in zip(bboxes, segms):
+            if bbox[4] < score_thr:
+                continue
+            x1, y1, x2, y2 = bbox[:4].tolist()
+            dets.append(
+                dict(
+                    label=class_names[label],
+                    score=float(bbox[4]),
+                    bbox=[x1, y1, x2 - x1 + 1, y2 - y1 + 1],
+                    segmentation=dict(
+                        size=segm['size'], counts=segm['counts'].decode())))
+    return dets
+
+
+def main():
+    args = parse_args()
+    mmcv.mkdir_or_exist(args.out_dir)
+    if args.show_dir is not None:
+        mmcv.mkdir_or_exist(args.show_dir)
+
+    model = init_detector(args.config, args.checkpoint, device=args.device)
+    img_names = sorted(
+        mmcv.scandir(args.img_dir, suffix=('.jpg', '.jpeg', '.png')))
+    prog_bar = mmcv.ProgressBar(len(img_names))
+    lock = threading.Lock()
+
+    def write(img, result):
+        name = osp.splitext(osp.basename(img))[0]
+        mmcv.dump(
+            result2json(result, model.CLASSES, args.score_thr),
+            osp.join(args.out_dir, name + '.json'))
+        if args.show_dir is not None:
+            show_result(
+                img,
+                result,
+                model.CLASSES,
+                score_thr=args.score_thr,
+                show=False,
+                out_file=osp.join(args.show_dir, osp.basename(img)))
+        with lock:
+            prog_bar.update()
+
+    runner = StreamingInference(
+        model,
+        batch_size=args.batch_size,
+        num_loaders=args.loaders,
+        num_writers=args.writers)
+    start = time.perf_counter()
+    counters = runner(
+        (osp.join(args.img_dir, name) for name in img_names), write)
+    total_time = time.perf_counter() - start
+
+    print('\n{} images in {:.1f} s, {:.1f} img/s'.format(
+        len(img_names), total_time,
+        len(img_names) / total_time))
+    for counter in counters.values():
+        print(counter)
+
+
+if __name__ == '__main__':
+    main()
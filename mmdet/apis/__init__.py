@@ -1,9 +1,13 @@
 from .inference import (async_inference_detector, inference_detector,
-                        init_detector, show_result, show_result_pyplot, save_result_pyplot)
+                        inference_detector_batch, init_detector, show_result,
+                        show_result_pyplot, save_result_pyplot)
+from .stream_inference import StageCounter, StreamingInference
 from .train import get_root_logger, set_random_seed, train_detector
 
 __all__ = [
     'get_root_logger', 'set_random_seed', 'train_detector', 'init_detector',
-    'async_inference_detector', 'inference_detector', 'show_result',
-    'show_result_pyplot', 'save_result_pyplot'
+    'async_inference_detector', 'inference_detector',
+    'inference_detector_batch', 'show_result',
+    'show_result_pyplot', 'save_result_pyplot', 'StageCounter',
+    'StreamingInference'
 ]
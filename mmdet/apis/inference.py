@@ -6,6 +6,7 @@ import numpy as np
 import pycocotools.mask as maskUtils
 import torch
 from os.path import join
+from mmcv.parallel import DataContainer as DC
 from mmcv.parallel import collate, scatter
 from mmcv.runner import load_checkpoint
 
@@ -61,6 +62,29 @@ class LoadImage(object):
         return results
 
 
+def _get_test_pipeline(model):
+    """Build the test pipeline of the model config once and cache it."""
+    if getattr(model, 'test_pipeline', None) is None:
+        test_pipeline = [LoadImage()] + model.cfg.data.test.pipeline[1:]
+        model.test_pipeline = Compose(test_pipeline)
+    return model.test_pipeline
+
+
+def _collate_to_device(data, device):
+    """Collate test samples into one batch and move it to the model device.
+
+    ``scatter`` only targets GPUs, so on CPU the data containers are simply
+    unwrapped.
+    """
+    data = collate(data, samples_per_gpu=len(data))
+    if device.type == 'cuda':
+        return scatter(data, [device])[0]
+    return {
+        key: [v.data[0] if isinstance(v, DC) else v for v in value]
+        for key, value in data.items()
+    }
+
+
 def inference_detector(model, img):
     """Inference image(s) with the detector.
 
@@ -73,21 +97,60 @@ def inference_detector(model, img):
         If imgs is a str, a generator will be returned, otherwise return the
         detection results directly.
     """
-    cfg = model.cfg
     device = next(model.parameters()).device  # model device
-    # build the data pipeline
-    test_pipeline = [LoadImage()] + cfg.data.test.pipeline[1:]
-    test_pipeline = Compose(test_pipeline)
+    test_pipeline = _get_test_pipeline(model)
     # prepare data
     data = dict(img=img)
     data = test_pipeline(data)
-    data = scatter(collate([data], samples_per_gpu=1), [device])[0]
+    data = _collate_to_device([data], device)
     # forward the model
     with torch.no_grad():
         result = model(return_loss=False, rescale=True, **data)
     return result
 
 
+def _prepare_batch_sample(test_pipeline, img):
+    """Run the test pipeline on an image to be collated with others."""
+    sample = test_pipeline(dict(img=img))
+    # images of different sizes are padded when collated
+    sample['img'] = [
+        img if isinstance(img, DC) else DC(img, stack=True)
+        for img in sample['img']
+    ]
+    return sample
+
+
+def inference_detector_batch(model, imgs, batch_size=8):
+    """Inference images with the detector, several images per forward.
+
+    The test pipeline is built once, and the images of every batch are padded
+    to the same size and collated into one tensor. The detector must accept
+    several images per batch and return the result of every image with
+    ``batched=True``, as FourierNet does.
+
+    Args:
+        model (nn.Module): The loaded detector.
+        imgs (list[str/ndarray]): Either image files or loaded images.
+        batch_size (int): Number of images of every forward.
+
+    Returns:
+        list: The detection results of every image.
+    """
+    device = next(model.parameters()).device  # model device
+    test_pipeline = _get_test_pipeline(model)
+    results = []
+    for start in range(0, len(imgs), batch_size):
+        data = [
+            _prepare_batch_sample(test_pipeline, img)
+            for img in imgs[start:start + batch_size]
+        ]
+        data = _collate_to_device(data, device)
+        with torch.no_grad():
+            results.extend(
+                model(return_loss=False, rescale=True, batched=True, **data))
+    return results
+
+
 async def async_inference_detector(model, img):
     """Async inference image(s) with the detector.
 
@@ -99,15 +162,12 @@ async def async_inference_detector(model, img):
     Returns:
         Awaitable detection results.
     """
-    cfg = model.cfg
     device = next(model.parameters()).device  # model device
-    # build the data pipeline
-    test_pipeline = [LoadImage()] + cfg.data.test.pipeline[1:]
-    test_pipeline = Compose(test_pipeline)
+    test_pipeline = _get_test_pipeline(model)
     # prepare data
     data = dict(img=img)
     data = test_pipeline(data)
-    data = scatter(collate([data], samples_per_gpu=1), [device])[0]
+    data = _collate_to_device([data], device)
 
     # We don't restore `torch.is_grad_enabled()` value during concurrent
     # inference since execution can overlap
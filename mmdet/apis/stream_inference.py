@@ -0,0 +1,219 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+from mmdet.core import bbox_mask2result
+from .inference import (_collate_to_device, _get_test_pipeline,
+                        _prepare_batch_sample)
+
+
+class StageCounter(object):
+    """Number of processed images and busy time of a pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.busy_time = 0.
+        self._lock = threading.Lock()
+
+    def update(self, count, busy_time):
+        with self._lock:
+            self.count += count
+            self.busy_time += busy_time
+
+    @property
+    def throughput(self):
+        """Images per second of busy time, i.e. per worker of the stage."""
+        return self.count / self.busy_time if self.busy_time > 0 else 0.
+
+    def __repr__(self):
+        return '{}: {} images in {:.1f} s, {:.1f} img/s per worker'.format(
+            self.name, self.count, self.busy_time, self.throughput)
+
+
+class StreamingInference(object):
+    """Streaming inference of a detector over a large number of images.
+
+    Three stages run concurrently and are connected by bounded queues, so a
+    slow stage holds the others back instead of buffering without limit:
+
+    1. ``num_loaders`` threads read and preprocess the images with the test
+       pipeline of the model.
+    2. The calling thread collates them into batches and runs the network
+       and the box decoding on the model device.
+    3. ``num_writers`` threads encode the contours to RLE masks with
+       :func:`bbox_mask2result` and pass the results to a callback, e.g. to
+       dump them or save visualisations.
+
+    The model must test images like FourierNet does: ``simple_test_bboxes``
+    and ``aug_test_bboxes`` return the boxes, labels and contours of every
+    image, which the writers encode.
+
+    Args:
+        model (nn.Module): The loaded detector, see :func:`init_detector`.
+        batch_size (int): Number of images of every forward.
+        num_loaders (int): Number of preprocessing threads.
+        num_writers (int): Number of post-processing threads.
+        queue_size (int, optional): Capacity of the queues between the
+            stages. Default: 4 batches.
+
+    Example:
+        >>> runner = StreamingInference(model, batch_size=8)
+        >>> runner(img_files, lambda img, result: print(img))
+        >>> print(runner.counters)
+    """
+
+    def __init__(self,
+                 model,
+                 batch_size=8,
+                 num_loaders=4,
+                 num_writers=2,
+                 queue_size=None):
+        if not hasattr(model, 'simple_test_bboxes'):
+            raise TypeError('{} does not support streaming inference'.format(
+                model.__class__.__name__))
+        self.model = model
+        self.batch_size = batch_size
+        self.num_loaders = num_loaders
+        self.num_writers = num_writers
+        self.queue_size = queue_size or 4 * batch_size
+        self.test_pipeline = _get_test_pipeline(model)
+        self.counters = {}
+        self._stop = threading.Event()
+        self._errors = []
+
+    def _put(self, q, item):
+        # waits for free space unless another stage failed
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _load(self, img):
+        start = time.perf_counter()
+        sample = _prepare_batch_sample(self.test_pipeline, img)
+        self.counters['load'].update(1, time.perf_counter() - start)
+        return sample
+
+    def _feed(self, imgs, executor, load_queue):
+        try:
+            for img in imgs:
+                if self._stop.is_set():
+                    break
+                self._put(load_queue, (img, executor.submit(self._load, img)))
+        except Exception as e:
+            self._errors.append(e)
+            self._stop.set()
+        finally:
+            self._put(load_queue, None)
+
+    def _write(self, write_queue, callback):
+        num_classes = self.model.bbox_head.num_classes
+        while not self._stop.is_set():
+            try:
+                item = write_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is None:
+                return
+            img, img_meta, (det_bboxes, det_labels, det_masks) = item
+            start = time.perf_counter()
+            try:
+                result = bbox_mask2result(det_bboxes, det_masks, det_labels,
+                                          num_classes, img_meta)
+                callback(img, result)
+            except Exception as e:
+                self._errors.append(e)
+                self._stop.set()
+            self.counters['write'].update(1, time.perf_counter() - start)
+
+    def _forward(self, imgs, samples, write_queue):
+        start = time.perf_counter()
+        device = next(self.model.parameters()).device
+        data = _collate_to_device(samples, device)
+        with torch.no_grad():
+            if len(data['img']) == 1:
+                det_list = self.model.simple_test_bboxes(
+                    data['img'][0], data['img_meta'][0], rescale=True)
+            else:
+                det_list = self.model.aug_test_bboxes(
+                    data['img'], data['img_meta'], rescale=True)
+        img_metas = data['img_meta'][0]
+        # the writers only use the CPU
+        det_list = [tuple(t.cpu() for t in dets) for dets in det_list]
+        self.counters['forward'].update(
+            len(samples),
+            time.perf_counter() - start)
+        for img, img_meta, dets in zip(imgs, img_metas, det_list):
+            self._put(write_queue, (img, img_meta, dets))
+
+    def __call__(self, imgs, callback):
+        """Detect objects in images.
+
+        Args:
+            imgs (Iterable[str/ndarray]): Image files or loaded images, may be
+                a generator.
+            callback (callable): Called as ``callback(img, result)`` in the
+                writer threads with the result of every image, in any order.
+
+        Returns:
+            dict[str, StageCounter]: The throughput counters of the stages.
+        """
+        self._stop.clear()
+        self._errors = []
+        self.counters = {
+            name: StageCounter(name)
+            for name in ('load', 'forward', 'write')
+        }
+        load_queue = queue.Queue(self.queue_size)
+        write_queue = queue.Queue(self.queue_size)
+        writers = [
+            threading.Thread(
+                target=self._write, args=(write_queue, callback), daemon=True)
+            for _ in range(self.num_writers)
+        ]
+        for writer in writers:
+            writer.start()
+
+        with ThreadPoolExecutor(self.num_loaders) as executor:
+            feeder = threading.Thread(
+                target=self._feed,
+                args=(imgs, executor, load_queue),
+                daemon=True)
+            feeder.start()
+            try:
+                batch_imgs, samples = [], []
+                while not self._stop.is_set():
+                    # the feeder gives up enqueueing the end once a stage
+                    # failed
+                    try:
+                        item = load_queue.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                    if item is not None:
+                        batch_imgs.append(item[0])
+                        samples.append(item[1].result())
+                    if samples and (item is None
+                                    or len(samples) == self.batch_size):
+                        self._forward(batch_imgs, samples, write_queue)
+                        batch_imgs, samples = [], []
+                    if item is None:
+                        break
+            except Exception:
+                self._stop.set()
+                raise
+            finally:
+                for _ in writers:
+                    self._put(write_queue, None)
+                for writer in writers:
+                    writer.join()
+                feeder.join()
+
+        if self._errors:
+            raise self._errors[0]
+        return self.counters
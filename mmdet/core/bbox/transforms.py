@@ -249,18 +249,17 @@ def bbox_mask2result(bboxes, masks, labels, num_classes, img_meta):
         ]
         return bbox_results, mask_results
 
-    mask_results = [[] for _ in range(num_classes - 1)]
+    bboxes = bboxes.cpu().numpy()
+    labels = labels.cpu().numpy()
     masks = masks.permute(0, 2, 1)
     masks = masks.reshape([masks.shape[0], -1])
 
-    # transform the contour points into rle and make the mask list
-    for i in range(masks.shape[0]):
-        m = masks[i].tolist()
-        rle = mask_util.frPyObjects([m], img_h, img_w)
-        label = labels[i]
-        mask_results[label].append(rle[0])
+    # transform the contour points into rle and make the mask list, all
+    # contours are copied to the host at once and encoded in one call
+    rles = mask_util.frPyObjects(masks.cpu().numpy().tolist(), img_h, img_w)
+    mask_results = [[] for _ in range(num_classes - 1)]
+    for rle, label in zip(rles, labels):
+        mask_results[label].append(rle)
 
-    bboxes = bboxes.cpu().numpy()
-    labels = labels.cpu().numpy()
     bbox_results = [bboxes[labels == i, :] for i in range(num_classes - 1)]
     return bbox_results, mask_results
@@ -73,11 +73,21 @@ def multiclass_nms_with_mask(multi_bboxes,
                              nms_cfg,
                              max_num=-1,
                              score_factors=None):
-    """NMS for multi-class bboxes.
+    """NMS for multi-class bboxes with masks.
+
+    All classes are suppressed with a single NMS call: the boxes of every
+    class are shifted by a class-specific offset larger than any coordinate,
+    so boxes of different classes never overlap. The cost of the NMS kernels
+    grows quadratically with the number of boxes, so above
+    ``nms_cfg['split_thr']`` candidates (default 10000 on GPU and 2000 on
+    CPU) the classes are suppressed one by one instead. The masks are
+    gathered by the kept indices and can be any per-candidate tensor, e.g.
+    contours or candidate indices.
 
     Args:
         multi_bboxes (Tensor): shape (n, #class*4) or (n, 4)
         multi_scores (Tensor): shape (n, #class)
+        multi_masks (Tensor): shape (n, ...), the masks of the candidates.
         score_thr (float): bbox threshold, bboxes with scores lower than it
             will not be considered.
         nms_thr (float): NMS IoU threshold
@@ -87,52 +97,62 @@ def multiclass_nms_with_mask(multi_bboxes,
             applying NMS
 
     Returns:
-        tuple: (bboxes, labels), tensors of shape (k, 5) and (k, 1). Labels
-            are 0-based.
+        tuple: (bboxes, labels, masks), tensors of shape (k, 5), (k, ) and
+            (k, ...). Labels are 0-based. The detections are ordered by class
+            and then by score, as with a per-class NMS loop.
     """
-    num_classes = multi_scores.shape[1]
-    bboxes, labels, masks = [], [], []
     nms_cfg_ = nms_cfg.copy()
     nms_type = nms_cfg_.pop('type', 'nms')
     nms_op = getattr(nms_wrapper, nms_type)
-    for i in range(1, num_classes):
-        cls_inds = multi_scores[:, i] > score_thr
-        if not cls_inds.any():
-            continue
-        # get bboxes and scores of this class
-        if multi_bboxes.shape[1] == 4:
-            _bboxes = multi_bboxes[cls_inds, :]
-            _masks = multi_masks[cls_inds, :]
-        else:
-            _bboxes = multi_bboxes[cls_inds, i * 4:(i + 1) * 4]
-        _scores = multi_scores[cls_inds, i]
-        if score_factors is not None:
-            _scores_with_centerness = _scores * score_factors[cls_inds]
-            cls_dets = torch.cat([_bboxes, _scores_with_centerness[:, None]], dim=1)
-        else:
-            cls_dets = torch.cat([_bboxes, _scores[:, None]], dim=1)
-        cls_dets, index = nms_op(cls_dets, **nms_cfg_)
-        # cls_dets[:, 4] = _scores[index]  #comment this to keep the scores with centerness
-        cls_masks = _masks[index]
-        cls_labels = multi_bboxes.new_full((cls_dets.shape[0],),
-                                           i - 1,
-                                           dtype=torch.long)
-        bboxes.append(cls_dets)
-        labels.append(cls_labels)
-        masks.append(cls_masks)
-    if bboxes:
-        bboxes = torch.cat(bboxes)
-        labels = torch.cat(labels)
-        masks = torch.cat(masks)
-        if bboxes.shape[0] > max_num:
-            _, inds = bboxes[:, -1].sort(descending=True)
-            inds = inds[:max_num]
-            bboxes = bboxes[inds]
-            labels = labels[inds]
-            masks = masks[inds]
-    else:
+    split_thr = nms_cfg_.pop('split_thr',
+                             10000 if multi_bboxes.is_cuda else 2000)
+
+    # candidates of all foreground classes, ordered by class
+    valid_mask = multi_scores[:, 1:] > score_thr
+    labels, inds = valid_mask.t().nonzero(as_tuple=True)
+    if inds.numel() == 0:
         bboxes = multi_bboxes.new_zeros((0, 5))
-        labels = multi_bboxes.new_zeros((0,), dtype=torch.long)
-        masks = multi_bboxes.new_zeros((0, 2, 36))
+        labels = multi_bboxes.new_zeros((0, ), dtype=torch.long)
+        masks = multi_masks.new_zeros((0, ) + multi_masks.shape[1:])
+        return bboxes, labels, masks
+
+    if multi_bboxes.shape[1] == 4:
+        bboxes = multi_bboxes[inds]
+    else:
+        bboxes = multi_bboxes.view(multi_bboxes.size(0), -1, 4)[inds,
+                                                                labels + 1]
+    scores = multi_scores[inds, labels + 1]
+    if score_factors is not None:
+        scores = scores * score_factors[inds]
+
+    if inds.numel() <= split_thr:
+        offsets = labels.to(bboxes) * (bboxes.max() + 1)
+        dets = torch.cat([bboxes + offsets[:, None], scores[:, None]], dim=1)
+        dets, keep = nms_op(dets, **nms_cfg_)
+    else:
+        dets = torch.cat([bboxes, scores[:, None]], dim=1)
+        counts = torch.unique_consecutive(labels, return_counts=True)[1]
+        cls_dets, keep, start = [], [], 0
+        for count in counts.tolist():
+            _dets, _keep = nms_op(dets[start:start + count], **nms_cfg_)
+            cls_dets.append(_dets)
+            keep.append(_keep + start)
+            start += count
+        dets = torch.cat(cls_dets)
+        keep = torch.cat(keep)
+    # restore the class-major order of the per-class loop, by score
+    # within every class
+    order = torch.sort(labels[keep], stable=True)[1]
+    keep = keep[order]
+    bboxes = torch.cat([bboxes[keep], dets[order, 4:]], dim=1)
+    labels = labels[keep]
+    masks = multi_masks[inds[keep]]
+
+    if max_num > 0 and bboxes.shape[0] > max_num:
+        _, topk = bboxes[:, -1].sort(descending=True)
+        topk = topk[:max_num]
+        bboxes = bboxes[topk]
+        labels = labels[topk]
+        masks = masks[topk]
 
     return bboxes, labels, masks
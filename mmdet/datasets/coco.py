@@ -9,7 +9,9 @@ from pycocotools.cocoeval import COCOeval
 
 from mmdet.core import eval_recalls
 from mmdet.utils import print_log
+from .contour_cache import ContourCache
 from .custom import CustomDataset
+from .pipelines import FormatContours
 from .registry import DATASETS
 
 
@@ -31,6 +33,34 @@ class CocoDataset(CustomDataset):
                'oven', 'toaster', 'sink', 'refrigerator', 'book', 'clock',
                'vase', 'scissors', 'teddy_bear', 'hair_drier', 'toothbrush')
 
+    def __init__(self, *args, contour_cache=None, **kwargs):
+        """
+        Args:
+            contour_cache (str, optional): directory of the contour cache
+                built by ``tools/cache_contours.py``. If set, the cached
+                contours, centers and max centerness of every instance are
+                added to the annotations, so that ``LoadAnnotations`` with
+                ``with_contour=True`` does not need to decode masks.
+        """
+        super(CocoDataset, self).__init__(*args, **kwargs)
+        if contour_cache is not None and self.data_root is not None and \
+                not osp.isabs(contour_cache):
+            contour_cache = osp.join(self.data_root, contour_cache)
+        self.contour_cache = ContourCache(
+            contour_cache) if contour_cache is not None else None
+        if self.contour_cache is not None:
+            # the cached max centerness only fits the same number of rays
+            cache_points = self.contour_cache.meta.get('contour_points')
+            for transform in self.pipeline.transforms:
+                if isinstance(transform, FormatContours) and \
+                        transform.contour_points is not None and \
+                        transform.contour_points != cache_points:
+                    raise ValueError(
+                        'the contour cache {} was built with {} contour '
+                        'points, but FormatContours uses {}'.format(
+                            contour_cache, cache_points,
+                            transform.contour_points))
+
     def load_annotations(self, ann_file):
         self.coco = COCO(ann_file)
         self.cat_ids = self.coco.getCatIds()
@@ -73,12 +103,14 @@ class CocoDataset(CustomDataset):
         Returns:
             dict: A dict containing the following keys: bboxes, bboxes_ignore,
                 labels, masks, seg_map. "masks" are raw annotations and not
-                decoded into binary masks.
+                decoded into binary masks. With a contour cache, "contours",
+                "contour_centers" and "max_centerness" are added as well.
         """
         gt_bboxes = []
         gt_labels = []
         gt_bboxes_ignore = []
         gt_masks_ann = []
+        gt_ann_ids = []
 
         for i, ann in enumerate(ann_info):
             if ann.get('ignore', False):
@@ -93,6 +125,7 @@ class CocoDataset(CustomDataset):
                 gt_bboxes.append(bbox)
                 gt_labels.append(self.cat2label[ann['category_id']])
                 gt_masks_ann.append(ann['segmentation'])
+                gt_ann_ids.append(ann['id'])
 
         if gt_bboxes:
             gt_bboxes = np.array(gt_bboxes, dtype=np.float32)
@@ -115,6 +148,16 @@ class CocoDataset(CustomDataset):
             masks=gt_masks_ann,
             seg_map=seg_map)
 
+        if self.contour_cache is not None:
+            contours, centers, max_centerness = self.contour_cache.get(
+                gt_ann_ids)
+            ann.update(
+                contours=contours,
+                contour_centers=centers,
+                max_centerness=max_centerness,
+                max_centerness_points=self.contour_cache.meta.get(
+                    'contour_points'))
+
         return ann
 
     def xyxy2xywh(self, bbox):
@@ -0,0 +1,107 @@
+import os.path as osp
+
+import mmcv
+import numpy as np
+
+
+class ContourCache(object):
+    """Read-only store of precomputed instance contours.
+
+    The cache is a directory of ``.npy`` files written by :meth:`dump`
+    (see ``tools/cache_contours.py``):
+
+    - ``ann_ids.npy``: sorted annotation ids, shape (n, ).
+    - ``offsets.npy``: contour offsets, shape (n + 1, ), the points of the
+      i-th annotation are ``points[offsets[i]:offsets[i + 1]]``.
+    - ``points.npy``: flat contour points, shape (num_points, 2), [x, y].
+    - ``centers.npy``: contour centroids, shape (n, 2), [x, y].
+    - ``max_centerness.npy``: polar centerness of the centroids, shape (n, ).
+    - ``meta.json``: the ann file and number of rays used to build the cache.
+
+    The arrays are memory-mapped lazily, so dataloader workers share the
+    page cache instead of holding private copies.
+
+    Args:
+        cache_dir (str): directory of the cache.
+    """
+
+    arrays = ('ann_ids', 'offsets', 'points', 'centers', 'max_centerness')
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.meta = mmcv.load(osp.join(cache_dir, 'meta.json'))
+        self._arrays = None
+
+    def __len__(self):
+        return len(self._load()['ann_ids'])
+
+    def __getstate__(self):
+        # memory maps are reopened in every worker
+        state = self.__dict__.copy()
+        state['_arrays'] = None
+        return state
+
+    def _load(self):
+        if self._arrays is None:
+            self._arrays = {
+                name: np.load(
+                    osp.join(self.cache_dir, name + '.npy'), mmap_mode='r')
+                for name in self.arrays
+            }
+        return self._arrays
+
+    def get(self, ann_ids):
+        """Look up the cached contours of some annotations.
+
+        Args:
+            ann_ids (list[int]): annotation ids.
+
+        Returns:
+            tuple: contours (list[ndarray] of shape (k_i, 2)), centers
+                (ndarray of shape (n, 2)) and max centerness (ndarray of
+                shape (n, )), all float32.
+        """
+        ann_ids = np.asarray(ann_ids, dtype=np.int64)
+        if len(ann_ids) == 0:
+            return [], np.zeros((0, 2), dtype=np.float32), np.zeros(
+                0, dtype=np.float32)
+        arrays = self._load()
+        cached_ids = arrays['ann_ids']
+        inds = np.searchsorted(cached_ids, ann_ids)
+        missing = (inds >= len(cached_ids)) | (
+            cached_ids[np.minimum(inds, len(cached_ids) - 1)] != ann_ids)
+        if missing.any():
+            raise KeyError('annotations {} are not in the contour cache {}'
+                           .format(ann_ids[missing].tolist(), self.cache_dir))
+        offsets = arrays['offsets']
+        contours = [
+            np.array(arrays['points'][offsets[i]:offsets[i + 1]])
+            for i in inds
+        ]
+        centers = np.array(arrays['centers'][inds]).reshape(-1, 2)
+        max_centerness = np.array(arrays['max_centerness'][inds])
+        return contours, centers, max_centerness
+
+    @staticmethod
+    def dump(cache_dir, ann_ids, contours, centers, max_centerness, **meta):
+        """Write a contour cache, the inverse of :meth:`get`."""
+        mmcv.mkdir_or_exist(cache_dir)
+        ann_ids = np.asarray(ann_ids, dtype=np.int64)
+        order = np.argsort(ann_ids, kind='stable')
+        contours = [
+            np.asarray(contours[i], dtype=np.float32).reshape(-1, 2)
+            for i in order
+        ]
+        lengths = [len(contour) for contour in contours]
+        arrays = dict(
+            ann_ids=ann_ids[order],
+            offsets=np.cumsum([0] + lengths, dtype=np.int64),
+            points=np.concatenate(contours) if contours else np.zeros(
+                (0, 2), dtype=np.float32),
+            centers=np.asarray(centers, dtype=np.float32).reshape(-1,
+                                                                  2)[order],
+            max_centerness=np.asarray(max_centerness,
+                                      dtype=np.float32)[order])
+        for name, array in arrays.items():
+            np.save(osp.join(cache_dir, name + '.npy'), array)
+        mmcv.dump(meta, osp.join(cache_dir, 'meta.json'))
@@ -70,7 +70,7 @@ def build_dataloader(dataset,
         batch_size=batch_size,
         sampler=sampler,
         num_workers=num_workers,
-        collate_fn=partial(collate, samples_per_gpu=imgs_per_gpu),
+        collate_fn=partial(collate_batch, samples_per_gpu=imgs_per_gpu),
         pin_memory=False,
         worker_init_fn=init_fn,
         **kwargs)
@@ -78,6 +78,11 @@ def build_dataloader(dataset,
     return data_loader
 
 
+def collate_batch(batch, samples_per_gpu=1):
+    """Collate a batch, the last test batch may hold fewer samples."""
+    return collate(batch, samples_per_gpu=min(samples_per_gpu, len(batch)))
+
+
 def worker_init_fn(worker_id, num_workers, rank, seed):
     # The seed of each worker equals to
     # num_worker * rank + worker_id + user_seed
@@ -7,12 +7,14 @@ from .test_aug import MultiScaleFlipAug
 from .transforms import (Albu, Expand, MinIoURandomCrop, Normalize, Pad,
                          PhotoMetricDistortion, RandomCrop, RandomFlip, Resize,
                          SegRescale)
-from .contour import ConvertToContour
+from .contour import ConvertToContour, FormatContours, PackContours
+from .polar_target import PolarTarget
 
 __all__ = [
     'Compose', 'to_tensor', 'ToTensor', 'ImageToTensor', 'ToDataContainer',
     'Transpose', 'Collect', 'LoadAnnotations', 'LoadImageFromFile',
     'LoadProposals', 'MultiScaleFlipAug', 'Resize', 'RandomFlip', 'Pad',
     'RandomCrop', 'Normalize', 'SegRescale', 'MinIoURandomCrop', 'Expand',
-    'PhotoMetricDistortion', 'Albu', 'InstaBoost', 'ConvertToContour'
+    'PhotoMetricDistortion', 'Albu', 'InstaBoost', 'ConvertToContour',
+    'FormatContours', 'PackContours', 'PolarTarget'
 ]
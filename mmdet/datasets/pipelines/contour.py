@@ -5,8 +5,19 @@ import numpy as np
 import torch
 from mmdet.utils import print_log
 
+_MAX_SEARCH_OFFSET = 3
+# degrees searched for every ray, nearest first
+_SEARCH_ORDER = np.array([0, 1, -1, 2, -2, 3, -3])
+
 
 def get_polar_coordinates(c_x, c_y, pos_mask_contour, n=72):
+    """Polar distances of a contour seen from (c_x, c_y).
+
+    The contour points are binned into integer degrees keeping the farthest
+    point of every degree, then each of the ``n`` rays takes the nearest
+    non-empty degree within 3 degrees, searched in the order 0, +1, -1, +2,
+    -2, +3, -3. Rays without any contour point get 1e-6.
+    """
     if len(pos_mask_contour.shape) == 2:
         ct = pos_mask_contour
     else:
@@ -17,44 +28,19 @@ def get_polar_coordinates(c_x, c_y, pos_mask_contour, n=72):
     angle[angle < 0] += 360
     angle = angle.astype('int')
     dist = np.sqrt(x ** 2 + y ** 2)
-    idx = np.argsort(angle)
-    angle = angle[idx]
-    dist = dist[idx]
+
+    # max distance per integer degree, padded by 3 degrees on both sides
+    degree_dist = np.full(361 + 2 * _MAX_SEARCH_OFFSET, -1.0)
+    np.maximum.at(degree_dist, angle + _MAX_SEARCH_OFFSET, dist)
 
     interval = 360 // n
-    new_coordinate = {}
-    for i in range(0, 360, interval):
-        if i in angle:
-            d = dist[angle == i].max()
-            new_coordinate[i] = d
-        elif i + 1 in angle:
-            d = dist[angle == i + 1].max()
-            new_coordinate[i] = d
-        elif i - 1 in angle:
-            d = dist[angle == i - 1].max()
-            new_coordinate[i] = d
-        elif i + 2 in angle:
-            d = dist[angle == i + 2].max()
-            new_coordinate[i] = d
-        elif i - 2 in angle:
-            d = dist[angle == i - 2].max()
-            new_coordinate[i] = d
-        elif i + 3 in angle:
-            d = dist[angle == i + 3].max()
-            new_coordinate[i] = d
-        elif i - 3 in angle:
-            d = dist[angle == i - 3].max()
-            new_coordinate[i] = d
-
-    distances = np.zeros(n)
-
-    for a in range(0, 360, interval):
-        if not a in new_coordinate.keys():
-            new_coordinate[a] = 1e-6
-            distances[a // interval] = 1e-6
-        else:
-            distances[a // interval] = new_coordinate[a]
+    bins = np.arange(0, 360, interval)
+    candidates = degree_dist[bins[:, None] + _SEARCH_ORDER[None, :] + _MAX_SEARCH_OFFSET]
+    found = candidates >= 0
+    distances = candidates[np.arange(len(bins)), found.argmax(axis=1)]
+    distances[~found.any(axis=1)] = 1e-6
 
+    new_coordinate = dict(zip(bins.tolist(), distances))
     return distances, new_coordinate
 
 
@@ -66,28 +52,59 @@ def polar_centerness_target(pos_mask_targets, max_centerness=None):
 
 
 def get_centerpoint(lis):
-    area = 0.0
-    x, y = 0.0, 0.0
-    a = len(lis)
-    for i in range(a):
-        lat = lis[i][0]
-        lng = lis[i][1]
-        if i == 0:
-            lat1 = lis[-1][0]
-            lng1 = lis[-1][1]
-        else:
-            lat1 = lis[i - 1][0]
-            lng1 = lis[i - 1][1]
-        fg = (lat * lng1 - lng * lat1) / 2.0
-        area += fg
-        x += fg * (lat + lat1) / 3.0
-        y += fg * (lng + lng1) / 3.0
-    x = x / area
-    y = y / area
+    """Centroid of a polygon with the shoelace formula.
+
+    Raises:
+        ArithmeticError: if the polygon has no area.
+    """
+    lis = np.asarray(lis, dtype=np.float64)
+    prev = np.roll(lis, 1, axis=0)
+    fg = (lis[:, 0] * prev[:, 1] - lis[:, 1] * prev[:, 0]) / 2.0
+    area = fg.sum()
+    if area == 0:
+        raise ZeroDivisionError('the contour has no area')
+    x = (fg * (lis[:, 0] + prev[:, 0])).sum() / 3.0 / area
+    y = (fg * (lis[:, 1] + prev[:, 1])).sum() / 3.0 / area
 
     return [int(x), int(y)]
 
 
+def get_contour_center(contour):
+    """Centroid of a contour, the mean point if it has no area."""
+    try:
+        return get_centerpoint(contour)
+    except (ArithmeticError, ValueError):
+        x, y = contour.mean(axis=0)
+        return [int(x), int(y)]
+
+
+def densify_polygon(polygon):
+    """Resample a closed polygon with at most one pixel between points.
+
+    Polygon annotations only hold the vertices, which leave most rays of the
+    polar encoding empty. The edges are interpolated so that the points are
+    as dense as a pixel contour of the rasterised mask.
+
+    Args:
+        polygon (list | ndarray): flat [x1, y1, x2, y2, ...] vertices.
+
+    Returns:
+        ndarray: contour points of shape (k, 2), float32.
+    """
+    points = np.asarray(polygon, dtype=np.float32).reshape(-1, 2)
+    if len(points) == 0:
+        return points
+    next_points = np.roll(points, -1, axis=0)
+    lengths = np.ceil(np.linalg.norm(next_points - points, axis=1))
+    lengths = np.maximum(lengths, 1).astype(np.int64)
+    starts = np.cumsum(lengths) - lengths
+    t = np.arange(lengths.sum()) - np.repeat(starts, lengths)
+    t = (t / np.repeat(lengths, lengths)).astype(np.float32)[:, None]
+    start_points = np.repeat(points, lengths, axis=0)
+    end_points = np.repeat(next_points, lengths, axis=0)
+    return start_points + (end_points - start_points) * t
+
+
 @PIPELINES.register_module
 class ConvertToContour(object):
     """Converts the mask from a binary grid representation into boundary contour points,
@@ -140,8 +157,8 @@ class ConvertToContour(object):
     def get_contour(self, mask):
         contour, _ = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)
         if self.use_max_only:
-
-            contour.sort(key=lambda cx: cv2.contourArea(cx), reverse=True)
+            # recent OpenCV versions return the contours as a tuple
+            contour = sorted(contour, key=cv2.contourArea, reverse=True)
             try:
                 # only save the contour with the largest area
                 count = contour[0][:, 0, :]
@@ -152,11 +169,7 @@ class ConvertToContour(object):
             count = np.concatenate(contour)[:, 0, :]
 
         # Calculate the center point
-        try:
-            center = get_centerpoint(count)
-        except (ArithmeticError, ValueError):
-            x, y = count.mean(axis=0)
-            center = [int(x), int(y)]
+        center = get_contour_center(count)
 
         if self.return_centerness:
             points, _ = get_polar_coordinates(center[0], center[1], count, self.contour_points)
@@ -164,3 +177,108 @@ class ConvertToContour(object):
             return center, contour, centernes
         else:
             return center, contour
+
+
+@PIPELINES.register_module
+class FormatContours(object):
+    """Converts the ``gt_contours`` field into the targets of ConvertToContour.
+
+    This is the counterpart of :class:`ConvertToContour` for pipelines that
+    load contours instead of binary masks (``LoadAnnotations`` with
+    ``with_contour=True``). The contours have already been resized, flipped
+    and cropped as point arrays, so no mask is rasterised. The outputs have
+    the same layout: ``gt_masks`` holds the contour points of every instance,
+    ``gt_centers`` the [y, x] centers and ``gt_max_centerness`` the
+    centerness of the centers.
+
+    Centers and max centerness loaded from a contour cache are kept, missing
+    ones are computed from the transformed contours like ConvertToContour.
+    Cached max centerness computed with another number of rays
+    (``max_centerness_points``) raises a ValueError.
+
+    Args:
+        contour_points (int, optional): Number of contour point used when
+            calculating the centerness, required if it is not cached.
+    """
+
+    def __init__(self, contour_points=None):
+        self.contour_points = contour_points
+
+    def __call__(self, results):
+        contours = results['gt_contours']
+        # instances without contour are skipped as in ConvertToContour
+        if any(len(contour) == 0 for contour in contours):
+            return None
+        results['gt_masks'] = [
+            torch.from_numpy(np.ascontiguousarray(contour))
+            for contour in contours
+        ]
+        if 'gt_contour_centers' in results:
+            centers = np.asarray(results['gt_contour_centers'])
+        else:
+            centers = np.array(
+                [get_contour_center(contour) for contour in contours])
+        centers = centers.reshape(-1, 2)
+        results['gt_centers'] = centers[:, ::-1].tolist()
+        cache_points = results.get('max_centerness_points')
+        if cache_points is not None and self.contour_points is not None and \
+                cache_points != self.contour_points:
+            raise ValueError(
+                'the max centerness was cached with {} contour points, but '
+                'FormatContours uses {}'.format(cache_points,
+                                                self.contour_points))
+        if 'gt_max_centerness' not in results and \
+                self.contour_points is not None:
+            results['gt_max_centerness'] = [
+                polar_centerness_target(
+                    get_polar_coordinates(c_x, c_y, contour,
+                                          self.contour_points)[0])
+                for (c_x, c_y), contour in zip(centers, contours)
+            ]
+        return results
+
+    def __repr__(self):
+        return self.__class__.__name__ + '(contour_points={})'.format(
+            self.contour_points)
+
+
+@PIPELINES.register_module
+class PackContours(object):
+    """Packs the contours of ``gt_masks`` into one flat point array.
+
+    ``gt_contour_points`` holds the points of all instances as a tensor of
+    shape (2, num_points) and ``gt_contour_offsets`` the offsets of shape
+    (1, num_instances + 1), so that the points of instance i are
+    ``gt_contour_points[:, offsets[0, i]:offsets[0, i + 1]]``. Both are 2D so
+    that ``ToDataContainer`` with ``stack=True, pad_dims=1`` collates each
+    field of a batch into a single padded tensor, which is copied to the GPU
+    at once.
+
+    Args:
+        keep_masks (bool): keep the list of contours in ``gt_masks``.
+    """
+
+    def __init__(self, keep_masks=False):
+        self.keep_masks = keep_masks
+
+    def __call__(self, results):
+        contours = [
+            np.asarray(contour).reshape(-1, 2)
+            for contour in results['gt_masks']
+        ]
+        lengths = [len(contour) for contour in contours]
+        if len(contours) > 0:
+            points = np.concatenate(contours)
+        else:
+            points = np.zeros((0, 2), dtype=np.float32)
+        results['gt_contour_points'] = torch.from_numpy(
+            np.ascontiguousarray(points.T))
+        results['gt_contour_offsets'] = torch.from_numpy(
+            np.cumsum([0] + lengths, dtype=np.int64)[None])
+        if not self.keep_masks:
+            results.pop('gt_masks')
+        return results
+
+    def __repr__(self):
+        return self.__class__.__name__ + '(keep_masks={})'.format(
+            self.keep_masks)
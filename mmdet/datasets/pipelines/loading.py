@@ -1,10 +1,12 @@
 import os.path as osp
 
+import cv2
 import mmcv
 import numpy as np
 import pycocotools.mask as maskUtils
 
 from ..registry import PIPELINES
+from .contour import densify_polygon
 
 
 @PIPELINES.register_module
@@ -42,11 +44,13 @@ class LoadAnnotations(object):
                  with_label=True,
                  with_mask=False,
                  with_seg=False,
-                 poly2mask=True):
+                 poly2mask=True,
+                 with_contour=False):
         self.with_bbox = with_bbox
         self.with_label = with_label
         self.with_mask = with_mask
         self.with_seg = with_seg
+        self.with_contour = with_contour
         self.poly2mask = poly2mask
 
     def _load_bboxes(self, results):
@@ -88,6 +92,43 @@ class LoadAnnotations(object):
         results['mask_fields'].append('gt_masks')
         return results
 
+    def _poly2contour(self, mask_ann, img_h, img_w):
+        if isinstance(mask_ann, list):
+            # polygon -- only the part with the largest area is kept
+            polygons = [
+                densify_polygon(polygon) for polygon in mask_ann
+                if len(polygon) >= 6
+            ]
+        else:
+            # rle -- decode the mask of this instance only
+            mask = self._poly2mask(mask_ann, img_h, img_w)
+            polygons, _ = cv2.findContours(mask, cv2.RETR_TREE,
+                                           cv2.CHAIN_APPROX_NONE)
+            polygons = [
+                polygon[:, 0, :].astype(np.float32) for polygon in polygons
+            ]
+        if not polygons:
+            return np.zeros((0, 2), dtype=np.float32)
+        return max(polygons, key=cv2.contourArea)
+
+    def _load_contours(self, results):
+        ann_info = results['ann_info']
+        if 'contours' in ann_info:
+            # precomputed by tools/cache_contours.py
+            results['gt_contours'] = ann_info['contours']
+            results['gt_contour_centers'] = ann_info['contour_centers']
+            results['gt_max_centerness'] = ann_info['max_centerness']
+            results['max_centerness_points'] = ann_info.get(
+                'max_centerness_points')
+            results['contour_fields'] += ['gt_contours', 'gt_contour_centers']
+            return results
+        h, w = results['img_info']['height'], results['img_info']['width']
+        results['gt_contours'] = [
+            self._poly2contour(mask, h, w) for mask in ann_info['masks']
+        ]
+        results['contour_fields'].append('gt_contours')
+        return results
+
     def _load_semantic_seg(self, results):
         results['gt_semantic_seg'] = mmcv.imread(
             osp.join(results['seg_prefix'], results['ann_info']['seg_map']),
@@ -104,6 +145,8 @@ class LoadAnnotations(object):
             results = self._load_labels(results)
         if self.with_mask:
             results = self._load_masks(results)
+        if self.with_contour:
+            results = self._load_contours(results)
         if self.with_seg:
             results = self._load_semantic_seg(results)
         return results
@@ -111,8 +154,9 @@ class LoadAnnotations(object):
     def __repr__(self):
         repr_str = self.__class__.__name__
         repr_str += ('(with_bbox={}, with_label={}, with_mask={},'
-                     ' with_seg={})').format(self.with_bbox, self.with_label,
-                                             self.with_mask, self.with_seg)
+                     ' with_seg={}, with_contour={})').format(
+                         self.with_bbox, self.with_label, self.with_mask,
+                         self.with_seg, self.with_contour)
         return repr_str
 
 
@@ -0,0 +1,247 @@
+import numpy as np
+import torch
+
+from ..registry import PIPELINES
+
+INF = 1e8
+# rows of the ``gt_polar_targets`` of every positive location, followed by
+# the polar distances
+POLAR_TARGET_ROWS = ('level', 'y', 'x', 'label', 'left', 'top', 'right',
+                     'bottom', 'centerness')
+
+
+def get_points_single(featmap_size, stride):
+    """NumPy version of the point grid of ``FourierNetHead``, float32 [x, y]
+    in row-major order."""
+    h, w = featmap_size
+    x_range = np.arange(0, w * stride, stride, dtype=np.float32)
+    y_range = np.arange(0, h * stride, stride, dtype=np.float32)
+    y, x = np.meshgrid(y_range, x_range, indexing='ij')
+    return np.stack((x.reshape(-1), y.reshape(-1)), axis=-1) + stride // 2
+
+
+def get_polar_coordinates_batch(centers, contours, contour_offsets,
+                                contour_inds, n=72):
+    """NumPy version of the vectorized polar encoding of the head, see
+    ``mmdet.models.anchor_heads.fouriernet_head.get_polar_coordinates_batch``.
+    """
+    num_pos = len(centers)
+    interval = 360 // n
+    if num_pos == 0:
+        return np.zeros((0, n), dtype=np.float32)
+
+    # expand every positive location to all points of its contour
+    starts = contour_offsets[contour_inds]
+    counts = contour_offsets[contour_inds + 1] - starts
+    pair_inds = np.repeat(np.arange(num_pos), counts)
+    pair_starts = np.repeat(np.cumsum(counts) - counts, counts)
+    local_inds = np.arange(len(pair_inds)) - pair_starts
+    ct = contours[np.repeat(starts, counts) + local_inds]
+
+    x = ct[:, 0] - centers[pair_inds, 0]
+    y = ct[:, 1] - centers[pair_inds, 1]
+    angle = np.arctan2(x, y) * 180 / np.float32(np.pi)
+    angle[angle < 0] += 360
+    angle = angle.astype(np.int64)
+    dist = np.sqrt(x**2 + y**2)
+
+    # max distance per integer degree, padded by 3 degrees on both sides
+    max_offset = 3
+    num_degrees = 361 + 2 * max_offset
+    degree_dist = np.full(num_pos * num_degrees, -1, dtype=np.float32)
+    np.maximum.at(degree_dist, pair_inds * num_degrees + angle + max_offset,
+                  dist)
+    degree_dist = degree_dist.reshape(num_pos, num_degrees)
+
+    bins = np.arange(0, 360, interval)
+    search_order = np.array([0, 1, -1, 2, -2, 3, -3])
+    candidates = degree_dist[:, bins[:, None] + search_order[None, :] +
+                             max_offset]
+    found = candidates >= 0
+    first_found = found.argmax(axis=-1)[..., None]
+    distances = np.take_along_axis(candidates, first_found, -1)[..., 0]
+    return np.where(found.any(axis=-1), distances,
+                    np.float32(1e-6)).astype(np.float32)
+
+
+def polar_centerness_target_batch(pos_mask_targets, max_centerness=None):
+    """NumPy version of the centerness targets of the head."""
+    centerness_targets = np.sqrt(
+        pos_mask_targets.min(axis=1, initial=INF) /
+        pos_mask_targets.max(axis=1, initial=0))
+    if max_centerness is not None:
+        centerness_targets = np.where(max_centerness != 0,
+                                      centerness_targets / max_centerness,
+                                      centerness_targets)
+    return np.minimum(centerness_targets, np.float32(1.0))
+
+
+@PIPELINES.register_module
+class PolarTarget(object):
+    """Computes the FourierNet targets in the data loader workers.
+
+    The instances are assigned to the points of every FPN level of the
+    padded image exactly as ``FourierNetHead.polar_target`` does, and the
+    targets of the positive locations are stored in ``gt_polar_targets``,
+    a float32 tensor of shape (len(POLAR_TARGET_ROWS) + contour_points,
+    num_pos): the level, row, column and label of every positive location,
+    its box and centerness targets and its polar distances. All other
+    locations are negatives. Wrapped by ``ToDataContainer`` with
+    ``stack=True, pad_dims=1`` the targets of a batch collate into one
+    tensor, the padded columns have label 0 and are skipped, and
+    ``FourierNetHead.loss`` does not call ``polar_target``.
+
+    It must run after ``Pad`` with a size divisor of the largest stride
+    before the ones made by strided convolutions (32 for the FPN configs),
+    so that the levels of the image are the top left corner of the levels
+    of any padded batch. The arguments must match the ones of the head.
+
+    Args:
+        strides (Sequence[int]): strides of the levels.
+        regress_ranges (Sequence[tuple]): regress range of every level.
+        contour_points (int): number of rays.
+        center_sample (bool): only sample the points near the centers.
+        use_mask_center (bool): sample around the contour centers
+            (``gt_centers``) instead of the box centers.
+        radius (float): radius of the sample region in strides.
+        normalized_centerness (bool): divide the centerness targets by
+            ``gt_max_centerness``.
+    """
+
+    def __init__(self,
+                 strides=(4, 8, 16, 32, 64),
+                 regress_ranges=((-1, 64), (64, 128), (128, 256), (256, 512),
+                                 (512, INF)),
+                 contour_points=360,
+                 center_sample=True,
+                 use_mask_center=True,
+                 radius=1.5,
+                 normalized_centerness=False):
+        assert len(strides) == len(regress_ranges)
+        self.strides = strides
+        self.regress_ranges = regress_ranges
+        self.contour_points = contour_points
+        self.center_sample = center_sample
+        self.use_mask_center = use_mask_center
+        self.radius = radius
+        self.normalized_centerness = normalized_centerness
+
+    def __call__(self, results):
+        gt_bboxes = np.asarray(results['gt_bboxes'], dtype=np.float32)
+        gt_labels = np.asarray(results['gt_labels'])
+        contours = [
+            np.asarray(contour, dtype=np.float32).reshape(-1, 2)
+            for contour in results['gt_masks']
+        ]
+        if self.use_mask_center:
+            mask_centers = np.asarray(
+                results['gt_centers'], dtype=np.float32).reshape(-1, 2)
+        else:
+            # sample around the box centers
+            mask_centers = np.stack([(gt_bboxes[:, 1] + gt_bboxes[:, 3]) / 2,
+                                     (gt_bboxes[:, 0] + gt_bboxes[:, 2]) / 2],
+                                    -1)
+        pad_h, pad_w = results['pad_shape'][:2]
+
+        # Area of all bounding boxes
+        areas = (gt_bboxes[:, 2] - gt_bboxes[:, 0] + 1) * \
+            (gt_bboxes[:, 3] - gt_bboxes[:, 1] + 1)
+        # the largest distance from a point inside a box to its sides is
+        # between half and all of its longest side
+        max_sides = np.maximum(gt_bboxes[:, 2] - gt_bboxes[:, 0],
+                               gt_bboxes[:, 3] - gt_bboxes[:, 1])
+        pos_levels, pos_rows, pos_cols = [], [], []
+        pos_points = [np.zeros((0, 2), dtype=np.float32)]
+        pos_gt_inds = [np.zeros(0, dtype=np.int64)]
+        for level, (stride, (range_min, range_max)) in enumerate(
+                zip(self.strides, self.regress_ranges)):
+            gt_inds = np.nonzero((max_sides >= range_min)
+                                 & (max_sides / 2 <= range_max + 1))[0]
+            if len(gt_inds) == 0:
+                continue
+            h, w = int(np.ceil(pad_h / stride)), int(np.ceil(pad_w / stride))
+            points = get_points_single((h, w), stride)
+            min_area, inds = self.assign_points(points, stride, range_min,
+                                                range_max, gt_bboxes[gt_inds],
+                                                mask_centers[gt_inds],
+                                                areas[gt_inds])
+            point_inds = np.nonzero(min_area != INF)[0]
+            pos_levels.append(np.full(len(point_inds), level))
+            pos_rows.append(point_inds // w)
+            pos_cols.append(point_inds % w)
+            pos_points.append(points[point_inds])
+            pos_gt_inds.append(gt_inds[inds[point_inds]])
+
+        pos_points = np.concatenate(pos_points)
+        pos_gt_inds = np.concatenate(pos_gt_inds)
+        pos_bboxes = gt_bboxes[pos_gt_inds]
+        xs, ys = pos_points[:, 0], pos_points[:, 1]
+        bbox_targets = np.stack([
+            xs - pos_bboxes[:, 0], ys - pos_bboxes[:, 1],
+            pos_bboxes[:, 2] - xs, pos_bboxes[:, 3] - ys
+        ])
+        contour_offsets = np.cumsum([0] + [len(c) for c in contours])
+        dists = get_polar_coordinates_batch(
+            pos_points,
+            np.concatenate(contours) if contours else np.zeros(
+                (0, 2), dtype=np.float32), contour_offsets, pos_gt_inds,
+            self.contour_points)
+        if self.normalized_centerness:
+            max_centerness = np.asarray(results['gt_max_centerness'])
+            max_centerness = max_centerness.astype(np.float32)[pos_gt_inds]
+        else:
+            max_centerness = None
+        centerness_targets = polar_centerness_target_batch(
+            dists, max_centerness)
+
+        locations = np.stack([
+            np.concatenate(pos_levels + [[]]),
+            np.concatenate(pos_rows + [[]]),
+            np.concatenate(pos_cols + [[]]), gt_labels[pos_gt_inds]
+        ])
+        results['gt_polar_targets'] = torch.from_numpy(
+            np.concatenate([
+                locations.astype(np.float32), bbox_targets,
+                centerness_targets[None], dists.T
+            ]))
+        return results
+
+    def assign_points(self, points, stride, range_min, range_max, gt_bboxes,
+                      mask_centers, areas):
+        """NumPy version of ``FourierNetHead.assign_points`` for the points
+        of one level."""
+        xs, ys = points[:, 0, None], points[:, 1, None]
+        left = xs - gt_bboxes[:, 0]
+        right = gt_bboxes[:, 2] - xs
+        top = ys - gt_bboxes[:, 1]
+        bottom = gt_bboxes[:, 3] - ys
+
+        if self.center_sample:
+            radius = np.float32(stride * self.radius)
+            center_y, center_x = mask_centers[:, 0], mask_centers[:, 1]
+            inside = xs > np.maximum(center_x - radius, gt_bboxes[:, 0])
+            inside &= ys > np.maximum(center_y - radius, gt_bboxes[:, 1])
+            inside &= xs < np.minimum(center_x + radius, gt_bboxes[:, 2])
+            inside &= ys < np.minimum(center_y + radius, gt_bboxes[:, 3])
+        else:
+            inside = (left > 0) & (top > 0) & (right > 0) & (bottom > 0)
+
+        max_regress_distance = np.maximum(
+            np.maximum(left, top), np.maximum(right, bottom))
+        inside &= (max_regress_distance >= np.float32(range_min)) & (
+            max_regress_distance <= np.float32(range_max))
+
+        areas = np.where(inside, areas, np.float32(INF))
+        inds = areas.argmin(axis=1)
+        return areas[np.arange(len(inds)), inds], inds
+
+    def __repr__(self):
+        repr_str = self.__class__.__name__
+        repr_str += ('(strides={}, regress_ranges={}, contour_points={}, '
+                     'center_sample={}, use_mask_center={}, radius={}, '
+                     'normalized_centerness={})').format(
+                         self.strides, self.regress_ranges,
+                         self.contour_points, self.center_sample,
+                         self.use_mask_center, self.radius,
+                         self.normalized_centerness)
+        return repr_str
@@ -20,14 +20,28 @@ except ImportError:
     Compose = None
 
 
+def _map_points(points, func):
+    """Apply ``func`` to a point array or to every array of a list."""
+    if isinstance(points, list):
+        return [func(p) for p in points]
+    return func(points)
+
+
+def _take_instances(values, inds):
+    """Index per-instance values stored in a list or an array."""
+    if isinstance(values, list):
+        return [values[i] for i in inds]
+    return values[inds]
+
+
 @PIPELINES.register_module
 class Resize(object):
-    """Resize images & bbox & mask.
+    """Resize images & bbox & mask & contour.
 
-    This transform resizes the input image to some scale. Bboxes and masks are
-    then resized with the same scale factor. If the input dict contains the key
-    "scale", then the scale in the input dict is used, otherwise the specified
-    scale in the init method is used.
+    This transform resizes the input image to some scale. Bboxes, masks and
+    contours are then resized with the same scale factor. If the input dict
+    contains the key "scale", then the scale in the input dict is used,
+    otherwise the specified scale in the init method is used.
 
     `img_scale` can either be a tuple (single-scale) or a list of tuple
     (multi-scale). There are 3 multiscale modes:
@@ -158,6 +172,19 @@ class Resize(object):
                 ]
             results[key] = np.stack(masks)
 
+    def _resize_contours(self, results):
+        img_shape = results['img_shape']
+        scale_factor = np.asarray(results['scale_factor'], dtype=np.float32)
+        scale_factor = np.broadcast_to(scale_factor.reshape(-1), (4, ))[:2]
+        max_point = np.array([img_shape[1] - 1, img_shape[0] - 1],
+                             dtype=np.float32)
+
+        def resize(points):
+            return np.clip(points * scale_factor, 0, max_point)
+
+        for key in results.get('contour_fields', []):
+            results[key] = _map_points(results[key], resize)
+
     def _resize_seg(self, results):
         for key in results.get('seg_fields', []):
             if self.keep_ratio:
@@ -174,6 +201,7 @@ class Resize(object):
         self._resize_img(results)
         self._resize_bboxes(results)
         self._resize_masks(results)
+        self._resize_contours(results)
         self._resize_seg(results)
         return results
 
@@ -189,7 +217,7 @@ class Resize(object):
 
 @PIPELINES.register_module
 class RandomFlip(object):
-    """Flip the image & bbox & mask.
+    """Flip the image & bbox & mask & contour.
 
     If the input dict contains the key "flip", then the flag will be used,
     otherwise it will be randomly decided by a ratio specified in the init
@@ -228,6 +256,23 @@ class RandomFlip(object):
                 'Invalid flipping direction "{}"'.format(direction))
         return flipped
 
+    def contour_flip(self, points, img_shape, direction):
+        """Flip [x, y] points horizontally or vertically.
+
+        Args:
+            points(ndarray): shape (..., 2)
+            img_shape(tuple): (height, width)
+        """
+        flipped = points.copy()
+        if direction == 'horizontal':
+            flipped[..., 0] = img_shape[1] - points[..., 0] - 1
+        elif direction == 'vertical':
+            flipped[..., 1] = img_shape[0] - points[..., 1] - 1
+        else:
+            raise ValueError(
+                'Invalid flipping direction "{}"'.format(direction))
+        return flipped
+
     def __call__(self, results):
         if 'flip' not in results:
             flip = True if np.random.rand() < self.flip_ratio else False
@@ -249,6 +294,12 @@ class RandomFlip(object):
                     mmcv.imflip(mask, direction=results['flip_direction'])
                     for mask in results[key]
                 ])
+            # flip contours
+            for key in results.get('contour_fields', []):
+                results[key] = _map_points(
+                    results[key], lambda points: self.contour_flip(
+                        points, results['img_shape'],
+                        results['flip_direction']))
 
             # flip segs
             for key in results.get('seg_fields', []):
@@ -268,6 +319,9 @@ class Pad(object):
     There are two padding modes: (1) pad to a fixed size and (2) pad to the
     minimum size that is divisible by some number.
 
+    The padding is added at the bottom right, so bboxes and contours keep
+    their coordinates.
+
     Args:
         size (tuple, optional): Fixed padding size.
         size_divisor (int, optional): The divisor of padded size.
@@ -354,7 +408,7 @@ class Normalize(object):
 
 @PIPELINES.register_module
 class RandomCrop(object):
-    """Random crop the image & bboxes & masks.
+    """Random crop the image & bboxes & masks & contours.
 
     Args:
         crop_size (tuple): Expected size after cropping, (h, w).
@@ -387,6 +441,15 @@ class RandomCrop(object):
             bboxes[:, 1::2] = np.clip(bboxes[:, 1::2], 0, img_shape[0] - 1)
             results[key] = bboxes
 
+        # crop contours accordingly and clip to the image boundary
+        point_offset = np.array([offset_w, offset_h], dtype=np.float32)
+        max_point = np.array([img_shape[1] - 1, img_shape[0] - 1],
+                             dtype=np.float32)
+        for key in results.get('contour_fields', []):
+            results[key] = _map_points(
+                results[key],
+                lambda points: np.clip(points - point_offset, 0, max_point))
+
         # crop semantic seg
         for key in results.get('seg_fields', []):
             results[key] = results[key][crop_y1:crop_y2, crop_x1:crop_x2]
@@ -412,6 +475,14 @@ class RandomCrop(object):
                     valid_gt_masks.append(gt_mask)
                 results['gt_masks'] = np.stack(valid_gt_masks)
 
+            # filter the contours, which are already cropped
+            valid_inds = np.where(valid_inds)[0]
+            for key in results.get('contour_fields', []):
+                results[key] = _take_instances(results[key], valid_inds)
+            if 'gt_max_centerness' in results:
+                results['gt_max_centerness'] = _take_instances(
+                    results['gt_max_centerness'], valid_inds)
+
         return results
 
     def __repr__(self):
@@ -1,52 +1,59 @@
+from collections import OrderedDict, namedtuple
+
 import torch
 import torch.nn as nn
 from mmcv.cnn import normal_init
 from torch import Tensor
 import numpy as np
 
-from mmdet.core import distance2bbox, force_fp32, multi_apply, multiclass_nms_with_mask
+from mmdet.core import (bbox_mapping_back, distance2bbox, force_fp32,
+                        multi_apply, multiclass_nms_with_mask)
 from mmdet.ops import ModulatedDeformConvPack
 
 from ..builder import build_loss
 from ..registry import HEADS
-from ..utils import ConvModule, Scale, bias_init_with_prob, build_norm_layer
-import math
+from ..utils import (ConvModule, FourierContourDecoder, FourierMatmulDecoder,
+                     Scale, bias_init_with_prob, build_norm_layer,
+                     distance2fourier)
 
 INF = 1e8
 
 
-def get_mask_sample_region(gt_bb, mask_center, strides, num_points_per, gt_xs, gt_ys, radius=1.0):
-    # This function checks if a feature pixel is near the center of an instance
-    # returns true or false for every pixel and object size 204600 * 8
-    center_y = mask_center[..., 0]
-    center_x = mask_center[..., 1]
-    center_gt = gt_bb.new_zeros(gt_bb.shape)
-    # no gt
-    if center_x[..., 0].sum() == 0:
-        return gt_xs.new_zeros(gt_xs.shape, dtype=torch.uint8)
-
-    beg = 0
-    for level, n_p in enumerate(num_points_per):
-        end = beg + n_p  # setting where to stop for each head
-        stride = strides[level] * radius
-        xmin = center_x[beg:end] - stride
-        ymin = center_y[beg:end] - stride
-        xmax = center_x[beg:end] + stride
-        ymax = center_y[beg:end] + stride
-        # limit sample region in gt
-        center_gt[beg:end, :, 0] = torch.where(xmin > gt_bb[beg:end, :, 0], xmin, gt_bb[beg:end, :, 0])
-        center_gt[beg:end, :, 1] = torch.where(ymin > gt_bb[beg:end, :, 1], ymin, gt_bb[beg:end, :, 1])
-        center_gt[beg:end, :, 2] = torch.where(xmax > gt_bb[beg:end, :, 2], gt_bb[beg:end, :, 2], xmax)
-        center_gt[beg:end, :, 3] = torch.where(ymax > gt_bb[beg:end, :, 3], gt_bb[beg:end, :, 3], ymax)
-        beg = end
-
-    left = gt_xs - center_gt[..., 0]
-    right = center_gt[..., 2] - gt_xs
-    top = gt_ys - center_gt[..., 1]
-    bottom = center_gt[..., 3] - gt_ys
-    center_bbox = torch.stack((left, top, right, bottom), -1)
-    inside_gt_bbox_mask = center_bbox.min(-1)[0] > 0  # 上下左右都>0 就是在bbox里面
-    return inside_gt_bbox_mask
+def get_mask_sample_region(gt_bboxes,
+                           mask_centers,
+                           point_strides,
+                           xs,
+                           ys,
+                           radius=1.0):
+    """Check which points are near the center of every instance.
+
+    The sample region of a point is a square of ``radius`` times its stride
+    around the center, clipped to the box of the instance. It is computed
+    by broadcasting the per point strides against the instances, without
+    (num_points, num_gts, 4) tensors.
+
+    Args:
+        gt_bboxes (Tensor): shape (num_gts, 4).
+        mask_centers (Tensor): shape (num_gts, 2), [y, x].
+        point_strides (Tensor): stride of the level of every point, shape
+            (num_points, ).
+        xs (Tensor): x of the points, shape (num_points, ).
+        ys (Tensor): y of the points, shape (num_points, ).
+        radius (float): radius of the region in strides.
+
+    Returns:
+        Tensor: bool tensor of shape (num_points, num_gts).
+    """
+    radius = (point_strides * radius)[:, None]
+    center_y = mask_centers[:, 0]
+    center_x = mask_centers[:, 1]
+    xs = xs[:, None]
+    ys = ys[:, None]
+    inside = xs > torch.max(center_x - radius, gt_bboxes[:, 0])
+    inside &= ys > torch.max(center_y - radius, gt_bboxes[:, 1])
+    inside &= xs < torch.min(center_x + radius, gt_bboxes[:, 2])
+    inside &= ys < torch.min(center_y + radius, gt_bboxes[:, 3])
+    return inside
 
 
 def get_polar_coordinates(c_x, c_y, pos_mask_contour, n=72):
@@ -100,6 +107,100 @@ def get_polar_coordinates(c_x, c_y, pos_mask_contour, n=72):
     return distances, new_coordinate
 
 
+def pack_contours(contours, device=None):
+    """Concatenate per-instance contours into one flat point tensor.
+
+    Args:
+        contours (list[Tensor]): contour of each instance, shape (k_i, 2) or
+            (k_i, 1, 2).
+        device (torch.device, optional): device of the packed tensors.
+
+    Returns:
+        tuple: flat contour points of shape (sum(k_i), 2) and the offsets of
+            every instance of shape (num_instances + 1, ), so that the points
+            of instance i are ``points[offsets[i]:offsets[i + 1]]``.
+    """
+    contours = [torch.as_tensor(c).reshape(-1, 2) for c in contours]
+    lengths = [c.size(0) for c in contours]
+    offsets = torch.tensor([0] + lengths, dtype=torch.long).cumsum(0)
+    if len(contours) > 0:
+        points = torch.cat(contours)
+    else:
+        points = torch.zeros((0, 2))
+    if device is not None:
+        points = points.to(device)
+        offsets = offsets.to(device)
+    return points, offsets
+
+
+def get_polar_coordinates_batch(centers,
+                                contours,
+                                contour_offsets,
+                                contour_inds,
+                                n=72):
+    """Vectorized version of :func:`get_polar_coordinates`.
+
+    Every center is encoded against its assigned contour at once: the rays of
+    all (center, contour point) pairs are binned into integer degrees with a
+    scatter max, and each of the ``n`` output bins takes the first non-empty
+    degree among the offsets 0, +1, -1, +2, -2, +3, -3, exactly as the
+    per-point loop does.
+
+    Args:
+        centers (Tensor): positive locations, shape (num_pos, 2), [x, y].
+        contours (Tensor): packed contour points, shape (num_points, 2).
+        contour_offsets (Tensor): contour offsets, shape (num_gts + 1, ).
+        contour_inds (Tensor): index of the contour assigned to every
+            positive location, shape (num_pos, ).
+        n (int): number of rays.
+
+    Returns:
+        Tensor: distances of shape (num_pos, n).
+    """
+    num_pos = centers.size(0)
+    interval = 360 // n
+    if num_pos == 0:
+        return centers.new_zeros((0, n))
+
+    # expand every positive location to all points of its contour
+    starts = contour_offsets[contour_inds]
+    counts = contour_offsets[contour_inds + 1] - starts
+    pair_inds = torch.arange(
+        num_pos, device=centers.device).repeat_interleave(counts)
+    pair_starts = (counts.cumsum(0) - counts).repeat_interleave(counts)
+    local_inds = torch.arange(
+        pair_inds.numel(), device=centers.device) - pair_starts
+    ct = contours[starts.repeat_interleave(counts) + local_inds]
+
+    x = ct[:, 0] - centers[pair_inds, 0]
+    y = ct[:, 1] - centers[pair_inds, 1]
+    angle = torch.atan2(x, y) * 180 / np.pi
+    angle[angle < 0] += 360
+    angle = angle.int()
+    dist = torch.sqrt(x**2 + y**2)
+
+    # max distance per integer degree, padded by 3 degrees on both sides
+    max_offset = 3
+    num_degrees = 361 + 2 * max_offset
+    degree_dist = dist.new_full((num_pos * num_degrees, ), -1)
+    degree_dist.scatter_reduce_(
+        0,
+        pair_inds * num_degrees + angle.long() + max_offset,
+        dist,
+        reduce='amax')
+    degree_dist = degree_dist.view(num_pos, num_degrees)
+
+    bins = torch.arange(0, 360, interval, device=centers.device)
+    search_order = bins.new_tensor([0, 1, -1, 2, -2, 3, -3])
+    candidates = degree_dist[:, bins[:, None] + search_order[None, :] +
+                             max_offset]
+    found = candidates >= 0
+    first_found = found.int().argmax(dim=-1, keepdim=True)
+    distances = candidates.gather(-1, first_found).squeeze(-1)
+    return torch.where(
+        found.any(dim=-1), distances, distances.new_tensor(1e-6))
+
+
 def polar_centerness_target(pos_mask_targets, max_centerness=None):
     # only calculate pos centerness targets, otherwise there may be nan
     centerness_targets = torch.sqrt(pos_mask_targets.min() / pos_mask_targets.max())
@@ -108,6 +209,28 @@ def polar_centerness_target(pos_mask_targets, max_centerness=None):
     return centerness_targets.clamp_max(1.0)
 
 
+def polar_centerness_target_batch(pos_mask_targets, max_centerness=None):
+    """Vectorized version of :func:`polar_centerness_target`.
+
+    Args:
+        pos_mask_targets (Tensor): distances of shape (num_pos, n).
+        max_centerness (Tensor, optional): max centerness of the instance
+            assigned to every positive location, shape (num_pos, ). Zero
+            entries leave the centerness unnormalized.
+
+    Returns:
+        Tensor: centerness targets of shape (num_pos, ).
+    """
+    centerness_targets = torch.sqrt(
+        pos_mask_targets.min(dim=1)[0] / pos_mask_targets.max(dim=1)[0])
+    if max_centerness is not None:
+        max_centerness = max_centerness.to(centerness_targets.dtype)
+        centerness_targets = torch.where(max_centerness != 0,
+                                         centerness_targets / max_centerness,
+                                         centerness_targets)
+    return centerness_targets.clamp_max(1.0)
+
+
 def get_points_single(featmap_size, stride, dtype, device):
     h, w = featmap_size
     x_range = torch.arange(
@@ -120,16 +243,42 @@ def get_points_single(featmap_size, stride, dtype, device):
     return points
 
 
+# the points of all levels of a feature map size, ``mlvl_points`` per level,
+# the other ones concatenated over the levels
+PointGrid = namedtuple(
+    'PointGrid',
+    ['mlvl_points', 'num_points', 'points', 'regress_ranges', 'strides'])
+
+
+def get_flatten_points(point_grid, inds, num_imgs):
+    """Points of the locations ``inds`` of the flattened level-major batch
+    predictions, without repeating the points for every image."""
+    num_points = point_grid.points.new_tensor(
+        point_grid.num_points, dtype=torch.long)
+    level_ends = torch.cumsum(num_points * num_imgs, 0)
+    levels = (inds[:, None] >= level_ends).sum(1)
+    inds = inds - (level_ends - num_points * num_imgs)[levels]
+    level_starts = torch.cumsum(num_points, 0) - num_points
+    return point_grid.points[inds % num_points[levels] + level_starts[levels]]
+
+
 @HEADS.register_module
 class FourierNetHead(nn.Module):
 
+    # irfft decodes with torch.fft, matmul with a precomputed DFT basis
+    contour_decoders = dict(
+        irfft=FourierContourDecoder, matmul=FourierMatmulDecoder)
+    # dtypes of the towers in the mixed precision inference mode
+    inference_dtypes = dict(fp16=torch.float16, bf16=torch.bfloat16)
+
     def __init__(self,
                  num_classes,
                  in_channels,
                  feat_channels=256,
                  stacked_convs=4,
                  strides=(4, 8, 16, 32, 64),
-                 regress_ranges=((-1, 64), (64, 128), (128, 256), (256, 512), (512, INF)),
+                 regress_ranges=((-1, 64), (64, 128), (128, 256), (256, 512),
+                                 (512, INF)),
                  use_dcn=False,
                  mask_nms=False,
                  bbox_from_mask=False,
@@ -147,19 +296,36 @@ class FourierNetHead(nn.Module):
                  use_fourier=False,
                  num_coe=36,
                  visulize_coe=36,
+                 contour_decoder='irfft',
                  centerness_factor=0.5,
-                 normalized_centerness=False):
+                 normalized_centerness=False,
+                 max_assign_chunk=None,
+                 point_cache_size=8,
+                 inference_dtype=None,
+                 channels_last=False,
+                 shared_convs=0,
+                 merge_final_convs=False):
         super(FourierNetHead, self).__init__()
         self.use_fourier = use_fourier
         self.contour_points = contour_points
         self.num_coe = num_coe
         self.visulize_coe = visulize_coe
+        assert contour_decoder in self.contour_decoders
+        self.contour_decoder_type = contour_decoder
         self.interval = 360 // self.contour_points
         self.num_classes = num_classes
         self.cls_out_channels = num_classes - 1
         self.in_channels = in_channels
         self.feat_channels = feat_channels
         self.stacked_convs = stacked_convs
+        assert 0 <= shared_convs <= stacked_convs
+        # the final convs can only be merged into one plain conv when they
+        # read the same features, a grouped conv over separate towers would
+        # pad every group to the mask outputs and add MACs
+        assert not merge_final_convs or shared_convs == stacked_convs, \
+            'merge_final_convs requires shared_convs == stacked_convs'
+        self.num_shared_convs = shared_convs
+        self.merge_final_convs = merge_final_convs
         self.strides = strides
         self.regress_ranges = regress_ranges
         self.loss_cls = build_loss(loss_cls)
@@ -180,105 +346,95 @@ class FourierNetHead(nn.Module):
         self.radius = radius
         self.centerness_factor = centerness_factor
         self.normalized_centerness = normalized_centerness
+        self.max_assign_chunk = max_assign_chunk
+        # least recently used point grids of the last feature map sizes
+        self.point_cache_size = point_cache_size
+        self._point_grids = OrderedDict()
+        assert inference_dtype in (None, ) + tuple(self.inference_dtypes)
+        self.inference_dtype = inference_dtype
+        self.channels_last = channels_last
         self._init_layers()
+        if channels_last:
+            self.to(memory_format=torch.channels_last)
 
     def _init_layers(self):
+        # the first shared_convs convs are shared by the three towers
+        self.shared_convs = nn.ModuleList()
         self.cls_convs = nn.ModuleList()
         if not self.bbox_from_mask:
             self.reg_convs = nn.ModuleList()
         self.mask_convs = nn.ModuleList()
         for i in range(self.stacked_convs):
             chn = self.in_channels if i == 0 else self.feat_channels
-            if not self.use_dcn:
-                self.cls_convs.append(
-                    ConvModule(
-                        chn,
-                        self.feat_channels,
-                        3,
-                        stride=1,
-                        padding=1,
-                        conv_cfg=self.conv_cfg,
-                        norm_cfg=self.norm_cfg,
-                        bias=self.norm_cfg is None))
-                if not self.bbox_from_mask:
-                    self.reg_convs.append(
-                        ConvModule(
-                            chn,
-                            self.feat_channels,
-                            3,
-                            stride=1,
-                            padding=1,
-                            conv_cfg=self.conv_cfg,
-                            norm_cfg=self.norm_cfg,
-                            bias=self.norm_cfg is None))
-                self.mask_convs.append(
-                    ConvModule(
-                        chn,
-                        self.feat_channels,
-                        3,
-                        stride=1,
-                        padding=1,
-                        conv_cfg=self.conv_cfg,
-                        norm_cfg=self.norm_cfg,
-                        bias=self.norm_cfg is None))
-            else:
-                self.cls_convs.append(
-                    ModulatedDeformConvPack(
-                        chn,
-                        self.feat_channels,
-                        3,
-                        stride=1,
-                        padding=1,
-                        dilation=1,
-                        deformable_groups=1,
-                    ))
-                if self.norm_cfg:
-                    self.cls_convs.append(build_norm_layer(self.norm_cfg, self.feat_channels)[1])
-                self.cls_convs.append(nn.ReLU(inplace=True))
-
-                if not self.bbox_from_mask:
-                    self.reg_convs.append(
-                        ModulatedDeformConvPack(
-                            chn,
-                            self.feat_channels,
-                            3,
-                            stride=1,
-                            padding=1,
-                            dilation=1,
-                            deformable_groups=1,
-                        ))
-                    if self.norm_cfg:
-                        self.reg_convs.append(build_norm_layer(self.norm_cfg, self.feat_channels)[1])
-                    self.reg_convs.append(nn.ReLU(inplace=True))
-
-                self.mask_convs.append(
-                    ModulatedDeformConvPack(
-                        chn,
-                        self.feat_channels,
-                        3,
-                        stride=1,
-                        padding=1,
-                        dilation=1,
-                        deformable_groups=1,
-                    ))
-                if self.norm_cfg:
-                    self.mask_convs.append(build_norm_layer(self.norm_cfg, self.feat_channels)[1])
-                self.mask_convs.append(nn.ReLU(inplace=True))
+            if i < self.num_shared_convs:
+                self.shared_convs.extend(self._tower_layers(chn))
+                continue
+            self.cls_convs.extend(self._tower_layers(chn))
+            if not self.bbox_from_mask:
+                self.reg_convs.extend(self._tower_layers(chn))
+            self.mask_convs.extend(self._tower_layers(chn))
 
         self.polar_cls = nn.Conv2d(
             self.feat_channels, self.cls_out_channels, 3, padding=1)
-        self.polar_reg = nn.Conv2d(self.feat_channels, 4, 3, padding=1)
         if self.use_fourier:
-            self.polar_mask = nn.Conv2d(self.feat_channels, self.num_coe * 2, 3, padding=1)
+            mask_channels = self.num_coe * 2
         else:
-            self.polar_mask = nn.Conv2d(self.feat_channels, self.contour_points, 3, padding=1)
-        self.polar_centerness = nn.Conv2d(self.feat_channels, 1, 3, padding=1)
+            mask_channels = self.contour_points
+        if self.merge_final_convs:
+            # outputs of the mask, centerness and box convs
+            self.merged_channels = [mask_channels, 1]
+            if not self.bbox_from_mask:
+                self.merged_channels.append(4)
+            self.polar_merged = nn.Conv2d(
+                self.feat_channels, sum(self.merged_channels), 3, padding=1)
+        else:
+            self.polar_reg = nn.Conv2d(self.feat_channels, 4, 3, padding=1)
+            self.polar_mask = nn.Conv2d(
+                self.feat_channels, mask_channels, 3, padding=1)
+            self.polar_centerness = nn.Conv2d(
+                self.feat_channels, 1, 3, padding=1)
 
         self.scales_bbox = nn.ModuleList([Scale(1.0) for _ in self.strides])
         self.scales_mask = nn.ModuleList([Scale(1.0) for _ in self.strides])
+        decoder_cls = self.contour_decoders[self.contour_decoder_type]
+        self.contour_decoder = decoder_cls(self.contour_points, self.num_coe,
+                                           self.use_fourier)
+
+    def _tower_layers(self, chn):
+        """Layers of one conv of a tower."""
+        if not self.use_dcn:
+            return [
+                ConvModule(
+                    chn,
+                    self.feat_channels,
+                    3,
+                    stride=1,
+                    padding=1,
+                    conv_cfg=self.conv_cfg,
+                    norm_cfg=self.norm_cfg,
+                    bias=self.norm_cfg is None)
+            ]
+        layers = [
+            ModulatedDeformConvPack(
+                chn,
+                self.feat_channels,
+                3,
+                stride=1,
+                padding=1,
+                dilation=1,
+                deformable_groups=1,
+            )
+        ]
+        if self.norm_cfg:
+            layers.append(
+                build_norm_layer(self.norm_cfg, self.feat_channels)[1])
+        layers.append(nn.ReLU(inplace=True))
+        return layers
 
     def init_weights(self):
         if not self.use_dcn:
+            for m in self.shared_convs:
+                normal_init(m.conv, std=0.01)
             for m in self.cls_convs:
                 normal_init(m.conv, std=0.01)
             if not self.bbox_from_mask:
@@ -291,14 +447,43 @@ class FourierNetHead(nn.Module):
 
         bias_cls = bias_init_with_prob(0.01)
         normal_init(self.polar_cls, std=0.01, bias=bias_cls)
-        normal_init(self.polar_reg, std=0.01)
-        normal_init(self.polar_mask, std=0.01)
-        normal_init(self.polar_centerness, std=0.01)
+        if self.merge_final_convs:
+            normal_init(self.polar_merged, std=0.01)
+        else:
+            normal_init(self.polar_reg, std=0.01)
+            normal_init(self.polar_mask, std=0.01)
+            normal_init(self.polar_centerness, std=0.01)
 
     def forward(self, feats):
-        return multi_apply(self.forward_single, feats, self.scales_bbox, self.scales_mask)
+        """
+        In eval mode with an ``inference_dtype`` the towers and the final
+        convs run under autocast, fp16 is replaced by bf16 on CPU where
+        autocast only supports bf16. The outputs are returned in fp32 so the
+        contours are decoded in full precision.
+        """
+        if self.channels_last:
+            feats = [
+                feat.contiguous(memory_format=torch.channels_last)
+                for feat in feats
+            ]
+        if self.inference_dtype is None or self.training:
+            return multi_apply(self.forward_single, feats, self.scales_bbox,
+                               self.scales_mask)
+
+        device_type = feats[0].device.type
+        if device_type == 'cuda':
+            dtype = self.inference_dtypes[self.inference_dtype]
+        else:
+            dtype = torch.bfloat16
+        with torch.autocast(device_type, dtype=dtype):
+            outs = multi_apply(self.forward_single, feats, self.scales_bbox,
+                               self.scales_mask)
+        return tuple([out.float() for out in level_outs]
+                     for level_outs in outs)
 
     def forward_single(self, x, scale_bbox, scale_mask):
+        for shared_layer in self.shared_convs:
+            x = shared_layer(x)
         cls_feat = x
         reg_feat = x
         mask_feat = x
@@ -309,25 +494,40 @@ class FourierNetHead(nn.Module):
 
         for mask_layer in self.mask_convs:
             mask_feat = mask_layer(mask_feat)
-        if self.use_fourier:
+        if not self.bbox_from_mask:
+            for reg_layer in self.reg_convs:
+                reg_feat = reg_layer(reg_feat)
+
+        if self.merge_final_convs:
+            mask_pred, centerness, bbox_pred = self.forward_merged(x)
+        else:
             mask_pred = self.polar_mask(mask_feat)
+            centerness = self.polar_centerness(cls_feat)
+            bbox_pred = None
+            if not self.bbox_from_mask:
+                bbox_pred = self.polar_reg(reg_feat)
+
+        if self.use_fourier:
             mask_pred = scale_mask(mask_pred)
         else:
-            mask_pred = scale_mask(self.polar_mask(mask_feat)).float().exp()
-
-        centerness = self.polar_centerness(cls_feat)
+            mask_pred = scale_mask(mask_pred).float().exp()
 
         if not self.bbox_from_mask:
-            for reg_layer in self.reg_convs:
-                reg_feat = reg_layer(reg_feat)
             # scale the bbox_pred of different level
             # float to avoid overflow when enabling FP16
-            bbox_pred = scale_bbox(self.polar_reg(reg_feat)).float().exp()
+            bbox_pred = scale_bbox(bbox_pred).float().exp()
         else:
             bbox_pred = mask_pred[:, :4, :, :]
 
         return cls_score, bbox_pred, centerness, mask_pred
 
+    def forward_merged(self, x):
+        """Mask, centerness and box predictions of the merged final conv
+        on the output of the shared convs, the box prediction is None with
+        ``bbox_from_mask``."""
+        preds = self.polar_merged(x).split(self.merged_channels, 1)
+        return preds[0], preds[1], preds[2] if len(preds) > 2 else None
+
     @force_fp32(apply_to=('cls_scores', 'bbox_preds', 'mask_preds', 'centernesses'))
     def loss(self,
              cls_scores,
@@ -341,18 +541,52 @@ class FourierNetHead(nn.Module):
              gt_masks=None,
              gt_bboxes_ignore=None,
              gt_centers=None,
-             gt_max_centerness=None):
+             gt_max_centerness=None,
+             gt_contour_points=None,
+             gt_contour_offsets=None,
+             gt_polar_targets=None):
+        """
+        The contours are either given as ``gt_masks``, the list of the
+        contours of every image, or packed by ``PackContours``:
+        ``gt_contour_points`` of shape (num_imgs, 2, max_num_points) and
+        ``gt_contour_offsets`` of shape (num_imgs, 1, max_num_gts + 1), both
+        padded. The targets computed by the ``PolarTarget`` pipeline,
+        ``gt_polar_targets`` of shape (num_imgs, num_rows, max_num_pos), are
+        used instead of :meth:`polar_target` if given.
+        """
         assert len(cls_scores) == len(bbox_preds) == len(centernesses) == len(mask_preds)
         featmap_sizes = [featmap.size()[-2:] for featmap in cls_scores]
-        all_level_points = self.get_points(featmap_sizes, bbox_preds[0].dtype,
-                                           bbox_preds[0].device)
-        self.num_points_per_level = [i.size()[0] for i in all_level_points]
-
-        labels, bbox_targets, mask_targets, centerness_targets = self.polar_target(all_level_points, gt_labels,
-                                                                                   gt_bboxes, gt_masks, gt_centers,
-                                                                                   gt_max_centerness)
+        point_grid = self.get_point_grid(featmap_sizes, bbox_preds[0].dtype,
+                                         bbox_preds[0].device)
 
         num_imgs = cls_scores[0].size(0)
+        if gt_polar_targets is not None:
+            (flatten_labels, pos_inds, pos_bbox_targets, pos_mask_targets,
+             pos_centerness_targets) = self.unpack_polar_targets(
+                 gt_polar_targets, point_grid, featmap_sizes)
+        else:
+            if gt_contour_points is not None:
+                gt_contours = [
+                    (contour_points.t(),
+                     contour_offsets[0, :labels.size(0) + 1])
+                    for contour_points, contour_offsets, labels in zip(
+                        gt_contour_points, gt_contour_offsets, gt_labels)
+                ]
+            else:
+                gt_contours = [
+                    pack_contours(masks, device=bbox_preds[0].device)
+                    for masks in gt_masks
+                ]
+            targets = self.polar_target(point_grid, gt_labels, gt_bboxes,
+                                        gt_contours, gt_centers,
+                                        gt_max_centerness)
+            labels, bbox_targets, mask_targets, centerness_targets = targets
+            flatten_labels = torch.cat(labels).long()  # [num_pixel]
+            pos_inds = flatten_labels.nonzero().reshape(-1)
+            pos_bbox_targets = torch.cat(bbox_targets)[pos_inds]
+            pos_mask_targets = torch.cat(mask_targets)[pos_inds]
+            pos_centerness_targets = torch.cat(centerness_targets)[pos_inds]
+
         # flatten cls_scores, bbox_preds and centerness
         flatten_cls_scores = [
             cls_score.permute(0, 2, 3, 1).reshape(-1, self.cls_out_channels)
@@ -362,54 +596,22 @@ class FourierNetHead(nn.Module):
             centerness.permute(0, 2, 3, 1).reshape(-1)
             for centerness in centernesses
         ]
-        if self.use_fourier:
-            if self.loss_on_coe:
-                flatten_mask_preds = [
-                    mask_pred.permute(0, 2, 3, 1).reshape(-1, self.num_coe, 2)
-                    for mask_pred in mask_preds
-                ]
-            else:
-                flatten_mask_preds = []
-                flatten_bbox_preds = []
-                for mask_pred, points in zip(mask_preds, all_level_points):
-                    mask_pred = mask_pred.permute(0, 2, 3, 1).reshape(-1, self.num_coe, 2)
-                    if self.bbox_from_mask:
-                        xy, m = self.distance2mask(points.repeat(num_imgs, 1), mask_pred, train=True)
-                        b = torch.stack([xy[:, 0].min(1)[0],
-                                         xy[:, 1].min(1)[0],
-                                         xy[:, 0].max(1)[0],
-                                         xy[:, 1].max(1)[0]], -1)
-                        flatten_bbox_preds.append(b)
-                        flatten_mask_preds.append(m)
-                    else:
-                        m = torch.irfft(torch.cat([mask_pred, torch.zeros(mask_pred.shape[0],
-                                                                          self.contour_points - self.num_coe, 2).to(
-                            "cuda")], 1), 1, True, False).float().exp()
-                        flatten_mask_preds.append(m)
-
-        else:
-            flatten_mask_preds = [
-                mask_pred.permute(0, 2, 3, 1).reshape(-1, self.contour_points)
-                for mask_pred in mask_preds
-            ]
-        if not self.bbox_from_mask:
-            flatten_bbox_preds = [
-                bbox_pred.permute(0, 2, 3, 1).reshape(-1, 4)
-                for bbox_pred in bbox_preds
-            ]
+        # the contours are only decoded at the positive locations
+        flatten_mask_preds = [
+            mask_pred.permute(0, 2, 3, 1).reshape(-1, mask_pred.size(1))
+            for mask_pred in mask_preds
+        ]
+        flatten_bbox_preds = [
+            bbox_pred.permute(0, 2, 3, 1).reshape(-1, 4)
+            for bbox_pred in bbox_preds
+        ]
 
         flatten_cls_scores = torch.cat(flatten_cls_scores)  # [num_pixel, 80]
         flatten_bbox_preds = torch.cat(flatten_bbox_preds)  # [num_pixel, 4]
-        flatten_mask_preds = torch.cat(flatten_mask_preds)  # [num_pixel, n]
+        # [num_pixel, num_coe * 2 or n]
+        flatten_mask_preds = torch.cat(flatten_mask_preds)
         flatten_centerness = torch.cat(flatten_centerness)  # [num_pixel]
 
-        flatten_labels = torch.cat(labels).long()  # [num_pixel]
-        flatten_centerness_targets = torch.cat(centerness_targets)
-        flatten_bbox_targets = torch.cat(bbox_targets)  # [num_pixel, 4]
-        flatten_mask_targets = torch.cat(mask_targets)  # [num_pixel, n]
-        flatten_points = torch.cat([points.repeat(num_imgs, 1)
-                                    for points in all_level_points])  # [num_pixel,2]
-        pos_inds = flatten_labels.nonzero().reshape(-1)
         num_pos = len(pos_inds)
 
         loss_cls = self.loss_cls(flatten_cls_scores, flatten_labels,
@@ -419,13 +621,14 @@ class FourierNetHead(nn.Module):
         pos_mask_preds = flatten_mask_preds[pos_inds]
 
         if num_pos > 0:
-            pos_bbox_targets = flatten_bbox_targets[pos_inds]
-            pos_mask_targets = flatten_mask_targets[pos_inds]
-            pos_centerness_targets = flatten_centerness_targets[pos_inds]
-
-            pos_points = flatten_points[pos_inds]
+            pos_points = get_flatten_points(point_grid, pos_inds, num_imgs)
+            if self.use_fourier:
+                pos_mask_preds = pos_mask_preds.reshape(
+                    num_pos, self.num_coe, 2)
             if self.bbox_from_mask:
-                pos_decoded_bbox_preds = pos_bbox_preds
+                pos_contours, pos_distances = self.distance2mask(
+                    pos_points, pos_mask_preds, train=True)
+                pos_decoded_bbox_preds = self.contour_bboxes(pos_contours)
             else:
                 pos_decoded_bbox_preds = distance2bbox(pos_points, pos_bbox_preds)
             pos_decoded_target_preds = distance2bbox(pos_points,
@@ -439,11 +642,16 @@ class FourierNetHead(nn.Module):
                 avg_factor=pos_centerness_targets.sum())
 
             if self.loss_on_coe:
-                pos_mask_targets = torch.rfft(pos_mask_targets, 1, True, False)
-                pos_mask_targets = pos_mask_targets[..., :self.num_coe, :]
+                pos_mask_targets = distance2fourier(pos_mask_targets,
+                                                    self.num_coe)
                 loss_mask = self.loss_mask(pos_mask_preds,
                                            pos_mask_targets)
             else:
+                if self.bbox_from_mask:
+                    pos_mask_preds = pos_distances
+                else:
+                    pos_mask_preds = self.contour_decoder.decode_distance(
+                        pos_mask_preds)
                 loss_mask = self.loss_mask(pos_mask_preds,
                                            pos_mask_targets,
                                            weight=pos_centerness_targets,
@@ -463,6 +671,46 @@ class FourierNetHead(nn.Module):
             loss_mask=loss_mask,
             loss_centerness=loss_centerness)
 
+    def unpack_polar_targets(self, polar_targets, point_grid, featmap_sizes):
+        """Dense labels and positive targets from the ``gt_polar_targets``
+        of the ``PolarTarget`` pipeline.
+
+        Returns:
+            tuple: labels of all locations in the order of the flattened
+                predictions, the sorted indices of the positive locations and
+                their box, polar distance and centerness targets, the same as
+                :meth:`polar_target` gives.
+        """
+        num_imgs = polar_targets.size(0)
+        # every column is a positive location, padded columns have label 0
+        polar_targets = polar_targets.transpose(1, 2).reshape(
+            -1, polar_targets.size(1))
+        img_inds = torch.arange(
+            num_imgs, device=polar_targets.device).repeat_interleave(
+                polar_targets.size(0) // num_imgs)
+        labels = polar_targets[:, 3].long()
+        valid = labels > 0
+        polar_targets = polar_targets[valid]
+        img_inds, labels = img_inds[valid], labels[valid]
+
+        levels = polar_targets[:, 0].long()
+        num_points = img_inds.new_tensor(point_grid.num_points)
+        level_sizes = num_points * num_imgs
+        level_starts = torch.cumsum(level_sizes, 0) - level_sizes
+        widths = img_inds.new_tensor([size[1] for size in featmap_sizes])
+        pos_inds = level_starts[levels] + img_inds * num_points[levels] + \
+            polar_targets[:, 1].long() * widths[levels] + \
+            polar_targets[:, 2].long()
+        # in the order of polar_target
+        pos_inds, order = pos_inds.sort()
+        polar_targets, labels = polar_targets[order], labels[order]
+
+        flatten_labels = labels.new_zeros(
+            sum(point_grid.num_points) * num_imgs)
+        flatten_labels[pos_inds] = labels
+        return (flatten_labels, pos_inds, polar_targets[:, 4:8],
+                polar_targets[:, 9:], polar_targets[:, 8])
+
     def get_points(self, featmap_sizes, dtype, device):
         """Get points according to feature map sizes.
 
@@ -472,39 +720,72 @@ class FourierNetHead(nn.Module):
             device (torch.device): Device of points.
 
         Returns:
-            tuple: points of each image.
+            list[Tensor]: points of each level.
         """
+        return self.get_point_grid(featmap_sizes, dtype, device).mlvl_points
+
+    def get_point_grid(self, featmap_sizes, dtype, device):
+        """Points, regress ranges and strides of all levels.
+
+        The grids of the last ``point_cache_size`` feature map sizes are
+        kept, the returned tensors must not be modified in place.
+
+        Returns:
+            PointGrid: see ``PointGrid``.
+        """
+        sizes = tuple(tuple(size) for size in featmap_sizes)
+        key = (sizes, dtype, torch.device(device))
+        point_grid = self._point_grids.get(key)
+        if point_grid is not None:
+            self._point_grids.move_to_end(key)
+            return point_grid
+
         mlvl_points = []
         for i in range(len(featmap_sizes)):
             mlvl_points.append(
                 get_points_single(featmap_sizes[i], self.strides[i],
                                   dtype, device))
-        return mlvl_points
-
-    def polar_target(self, points, labels_list, bbox_list, mask_list, centers_list, centerness_list):
-        assert len(points) == len(self.regress_ranges)
-        num_levels = len(points)
-        # expand regress ranges to align with points
-        expanded_regress_ranges = [
-            points[i].new_tensor(self.regress_ranges[i])[None].expand_as(
-                points[i]) for i in range(num_levels)
-        ]
-        # concat all levels points and regress ranges
-        concat_regress_ranges = torch.cat(expanded_regress_ranges, dim=0)
-        concat_points = torch.cat(points, dim=0)
+        num_points = [points.size(0) for points in mlvl_points]
+        point_grid = PointGrid(
+            mlvl_points=mlvl_points,
+            num_points=num_points,
+            points=torch.cat(mlvl_points),
+            # expand regress ranges and strides to align with points
+            regress_ranges=torch.cat([
+                points.new_tensor(ranges)[None].expand_as(points)
+                for points, ranges in zip(mlvl_points, self.regress_ranges)
+            ]),
+            strides=torch.cat([
+                points.new_full((points.size(0), ), stride)
+                for points, stride in zip(mlvl_points, self.strides)
+            ]))
+        if self.point_cache_size > 0:
+            self._point_grids[key] = point_grid
+            if len(self._point_grids) > self.point_cache_size:
+                self._point_grids.popitem(last=False)
+        return point_grid
+
+    def polar_target(self, point_grid, labels_list, bbox_list, contours_list,
+                     centers_list, centerness_list):
+        """Targets of all levels, ``contours_list`` holds the packed contour
+        points and offsets of every image, see :func:`pack_contours`."""
+        assert len(point_grid.mlvl_points) == len(self.regress_ranges)
+        num_levels = len(point_grid.mlvl_points)
         # get labels and bbox_targets of each image
         labels_list, bbox_targets_list, mask_targets_list, centerness_targets_list = multi_apply(
             self.polar_target_single,
             bbox_list,
-            mask_list,
+            contours_list,
             labels_list,
             centers_list,
             centerness_list,
-            points=concat_points,
-            regress_ranges=concat_regress_ranges)
+            points=point_grid.points,
+            regress_ranges=point_grid.regress_ranges,
+            point_strides=point_grid.strides,
+            num_points_per_level=point_grid.num_points)
 
         # split to per img, per level
-        num_points = [center.size(0) for center in points]
+        num_points = point_grid.num_points
         labels_list = [labels.split(num_points, 0) for labels in labels_list]
         centerness_targets_list = [
             centerness_targets.split(num_points, 0)
@@ -538,91 +819,136 @@ class FourierNetHead(nn.Module):
 
         return concat_lvl_labels, concat_lvl_bbox_targets, concat_lvl_mask_targets, concat_lvl_centerness_targets
 
-    def polar_target_single(self, gt_bboxes, gt_masks, gt_labels, mask_centers, gt_max_centerness, points,
-                            regress_ranges):
+    def polar_target_single(self, gt_bboxes, gt_contours, gt_labels,
+                            mask_centers, gt_max_centerness, points,
+                            regress_ranges, point_strides,
+                            num_points_per_level):
+        """Assign the instances of an image to the points of all levels.
 
+        The points of every level are only matched against the instances
+        whose size fits the regress range of the level, in chunks of at
+        most ``max_assign_chunk`` point and instance pairs, so memory does
+        not grow with the number of points times the number of instances.
+        """
         # Sum of all points ever
         num_points = points.size(0)
         # Number of ground truth objects
         num_gts = gt_labels.size(0)
         if num_gts == 0:
             return gt_labels.new_zeros(num_points), \
-                   gt_bboxes.new_zeros((num_points, 4))
+                   gt_bboxes.new_zeros((num_points, 4)), \
+                   gt_bboxes.new_zeros((num_points, self.contour_points)), \
+                   gt_bboxes.new_zeros(num_points)
 
         # Area of all bounding boxes
         areas = (gt_bboxes[:, 2] - gt_bboxes[:, 0] + 1) * \
                 (gt_bboxes[:, 3] - gt_bboxes[:, 1] + 1)
+        if not self.use_mask_center:
+            # sample around the box centers
+            mask_centers = torch.stack(
+                [(gt_bboxes[:, 1] + gt_bboxes[:, 3]) / 2,
+                 (gt_bboxes[:, 0] + gt_bboxes[:, 2]) / 2], -1)
+        # the largest distance from a point inside a box to its sides is
+        # between half and all of its longest side
+        max_sides = torch.max(gt_bboxes[:, 2] - gt_bboxes[:, 0],
+                              gt_bboxes[:, 3] - gt_bboxes[:, 1])
+
+        labels = gt_labels.new_zeros(num_points)
+        # points without instance get the box targets of the first one
+        min_area_inds = gt_labels.new_zeros(num_points)
+        level_start = 0
+        for num_level_points in num_points_per_level:
+            level_end = level_start + num_level_points
+            range_min, range_max = regress_ranges[level_start].tolist()
+            gt_inds = ((max_sides >= range_min) &
+                       (max_sides / 2 <= range_max + 1)).nonzero().reshape(-1)
+            level_start, chunk_start = level_end, level_start
+            if gt_inds.numel() == 0:
+                continue
+            chunk_size = num_level_points
+            if self.max_assign_chunk is not None:
+                chunk_size = max(self.max_assign_chunk // gt_inds.numel(), 1)
+            for chunk_start in range(chunk_start, level_end, chunk_size):
+                chunk = slice(chunk_start,
+                              min(chunk_start + chunk_size, level_end))
+                min_area, inds = self.assign_points(
+                    points[chunk], regress_ranges[chunk], point_strides[chunk],
+                    gt_bboxes[gt_inds], mask_centers[gt_inds], areas[gt_inds])
+                found = min_area != INF
+                labels[chunk] = torch.where(found, gt_labels[gt_inds[inds]],
+                                            labels.new_zeros(()))
+                min_area_inds[chunk] = torch.where(found, gt_inds[inds],
+                                                   min_area_inds.new_zeros(()))
+
+        assigned_bboxes = gt_bboxes[min_area_inds]
+        xs, ys = points[:, 0], points[:, 1]
+        bbox_targets = torch.stack(
+            (xs - assigned_bboxes[:, 0], ys - assigned_bboxes[:, 1],
+             assigned_bboxes[:, 2] - xs, assigned_bboxes[:, 3] - ys), -1)
+
+        # get the indexes of features which have objects
+        pos_inds = labels.nonzero().reshape(-1)
+        mask_targets = torch.zeros(
+            num_points, self.contour_points,
+            device=bbox_targets.device).float()
+        centerness_target = torch.zeros(
+            num_points, device=bbox_targets.device).float()
+        pos_mask_ids = min_area_inds[pos_inds]
 
-        areas = areas[None].repeat(num_points, 1)  # Make a copy for all points
+        contours, contour_offsets = gt_contours
+        dists = get_polar_coordinates_batch(points[pos_inds], contours,
+                                            contour_offsets, pos_mask_ids,
+                                            self.contour_points)
+        mask_targets[pos_inds] = dists
+        if self.normalized_centerness:
+            max_centerness = torch.as_tensor(
+                gt_max_centerness, device=points.device)[pos_mask_ids]
+            centerness_target[pos_inds] = polar_centerness_target_batch(
+                dists, max_centerness)
+        else:
+            centerness_target[pos_inds] = polar_centerness_target_batch(dists)
+        return labels, bbox_targets, mask_targets, centerness_target
 
-        # Make a copy for each object (adds a dimension equal to num of ground truth bboxes)
-        regress_ranges = regress_ranges[:, None, :].expand(num_points, num_gts, 2)
-        gt_bboxes = gt_bboxes[None].expand(num_points, num_gts, 4)  # Make a copy for all points
-        xs, ys = points[:, 0], points[:, 1]
-        xs = xs[:, None].expand(num_points, num_gts)  # Make a copy for each object
-        ys = ys[:, None].expand(num_points, num_gts)  # Make a copy for each object
+    def assign_points(self, points, regress_ranges, point_strides, gt_bboxes,
+                      mask_centers, areas):
+        """Match points to the smallest instance they are a positive of.
 
+        Returns:
+            tuple: area of the matched instances, INF for the points without
+                instance, and their indices, both of shape (num_points, ).
+        """
+        xs, ys = points[:, 0, None], points[:, 1, None]
         # The pixel distance between all object bounding boxes and all points in feature map
-        left = xs - gt_bboxes[..., 0]
-        right = gt_bboxes[..., 2] - xs
-        top = ys - gt_bboxes[..., 1]
-        bottom = gt_bboxes[..., 3] - ys
-        bbox_targets = torch.stack((left, top, right, bottom), -1)
-
-        # make centerness regression targets
-        mask_centers = mask_centers[None].expand(num_points, num_gts, 2)
+        left = xs - gt_bboxes[:, 0]
+        right = gt_bboxes[:, 2] - xs
+        top = ys - gt_bboxes[:, 1]
+        bottom = gt_bboxes[:, 3] - ys
+
         if self.center_sample:
-            if self.use_mask_center:
-                inside_gt_bbox_mask = get_mask_sample_region(gt_bboxes,
-                                                             mask_centers,
-                                                             self.strides,
-                                                             self.num_points_per_level,
-                                                             xs,
-                                                             ys,
-                                                             radius=self.radius)
-            else:
-                inside_gt_bbox_mask = self.get_sample_region(gt_bboxes,
-                                                             self.strides,
-                                                             self.num_points_per_level,
-                                                             xs,
-                                                             ys,
-                                                             radius=self.radius)
+            inside_gt_bbox_mask = get_mask_sample_region(
+                gt_bboxes,
+                mask_centers,
+                point_strides,
+                points[:, 0],
+                points[:, 1],
+                radius=self.radius)
         else:
-            inside_gt_bbox_mask = bbox_targets.min(-1)[0] > 0
+            inside_gt_bbox_mask = (left > 0) & (top > 0) & (right > 0) & \
+                (bottom > 0)
 
         # condition2: limit the regression range for each location
         # returns the maximum vector in the bounding box targets
-        max_regress_distance = bbox_targets.max(-1)[0]
+        max_regress_distance = torch.max(
+            torch.max(left, top), torch.max(right, bottom))
 
         # check if it is in regress range
-        inside_regress_range = (max_regress_distance >= regress_ranges[..., 0]) & \
-                               (max_regress_distance <= regress_ranges[..., 1])
-
-        areas[inside_gt_bbox_mask == 0] = INF
-        areas[inside_regress_range == 0] = INF
-        min_area, min_area_inds = areas.min(dim=1)
-
-        # set the ground truth labels
-        labels = gt_labels[min_area_inds]
-        labels[min_area == INF] = 0
-        bbox_targets = bbox_targets[range(num_points), min_area_inds]
+        inside_regress_range = \
+            (max_regress_distance >= regress_ranges[:, 0, None]) & \
+            (max_regress_distance <= regress_ranges[:, 1, None])
 
-        # get the indexes of features which have objects
-        pos_inds = labels.nonzero().reshape(-1)
-        mask_targets = torch.zeros(num_points, self.contour_points, device=bbox_targets.device).float()
-        centerness_target = torch.zeros(num_points, device=bbox_targets.device).float()
-        pos_mask_ids = min_area_inds[pos_inds]
-
-        for p, i in zip(pos_inds, pos_mask_ids):
-            x, y = points[p]
-            pos_mask_contour = gt_masks[i]
-            dists, _ = get_polar_coordinates(x, y, pos_mask_contour, self.contour_points)
-            mask_targets[p] = dists
-            if self.normalized_centerness:
-                centerness_target[p] = polar_centerness_target(dists, gt_max_centerness[i])
-            else:
-                centerness_target[p] = polar_centerness_target(dists)
-        return labels, bbox_targets, mask_targets, centerness_target
+        areas = torch.where(inside_gt_bbox_mask & inside_regress_range, areas,
+                            areas.new_tensor(INF))
+        return areas.min(dim=1)
 
     @force_fp32(apply_to=('cls_scores', 'bbox_preds', 'centernesses'))
     def get_bboxes(self,
@@ -673,11 +999,112 @@ class FourierNetHead(nn.Module):
                           scale_factor,
                           cfg,
                           rescale=False):
+        # boxes are enough for nms unless they are derived from the contours,
+        # in that case only the survivors need their contours decoded
+        decode_after_nms = self._decode_after_nms(cfg)
+        (mlvl_bboxes, mlvl_scores, mlvl_centerness, mlvl_masks,
+         mlvl_decode_points) = self.get_candidates_single(
+             cls_scores,
+             bbox_preds,
+             mask_preds,
+             centernesses,
+             mlvl_points,
+             img_shape,
+             cfg,
+             decode=not decode_after_nms)
+        if rescale:
+            _mlvl_bboxes = mlvl_bboxes / mlvl_bboxes.new_tensor(scale_factor)
+        else:
+            _mlvl_bboxes = mlvl_bboxes
+
+        if decode_after_nms:
+            # carry the candidate indices through nms instead of the contours
+            mlvl_inds = torch.arange(
+                mlvl_masks.size(0), device=mlvl_masks.device)[:, None]
+            det_bboxes, det_labels, det_inds = multiclass_nms_with_mask(
+                _mlvl_bboxes,
+                mlvl_scores,
+                mlvl_inds,
+                cfg.score_thr,
+                cfg.nms,
+                cfg.max_per_img,
+                score_factors=mlvl_centerness + self.centerness_factor)
+            det_inds = det_inds.reshape(-1).long()
+            num_coe = None
+            if self.use_fourier and cfg.get('adaptive_coe', None) is not None:
+                num_coe = self.adaptive_num_coe(det_bboxes[:, :4],
+                                                **cfg.adaptive_coe)
+            det_masks, _ = self.distance2mask(
+                mlvl_decode_points[det_inds],
+                mlvl_masks[det_inds],
+                max_shape=img_shape,
+                num_coe=num_coe)
+            if rescale:
+                det_masks = self.rescale_masks(det_masks, scale_factor)
+            return det_bboxes, det_labels, det_masks
+
+        if rescale:
+            _mlvl_masks = self.rescale_masks(mlvl_masks, scale_factor)
+        else:
+            _mlvl_masks = mlvl_masks
+
+        if self.mask_nms:
+            '''1 mask->min_bbox->nms, performance same to origin box'''
+            _mlvl_bboxes = self.contour_bboxes(_mlvl_masks)
+        '''2 origin bbox->nms, performance same to mask->min_bbox'''
+        det_bboxes, det_labels, det_masks = multiclass_nms_with_mask(
+            _mlvl_bboxes,
+            mlvl_scores,
+            _mlvl_masks,
+            cfg.score_thr,
+            cfg.nms,
+            cfg.max_per_img,
+            score_factors=mlvl_centerness + self.centerness_factor)
+
+        return det_bboxes, det_labels, det_masks
+
+    def _decode_after_nms(self, cfg):
+        if self.bbox_from_mask or self.mask_nms:
+            return False
+        return cfg.get('decode_after_nms', False)
+
+    @staticmethod
+    def contour_bboxes(masks):
+        """Enclosing boxes of contours of shape (n, 2, contour_points)."""
+        return torch.stack([
+            masks[:, 0].min(1)[0], masks[:, 1].min(1)[0],
+            masks[:, 0].max(1)[0], masks[:, 1].max(1)[0]
+        ], -1)
+
+    def get_candidates_single(self,
+                              cls_scores,
+                              bbox_preds,
+                              mask_preds,
+                              centernesses,
+                              mlvl_points,
+                              img_shape,
+                              cfg,
+                              decode=True):
+        """Decode the nms_pre best candidates of every level of an image.
+
+        Args:
+            decode (bool): decode the contours, otherwise the raw mask
+                predictions are returned with their points for a later
+                :meth:`distance2mask` of the nms survivors.
+
+        Returns:
+            tuple: boxes (n, 4), scores (n, num_classes) with a leading
+                background column, centerness (n, ), contours
+                (n, 2, contour_points) or mask predictions, and the points
+                (n, 2) of the candidates if not ``decode`` else None, all at
+                the scale of ``img_shape``.
+        """
         assert len(cls_scores) == len(bbox_preds) == len(mlvl_points)
         mlvl_bboxes = []
         mlvl_scores = []
         mlvl_masks = []
         mlvl_centerness = []
+        mlvl_decode_points = []
         for cls_score, bbox_pred, mask_pred, centerness, points in zip(
                 cls_scores, bbox_preds, mask_preds, centernesses, mlvl_points):
             assert cls_score.size()[-2:] == bbox_pred.size()[-2:]
@@ -699,16 +1126,17 @@ class FourierNetHead(nn.Module):
                 mask_pred = mask_pred[topk_inds, :]
                 scores = scores[topk_inds, :]
                 centerness = centerness[topk_inds]
-            if not self.bbox_from_mask:
+            if not decode:
+                bboxes = distance2bbox(points, bbox_pred, max_shape=img_shape)
+                masks = mask_pred
+                mlvl_decode_points.append(points)
+            elif not self.bbox_from_mask:
                 bboxes = distance2bbox(points, bbox_pred, max_shape=img_shape)
                 # masks, _ = self.distance2mask(points, mask_pred, bbox=bboxes)
                 masks, _ = self.distance2mask(points, mask_pred, max_shape=img_shape)
             else:
                 masks, _ = self.distance2mask(points, mask_pred, max_shape=img_shape)
-                bboxes = torch.stack([masks[:, 0].min(1)[0],
-                                      masks[:, 1].min(1)[0],
-                                      masks[:, 0].max(1)[0],
-                                      masks[:, 1].max(1)[0]], -1)
+                bboxes = self.contour_bboxes(masks)
 
             mlvl_bboxes.append(bboxes)
             mlvl_scores.append(scores)
@@ -717,50 +1145,269 @@ class FourierNetHead(nn.Module):
 
         mlvl_bboxes = torch.cat(mlvl_bboxes)
         mlvl_masks = torch.cat(mlvl_masks)
-        if rescale:
-            _mlvl_bboxes = mlvl_bboxes / mlvl_bboxes.new_tensor(scale_factor)
-            try:
-                # TODO:change cuda
-                scale_factor = torch.tensor(scale_factor)[:2].cuda().unsqueeze(1).repeat(1, self.contour_points)
-                _mlvl_masks = mlvl_masks / scale_factor
-            except (RuntimeError, TypeError, NameError, IndexError):
-                _mlvl_masks = mlvl_masks / mlvl_masks.new_tensor(scale_factor)
-
         mlvl_scores = torch.cat(mlvl_scores)
         padding = mlvl_scores.new_zeros(mlvl_scores.shape[0], 1)
         mlvl_scores = torch.cat([padding, mlvl_scores], dim=1)
         mlvl_centerness = torch.cat(mlvl_centerness)
+        mlvl_decode_points = None if decode else torch.cat(mlvl_decode_points)
+        return (mlvl_bboxes, mlvl_scores, mlvl_centerness, mlvl_masks,
+                mlvl_decode_points)
+
+    def get_candidates_export(self,
+                              cls_scores,
+                              bbox_preds,
+                              centernesses,
+                              mask_preds,
+                              img_shape,
+                              nms_pre=1000):
+        """Traceable counterpart of :meth:`get_candidates_single`.
+
+        All images of the batch are decoded at once without data dependent
+        control flow, so the graph can be exported to TorchScript or ONNX.
+        The Fourier coefficients are decoded with a
+        :class:`FourierMatmulDecoder` whatever the ``contour_decoder`` of the
+        head, as irfft is not exportable. NMS is left to the runtime.
 
-        if self.mask_nms:
-            '''1 mask->min_bbox->nms, performance same to origin box'''
-            _mlvl_bboxes = torch.stack([_mlvl_masks[:, 0].min(1)[0],
-                                        _mlvl_masks[:, 1].min(1)[0],
-                                        _mlvl_masks[:, 0].max(1)[0],
-                                        _mlvl_masks[:, 1].max(1)[0]], -1)
-            det_bboxes, det_labels, det_masks = multiclass_nms_with_mask(
-                _mlvl_bboxes,
-                mlvl_scores,
-                _mlvl_masks,
-                cfg.score_thr,
-                cfg.nms,
-                cfg.max_per_img,
-                score_factors=mlvl_centerness + self.centerness_factor)
+        Args:
+            img_shape (tuple): shape of the (padded) input images, the boxes
+                and contours are clipped to it.
+            nms_pre (int): number of candidates kept per level.
 
-        else:
-            '''2 origin bbox->nms, performance same to mask->min_bbox'''
-            det_bboxes, det_labels, det_masks = multiclass_nms_with_mask(
-                _mlvl_bboxes,
-                mlvl_scores,
-                _mlvl_masks,
-                cfg.score_thr,
-                cfg.nms,
-                cfg.max_per_img,
-                score_factors=mlvl_centerness + self.centerness_factor)
+        Returns:
+            tuple: boxes (N, k, 4), class scores (N, k, num_classes - 1),
+                centerness (N, k) and contours (N, k, 2, contour_points) of
+                the k candidates of every image.
+        """
+        num_imgs = cls_scores[0].size(0)
+        featmap_sizes = [featmap.size()[-2:] for featmap in cls_scores]
+        mlvl_points = self.get_points(featmap_sizes, bbox_preds[0].dtype,
+                                      bbox_preds[0].device)
+        decoder = self.contour_decoder
+        if not isinstance(decoder, FourierMatmulDecoder):
+            decoder = FourierMatmulDecoder(self.contour_points, self.num_coe,
+                                           self.use_fourier)
+            decoder = decoder.to(bbox_preds[0].device)
+        mlvl_bboxes, mlvl_scores, mlvl_centerness, mlvl_masks = [], [], [], []
+        for cls_score, bbox_pred, mask_pred, centerness, points in zip(
+                cls_scores, bbox_preds, mask_preds, centernesses, mlvl_points):
+            scores = cls_score.permute(0, 2, 3, 1).reshape(
+                num_imgs, -1, self.cls_out_channels).sigmoid()
+            centerness = centerness.permute(0, 2, 3, 1).reshape(num_imgs, -1)
+            centerness = centerness.sigmoid()
+            bbox_pred = bbox_pred.permute(0, 2, 3, 1).reshape(num_imgs, -1, 4)
+            mask_pred = mask_pred.permute(0, 2, 3, 1)
+            mask_pred = mask_pred.reshape(num_imgs, scores.size(1), -1)
+            points = points.expand(num_imgs, -1, -1)
+            if 0 < nms_pre < scores.size(1):
+                max_scores, _ = (scores * centerness[..., None]).max(dim=-1)
+                _, topk_inds = max_scores.topk(nms_pre, dim=1)
+                centerness = centerness.gather(1, topk_inds)
+                topk_inds = topk_inds[..., None]
+                points = points.gather(1, topk_inds.expand(-1, -1, 2))
+                bbox_pred = bbox_pred.gather(1, topk_inds.expand(-1, -1, 4))
+                scores = scores.gather(
+                    1, topk_inds.expand(-1, -1, scores.size(-1)))
+                mask_pred = mask_pred.gather(
+                    1, topk_inds.expand(-1, -1, mask_pred.size(-1)))
+            points = points.reshape(-1, 2)
+            if self.use_fourier:
+                mask_pred = mask_pred.reshape(points.size(0), self.num_coe, 2)
+            else:
+                mask_pred = mask_pred.reshape(
+                    points.size(0), self.contour_points)
+            masks, _ = decoder(
+                points,
+                mask_pred,
+                num_coe=self.visulize_coe,
+                max_shape=img_shape)
+            if self.bbox_from_mask:
+                bboxes = self.contour_bboxes(masks)
+            else:
+                bboxes = distance2bbox(
+                    points, bbox_pred.reshape(-1, 4), max_shape=img_shape)
+            mlvl_bboxes.append(bboxes.reshape(num_imgs, -1, 4))
+            mlvl_scores.append(scores)
+            mlvl_centerness.append(centerness)
+            mlvl_masks.append(
+                masks.reshape(num_imgs, -1, 2, self.contour_points))
+        mlvl_outs = (mlvl_bboxes, mlvl_scores, mlvl_centerness, mlvl_masks)
+        return tuple(torch.cat(outs, dim=1) for outs in mlvl_outs)
 
-        return det_bboxes, det_labels, det_masks
+    def masks_mapping_back(self, masks, img_meta):
+        """Map contours of an augmented image back to the original image.
+
+        Horizontally flipped contours are mirrored like the boxes in
+        :func:`bbox_mapping_back`.
+        """
+        if img_meta['flip']:
+            img_w = img_meta['img_shape'][1]
+            masks = torch.stack([img_w - masks[:, 0] - 1, masks[:, 1]], dim=1)
+        return self.rescale_masks(masks, img_meta['scale_factor'])
+
+    @force_fp32(apply_to=('cls_scores', 'bbox_preds', 'centernesses'))
+    def get_bboxes_aug(self,
+                       cls_scores,
+                       bbox_preds,
+                       centernesses,
+                       mask_preds,
+                       img_metas,
+                       cfg,
+                       rescale=False):
+        """Detect objects in images with test time augmentation.
+
+        The outputs of all augmentations are batched, the ones of the i-th
+        augmentation of the j-th image are at index ``i * num_imgs + j``.
+        The candidates of all augmentations of an image are mapped back to
+        the original image and merged by a single nms. With
+        ``decode_after_nms`` only the contours of the survivors are decoded,
+        each at the scale of its augmentation, and then mirrored if needed.
+
+        Args:
+            img_metas (list[list[dict]]): meta of every augmentation (outer)
+                of every image (inner).
+            rescale (bool): return the detections at the original scale,
+                otherwise at the scale of the first augmentation.
+
+        Returns:
+            list[tuple]: boxes, labels and contours of every image.
+        """
+        num_levels = len(cls_scores)
+        num_augs, num_imgs = len(img_metas), len(img_metas[0])
+        featmap_sizes = [featmap.size()[-2:] for featmap in cls_scores]
+        mlvl_points = self.get_points(featmap_sizes, bbox_preds[0].dtype,
+                                      bbox_preds[0].device)
+        decode_after_nms = self._decode_after_nms(cfg)
+        result_list = []
+        for img_id in range(num_imgs):
+            aug_bboxes, aug_scores, aug_centerness = [], [], []
+            aug_masks, aug_points, aug_ids = [], [], []
+            for aug_id in range(num_augs):
+                ind = aug_id * num_imgs + img_id
+                img_meta = img_metas[aug_id][img_id]
+                candidates = self.get_candidates_single(
+                    [cls_scores[i][ind].detach() for i in range(num_levels)],
+                    [bbox_preds[i][ind].detach() for i in range(num_levels)],
+                    [mask_preds[i][ind].detach() for i in range(num_levels)],
+                    [centernesses[i][ind].detach() for i in range(num_levels)],
+                    mlvl_points,
+                    img_meta['img_shape'],
+                    cfg,
+                    decode=not decode_after_nms)
+                bboxes, scores, centerness, masks, points = candidates
+                bboxes = bbox_mapping_back(
+                    bboxes, img_meta['img_shape'],
+                    bboxes.new_tensor(img_meta['scale_factor']),
+                    img_meta['flip'])
+                if decode_after_nms:
+                    aug_points.append(points)
+                else:
+                    masks = self.masks_mapping_back(masks, img_meta)
+                    if self.mask_nms:
+                        bboxes = self.contour_bboxes(masks)
+                aug_bboxes.append(bboxes)
+                aug_scores.append(scores)
+                aug_centerness.append(centerness)
+                aug_masks.append(masks)
+                aug_ids.append(
+                    bboxes.new_full((bboxes.size(0), ),
+                                    aug_id,
+                                    dtype=torch.long))
+            bboxes = torch.cat(aug_bboxes)
+            scores = torch.cat(aug_scores)
+            score_factors = torch.cat(aug_centerness) + self.centerness_factor
+            masks = torch.cat(aug_masks)
+            if decode_after_nms:
+                inds = torch.arange(
+                    masks.size(0), device=masks.device)[:, None]
+                det_bboxes, det_labels, det_inds = multiclass_nms_with_mask(
+                    bboxes,
+                    scores,
+                    inds,
+                    cfg.score_thr,
+                    cfg.nms,
+                    cfg.max_per_img,
+                    score_factors=score_factors)
+                det_inds = det_inds.reshape(-1).long()
+                num_coe = None
+                adaptive_coe = cfg.get('adaptive_coe', None)
+                if self.use_fourier and adaptive_coe is not None:
+                    num_coe = self.adaptive_num_coe(det_bboxes[:, :4],
+                                                    **adaptive_coe)
+                points = torch.cat(aug_points)[det_inds]
+                masks = masks[det_inds]
+                det_aug_ids = torch.cat(aug_ids)[det_inds]
+                det_masks = det_bboxes.new_zeros(
+                    (det_bboxes.size(0), 2, self.contour_points))
+                for aug_id in det_aug_ids.unique().tolist():
+                    img_meta = img_metas[aug_id][img_id]
+                    aug_inds = (det_aug_ids == aug_id).nonzero(
+                        as_tuple=True)[0]
+                    aug_num_coe = num_coe
+                    if isinstance(num_coe, Tensor):
+                        aug_num_coe = num_coe[aug_inds]
+                    aug_masks, _ = self.distance2mask(
+                        points[aug_inds],
+                        masks[aug_inds],
+                        max_shape=img_meta['img_shape'],
+                        num_coe=aug_num_coe)
+                    det_masks[aug_inds] = self.masks_mapping_back(
+                        aug_masks, img_meta)
+            else:
+                det_bboxes, det_labels, det_masks = multiclass_nms_with_mask(
+                    bboxes,
+                    scores,
+                    masks,
+                    cfg.score_thr,
+                    cfg.nms,
+                    cfg.max_per_img,
+                    score_factors=score_factors)
+            if not rescale:
+                scale_factor = img_metas[0][img_id]['scale_factor']
+                det_bboxes[:, :4] *= det_bboxes.new_tensor(scale_factor)
+                det_masks = self.rescale_masks(det_masks,
+                                               1 / np.asarray(scale_factor))
+            result_list.append((det_bboxes, det_labels, det_masks))
+        return result_list
+
+    def adaptive_num_coe(self, bboxes, sizes, num_coe):
+        """Choose the number of Fourier coefficients of every detection.
+
+        Args:
+            bboxes (Tensor): detected boxes of shape (n, 4).
+            sizes (list[float]): ascending square root areas that split the
+                detections into size groups.
+            num_coe (list[int]): number of coefficients of every size group,
+                one more entry than ``sizes``. It is capped by visulize_coe.
+
+        Returns:
+            Tensor: LongTensor of shape (n, ).
+        """
+        assert len(num_coe) == len(sizes) + 1
+        box_sizes = ((bboxes[:, 2] - bboxes[:, 0]) *
+                     (bboxes[:, 3] - bboxes[:, 1])).clamp(min=0).sqrt()
+        groups = torch.bucketize(box_sizes, box_sizes.new_tensor(sizes))
+        num_coe = torch.tensor(
+            num_coe, device=bboxes.device).clamp(max=self.visulize_coe)
+        return num_coe[groups]
+
+    @staticmethod
+    def rescale_masks(masks, scale_factor):
+        """Map contours of shape (n, 2, contour_points) back to the original
+        image scale."""
+        scale_factor = masks.new_tensor(scale_factor)
+        if scale_factor.dim() > 0:
+            # (w_scale, h_scale, w_scale, h_scale) -> x and y scales
+            scale_factor = scale_factor[:2, None]
+        return masks / scale_factor
 
     # test
-    def distance2mask(self, points, distances, max_shape=None, train=False, bbox=None):
+    def distance2mask(self,
+                      points,
+                      distances,
+                      max_shape=None,
+                      train=False,
+                      bbox=None,
+                      num_coe=None):
         """Decode distance prediction to  mask points
         Args:
             points (Tensor): Shape (n, 2), [x, y].
@@ -768,42 +1415,18 @@ class FourierNetHead(nn.Module):
             max_shape (tuple): Shape of the image.
             train (bool): set true in training mode
             bbox (bool): clamp mask predictions which are outside the predicted bbox
+            num_coe (int | Tensor, optional): number of Fourier coefficients
+                used at test time, shared or per instance. Defaults to
+                visulize_coe.
 
         Returns:
             Tensor: Decoded masks.
         """
         if self.use_fourier:
+            distances = distances.reshape(-1, self.num_coe, 2)
             if train:
-                distances = torch.irfft(
-                    torch.cat([distances, torch.zeros(distances.shape[0], self.contour_points - self.num_coe, 2,
-                                                      device=points.device)], 1), 1, True, False).float().exp()
-
-            else:
-                distances = distances.reshape(-1, self.num_coe, 2)
-                distances = torch.irfft(
-                    torch.cat([distances[..., :self.visulize_coe, :],
-                               torch.zeros(distances.shape[0], self.contour_points - self.visulize_coe, 2,
-                                           device=points.device)], 1), 1, True, False).float().exp()
-
-        angles = torch.range(0, 359, self.interval, device=points.device) / 180 * math.pi
-        num_points = points.shape[0]
-        points = points[:, :, None].repeat(1, 1, angles.shape[0])
-        c_x, c_y = points[:, 0], points[:, 1]
-
-        sin = torch.sin(angles)
-        cos = torch.cos(angles)
-        sin = sin[None, :].repeat(num_points, 1)
-        cos = cos[None, :].repeat(num_points, 1)
-
-        x = distances * sin + c_x
-        y = distances * cos + c_y
-
-        if max_shape is not None:
-            x = x.clamp(min=0, max=max_shape[1] - 1)
-            y = y.clamp(min=0, max=max_shape[0] - 1)
-        if bbox is not None:
-            x = torch.max(torch.min(x, bbox[:, 2].unsqueeze(1)), bbox[:, 0].unsqueeze(1))
-            y = torch.max(torch.min(y, bbox[:, 3].unsqueeze(1)), bbox[:, 1].unsqueeze(1))
-
-        res = torch.cat([x[:, None, :], y[:, None, :]], dim=1)
-        return res, distances
+                num_coe = None
+            elif num_coe is None:
+                num_coe = self.visulize_coe
+        return self.contour_decoder(
+            points, distances, num_coe=num_coe, max_shape=max_shape, bbox=bbox)
@@ -4,6 +4,7 @@ import mmcv
 import numpy as np
 import pycocotools.mask as maskUtils
 import torch.nn as nn
+from mmcv.parallel import DataContainer as DC
 
 from mmdet.core import auto_fp16, get_classes, tensor2imgs
 from mmdet.utils import print_log
@@ -145,6 +146,8 @@ class BaseDetector(nn.Module, metaclass=ABCMeta):
             bbox_result, segm_result = result, None
 
         img_tensor = data['img'][0]
+        if isinstance(img_tensor, DC):
+            img_tensor = img_tensor.data[0]
         img_metas = data['img_meta'][0].data[0]
         imgs = tensor2imgs(img_tensor, **img_metas[0]['img_norm_cfg'])
         assert len(imgs) == len(img_metas)
@@ -24,7 +24,10 @@ class FourierNet(SingleStageDetector):
                       gt_masks=None,
                       gt_bboxes_ignore=None,
                       gt_centers=None,
-                      gt_max_centerness=None
+                      gt_max_centerness=None,
+                      gt_contour_points=None,
+                      gt_contour_offsets=None,
+                      gt_polar_targets=None
                       ):
 
         x = self.extract_feat(img)
@@ -36,22 +39,89 @@ class FourierNet(SingleStageDetector):
             gt_masks=gt_masks,
             gt_bboxes_ignore=gt_bboxes_ignore,
             gt_centers=gt_centers,
-            gt_max_centerness=gt_max_centerness
+            gt_max_centerness=gt_max_centerness,
+            gt_contour_points=gt_contour_points,
+            gt_contour_offsets=gt_contour_offsets,
+            gt_polar_targets=gt_polar_targets
         )
         return losses
 
+    def forward_test(self, imgs, img_metas, batched=False, **kwargs):
+        """Test a batch of images.
+
+        Unlike most detectors, FourierNet accepts any number of images per
+        batch without augmentation. With ``batched=True`` a list with the
+        result of every image is returned. Otherwise the batch must hold a
+        single image and its result is returned as is, like other detectors
+        do.
+        """
+        num_imgs = imgs[0].size(0)
+        if not batched and num_imgs != 1:
+            raise ValueError(
+                'a batch of {} images must be tested with batched=True'.format(
+                    num_imgs))
+        if len(imgs) == 1:
+            results = self.simple_test(imgs[0], img_metas[0], **kwargs)
+        else:
+            results = super(FourierNet, self).forward_test(
+                imgs, img_metas, **kwargs)
+        return results if batched else results[0]
+
     def simple_test(self, img, img_meta, rescale=False):
+        """Test images without augmentation.
+
+        Returns:
+            list[tuple]: bbox and mask results of every image in the batch.
+        """
+        bbox_list = self.simple_test_bboxes(img, img_meta, rescale=rescale)
+        return self.bbox_list2results(bbox_list, img_meta)
+
+    def simple_test_bboxes(self, img, img_meta, rescale=False):
+        """Boxes, labels and contours of every image in the batch, before
+        they are encoded by :meth:`simple_test`."""
         x = self.extract_feat(img)
         outs = self.bbox_head(x)
 
         bbox_inputs = outs + (img_meta, self.test_cfg, rescale)
-        bbox_list = self.bbox_head.get_bboxes(*bbox_inputs)
+        return self.bbox_head.get_bboxes(*bbox_inputs)
 
-        results = [
-            bbox_mask2result(det_bboxes, det_masks, det_labels, self.bbox_head.num_classes, img_meta[0])
-            for det_bboxes, det_labels, det_masks in bbox_list]
+    def aug_test(self, imgs, img_metas, rescale=False):
+        """Test images with augmentations (multi-scale, flip).
+
+        All augmentations run in one forward, the images of the smaller
+        scales are padded to the largest one. Their candidates are mapped
+        back to the original image and merged before NMS, see
+        :meth:`FourierNetHead.get_bboxes_aug`.
+
+        Returns:
+            list[tuple]: bbox and mask results of every image in the batch.
+        """
+        bbox_list = self.aug_test_bboxes(imgs, img_metas, rescale=rescale)
+        return self.bbox_list2results(bbox_list, img_metas[0])
+
+    def aug_test_bboxes(self, imgs, img_metas, rescale=False):
+        """Boxes, labels and contours of every image in the batch, before
+        they are encoded by :meth:`aug_test`."""
+        num_imgs = imgs[0].size(0)
+        pad_h = max(img.size(2) for img in imgs)
+        pad_w = max(img.size(3) for img in imgs)
+        batch_img = imgs[0].new_zeros(
+            (len(imgs) * num_imgs, imgs[0].size(1), pad_h, pad_w))
+        for i, img in enumerate(imgs):
+            batch_img[i * num_imgs:(i + 1) * num_imgs, :, :img.size(2),
+                      :img.size(3)] = img
+        x = self.extract_feat(batch_img)
+        outs = self.bbox_head(x)
 
-        bbox_results = results[0][0]
-        mask_results = results[0][1]
+        bbox_inputs = outs + (img_metas, self.test_cfg, rescale)
+        return self.bbox_head.get_bboxes_aug(*bbox_inputs)
 
-        return bbox_results, mask_results
+    def bbox_list2results(self, bbox_list, img_meta):
+        """Encode the boxes, labels and contours of every image to bbox and
+        mask results."""
+        return [
+            bbox_mask2result(det_bboxes, det_masks, det_labels,
+                             self.bbox_head.num_classes, meta)
+            for (det_bboxes, det_labels, det_masks), meta in zip(
+                bbox_list, img_meta)
+        ]
@@ -9,7 +9,7 @@ from .iou_loss import (BoundedIoULoss, GIoULoss, IoULoss, bounded_iou_loss,
 from .mse_loss import MSELoss, mse_loss
 from .smooth_l1_loss import SmoothL1Loss, smooth_l1_loss
 from .utils import reduce_loss, weight_reduce_loss, weighted_loss
-from .polar_iou_loss import PolarIOULoss
+from .polar_iou_loss import PolarIOULoss, polar_iou_loss
 
 __all__ = [
     'accuracy', 'Accuracy', 'cross_entropy', 'binary_cross_entropy',
@@ -17,5 +17,5 @@ __all__ = [
     'FocalLoss', 'smooth_l1_loss', 'SmoothL1Loss', 'balanced_l1_loss',
     'BalancedL1Loss', 'mse_loss', 'MSELoss', 'iou_loss', 'bounded_iou_loss',
     'IoULoss', 'BoundedIoULoss', 'GIoULoss', 'GHMC', 'GHMR', 'reduce_loss',
-    'weight_reduce_loss', 'weighted_loss', 'PolarIOULoss'
+    'weight_reduce_loss', 'weighted_loss', 'PolarIOULoss', 'polar_iou_loss'
 ]
@@ -34,7 +34,13 @@ def sigmoid_focal_loss(pred,
                        avg_factor=None):
     # Function.apply does not accept keyword arguments, so the decorator
     # "weighted_loss" is not applicable
-    loss = _sigmoid_focal_loss(pred, target, gamma, alpha)
+    if pred.is_cuda:
+        loss = _sigmoid_focal_loss(pred, target, gamma, alpha)
+    else:
+        # the compiled op is CUDA only, labels are 1-based with 0 as background
+        one_hot_target = F.one_hot(target, pred.size(1) + 1)[:, 1:]
+        loss = py_sigmoid_focal_loss(
+            pred, one_hot_target, gamma=gamma, alpha=alpha, reduction='none')
     # TODO: find a proper way to handle the shape of weight
     if weight is not None:
         weight = weight.view(-1, 1)
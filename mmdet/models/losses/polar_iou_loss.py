@@ -1,30 +1,88 @@
+import torch
 import torch.nn as nn
+from torch.autograd import Function
+from torch.autograd.function import once_differentiable
+
 from ..registry import LOSSES
-import torch
+from .utils import weight_reduce_loss
+
+
+def polar_iou_loss(pred, target):
+    """Polar IoU loss of every instance.
+
+    ``log(sum(max(d, d*)) / sum(min(d, d*)))`` over the rays, computed with
+    elementwise max and min, autograd only keeps the two sums.
+
+    Args:
+        pred (Tensor): predicted distances of shape (n, contour_points).
+        target (Tensor): target distances of shape (n, contour_points).
+
+    Returns:
+        Tensor: shape (n, ).
+    """
+    l_max = torch.max(pred, target).sum(dim=1)
+    l_min = torch.min(pred, target).sum(dim=1)
+    return (l_max / l_min).log()
+
+
+class PolarIoULossFunction(Function):
+    """:func:`polar_iou_loss` with a hand written backward.
+
+    Every ray is either in the sum of the max or of the min distances, so
+    the gradient of a prediction is ``1 / sum(max)`` or ``-1 / sum(min)``.
+    The backward is a single ``where`` on the inputs and the two sums.
+    """
+
+    @staticmethod
+    def forward(ctx, pred, target):
+        l_max = torch.max(pred, target).sum(dim=1)
+        l_min = torch.min(pred, target).sum(dim=1)
+        ctx.save_for_backward(pred, target, l_max, l_min)
+        return (l_max / l_min).log()
+
+    @staticmethod
+    @once_differentiable
+    def backward(ctx, grad_output):
+        pred, target, l_max, l_min = ctx.saved_tensors
+        grad_max = (grad_output / l_max)[:, None]
+        grad_min = (-grad_output / l_min)[:, None]
+        pred_is_max = pred > target
+        grad_pred = grad_target = None
+        if ctx.needs_input_grad[0]:
+            grad_pred = torch.where(pred_is_max, grad_max, grad_min)
+        if ctx.needs_input_grad[1]:
+            grad_target = torch.where(pred_is_max, grad_min, grad_max)
+        return grad_pred, grad_target
+
+
+fused_polar_iou_loss = PolarIoULossFunction.apply
 
 
 @LOSSES.register_module
 class PolarIOULoss(nn.Module):
-    def __init__(self):
+    """Polar IoU loss of PolarMask, https://arxiv.org/abs/1909.13226.
+
+    Args:
+        fused (bool): use :class:`PolarIoULossFunction`, which computes the
+            gradients directly instead of through the autograd graph of max,
+            min, sum and log.
+    """
+
+    def __init__(self, fused=False):
         super(PolarIOULoss, self).__init__()
+        self.fused = fused
 
-    def forward(self, pred, target, weight, avg_factor=None):
+    def forward(self, pred, target, weight=None, avg_factor=None):
         """
-         :param pred:  shape (N,36), N is nr_box
-         :param target: shape (N,36)
-         :return: loss
-
         Args:
-
-            avg_factor:
-            weight:
-         """
-
-        total = torch.stack([pred, target], -1)
-        l_max = total.max(dim=2)[0]
-        l_min = total.min(dim=2)[0]
-
-        loss = (l_max.sum(dim=1) / l_min.sum(dim=1)).log()
-        loss = loss * weight
-        loss = loss.sum() / avg_factor
-        return loss
+            pred (Tensor): predicted distances of shape (n, contour_points).
+            target (Tensor): target distances of shape (n, contour_points).
+            weight (Tensor, optional): weight of every instance, shape (n, ).
+            avg_factor (float, optional): the weighted sum is divided by it,
+                otherwise the mean is returned.
+        """
+        if self.fused:
+            loss = fused_polar_iou_loss(pred, target)
+        else:
+            loss = polar_iou_loss(pred, target)
+        return weight_reduce_loss(loss, weight, 'mean', avg_factor)
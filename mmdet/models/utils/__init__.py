@@ -1,5 +1,7 @@
 from .conv_module import ConvModule, build_conv_layer
 from .conv_ws import ConvWS2d, conv_ws_2d
+from .fourier_decoder import (FourierContourDecoder, FourierMatmulDecoder,
+                              distance2fourier, fourier2distance, irfft_basis)
 from .norm import build_norm_layer
 from .scale import Scale
 from .upsample import build_upsample_layer
@@ -9,5 +11,7 @@ from .weight_init import (bias_init_with_prob, kaiming_init, normal_init,
 __all__ = [
     'conv_ws_2d', 'ConvWS2d', 'build_conv_layer', 'ConvModule',
     'build_norm_layer', 'build_upsample_layer', 'xavier_init', 'normal_init',
-    'uniform_init', 'kaiming_init', 'bias_init_with_prob', 'Scale'
+    'uniform_init', 'kaiming_init', 'bias_init_with_prob', 'Scale',
+    'FourierContourDecoder', 'FourierMatmulDecoder', 'fourier2distance',
+    'distance2fourier', 'irfft_basis'
 ]
@@ -0,0 +1,200 @@
+import math
+
+import torch
+import torch.nn as nn
+
+
+def fourier2distance(coes, contour_points, num_coe=None):
+    """Decode Fourier coefficients of the log distances to polar distances.
+
+    Args:
+        coes (Tensor): shape (n, num_coe, 2), real and imaginary parts of the
+            lowest frequencies of the log distances.
+        contour_points (int): number of rays to decode.
+        num_coe (int, optional): only the first num_coe coefficients are used,
+            the higher frequencies are treated as zero.
+
+    Returns:
+        Tensor: distances of shape (n, contour_points), on the device of
+            ``coes``. Half precision inputs are decoded in float32.
+    """
+    if num_coe is not None:
+        coes = coes[..., :num_coe, :]
+    if coes.dtype != torch.float64:
+        coes = coes.float()
+    if coes.numel() == 0:
+        # MKL rejects empty transforms
+        return coes.new_zeros(coes.shape[:-2] + (contour_points, ))
+    coes = torch.view_as_complex(coes.contiguous())
+    return torch.fft.irfft(coes, n=contour_points, norm='ortho').exp()
+
+
+def irfft_basis(num_coe, contour_points, dtype=torch.float):
+    """Real matrix of the orthonormal irfft of num_coe coefficients.
+
+    ``fourier2distance(coes, contour_points).log()`` equals
+    ``coes.reshape(n, -1) @ irfft_basis(num_coe, contour_points)``, a plain
+    matmul without complex tensors that is exportable to ONNX.
+
+    Returns:
+        Tensor: shape (num_coe * 2, contour_points), the rows of the real
+            and imaginary parts of every frequency are interleaved like the
+            last dimension of ``coes``.
+    """
+    freqs = torch.arange(num_coe, dtype=torch.float64)
+    t = torch.arange(contour_points, dtype=torch.float64)
+    phases = 2 * math.pi * freqs[:, None] * t[None] / contour_points
+    # the conjugate frequencies double all but the DC and Nyquist terms,
+    # the frequencies above Nyquist are dropped like in irfft
+    weights = torch.full((num_coe, ), 2., dtype=torch.float64)
+    weights[0] = 1
+    if contour_points % 2 == 0 and num_coe > contour_points // 2:
+        weights[contour_points // 2] = 1
+    weights[contour_points // 2 + 1:] = 0
+    weights = weights[:, None] / math.sqrt(contour_points)
+    basis = torch.stack([weights * phases.cos(), -weights * phases.sin()],
+                        dim=1)
+    return basis.reshape(num_coe * 2, contour_points).to(dtype)
+
+
+def distance2fourier(distances, num_coe):
+    """Encode polar distances to their lowest Fourier coefficients.
+
+    Args:
+        distances (Tensor): shape (n, contour_points).
+        num_coe (int): number of coefficients to keep.
+
+    Returns:
+        Tensor: shape (n, num_coe, 2), real and imaginary parts.
+    """
+    coes = torch.fft.fft(distances, norm='ortho')
+    return torch.view_as_real(coes)[..., :num_coe, :]
+
+
+class FourierContourDecoder(nn.Module):
+    """Decode FourierNet mask predictions to contour points.
+
+    The sin/cos tables of the ray angles are computed once and registered as
+    non-persistent buffers, so they follow the module across devices without
+    being saved in checkpoints.
+
+    Args:
+        contour_points (int): number of rays of the decoded contour.
+        num_coe (int): number of predicted Fourier coefficients.
+        use_fourier (bool): if False, the predictions are already distances.
+    """
+
+    def __init__(self, contour_points=360, num_coe=36, use_fourier=True):
+        super(FourierContourDecoder, self).__init__()
+        self.contour_points = contour_points
+        self.num_coe = num_coe
+        self.use_fourier = use_fourier
+        self.interval = 360 // contour_points
+        angles = torch.arange(
+            0, 360, self.interval, dtype=torch.float) / 180 * math.pi
+        self.register_buffer('sin', torch.sin(angles), persistent=False)
+        self.register_buffer('cos', torch.cos(angles), persistent=False)
+
+    def decode_distance(self, preds, num_coe=None):
+        """Decode mask predictions of shape (n, num_coe, 2) to distances.
+
+        ``num_coe`` may be a LongTensor of shape (n, ) holding the number of
+        coefficients of every instance, in which case instances sharing the
+        same count are decoded together with a single irfft.
+        """
+        if not self.use_fourier:
+            return preds
+        if not torch.is_tensor(num_coe):
+            return fourier2distance(preds, self.contour_points, num_coe)
+        dtype = torch.float64 if preds.dtype == torch.float64 else torch.float
+        distances = preds.new_empty((preds.size(0), self.contour_points),
+                                    dtype=dtype)
+        for group_coe in num_coe.unique().tolist():
+            inds = (num_coe == group_coe).nonzero().squeeze(1)
+            distances[inds] = fourier2distance(preds[inds],
+                                               self.contour_points, group_coe)
+        return distances
+
+    def forward(self, points, preds, num_coe=None, max_shape=None, bbox=None):
+        """Decode mask predictions to contour points.
+
+        Args:
+            points (Tensor): shape (n, 2), [x, y].
+            preds (Tensor): Fourier coefficients of shape (n, num_coe, 2) or
+                distances of shape (n, contour_points).
+            num_coe (int | Tensor, optional): number of coefficients used to
+                decode, either shared or per instance.
+            max_shape (tuple, optional): shape of the image.
+            bbox (Tensor, optional): clamp the contours inside these boxes.
+
+        Returns:
+            tuple: contours of shape (n, 2, contour_points) and distances of
+                shape (n, contour_points).
+        """
+        distances = self.decode_distance(preds, num_coe)
+        contours = self.distance2contour(points, distances, max_shape, bbox)
+        return contours, distances
+
+    def distance2contour(self, points, distances, max_shape=None, bbox=None):
+        """Decode polar distances of shape (n, contour_points) to contours."""
+        sin = self.sin.to(device=distances.device, dtype=distances.dtype)
+        cos = self.cos.to(device=distances.device, dtype=distances.dtype)
+        points = points.to(distances.dtype)
+        x = torch.addcmul(points[:, 0, None], distances, sin)
+        y = torch.addcmul(points[:, 1, None], distances, cos)
+
+        if max_shape is not None:
+            x.clamp_(min=0, max=max_shape[1] - 1)
+            y.clamp_(min=0, max=max_shape[0] - 1)
+        if bbox is not None:
+            x = torch.max(torch.min(x, bbox[:, 2, None]), bbox[:, 0, None])
+            y = torch.max(torch.min(y, bbox[:, 3, None]), bbox[:, 1, None])
+
+        return torch.stack([x, y], dim=1)
+
+
+class FourierMatmulDecoder(FourierContourDecoder):
+    """FourierContourDecoder computing the irfft as a single matmul.
+
+    With few coefficients and rays, the real DFT basis of
+    :func:`irfft_basis` is a small matrix, so decoding is one GEMM followed
+    by one exp and one multiply-add with the sin/cos table, without complex
+    tensors, padding to the full spectrum or per group calls for per
+    instance coefficient counts. It also is exportable to ONNX.
+    """
+
+    def __init__(self, contour_points=360, num_coe=36, use_fourier=True):
+        super(FourierMatmulDecoder, self).__init__(contour_points, num_coe,
+                                                   use_fourier)
+        self.register_buffer(
+            'basis', irfft_basis(num_coe, contour_points), persistent=False)
+        self.register_buffer(
+            'trig', torch.stack([self.sin, self.cos]), persistent=False)
+
+    def decode_distance(self, preds, num_coe=None):
+        if not self.use_fourier:
+            return preds
+        dtype = torch.float64 if preds.dtype == torch.float64 else torch.float
+        preds = preds.to(dtype)
+        basis = self.basis.to(device=preds.device, dtype=dtype)
+        if torch.is_tensor(num_coe):
+            # zero the coefficients above the count of every instance
+            keep = torch.arange(
+                self.num_coe, device=preds.device) < num_coe[:, None]
+            preds = preds * keep[..., None].to(dtype)
+        elif num_coe is not None:
+            preds = preds[:, :num_coe]
+            basis = basis[:num_coe * 2]
+        return preds.reshape(preds.size(0), -1).matmul(basis).exp()
+
+    def distance2contour(self, points, distances, max_shape=None, bbox=None):
+        if bbox is not None:
+            return super(FourierMatmulDecoder, self).distance2contour(
+                points, distances, max_shape, bbox)
+        trig = self.trig.to(device=distances.device, dtype=distances.dtype)
+        contours = torch.addcmul(points[:, :, None].to(distances.dtype),
+                                 distances[:, None], trig)
+        if max_shape is not None:
+            contours[:, 0].clamp_(min=0, max=max_shape[1] - 1)
+            contours[:, 1].clamp_(min=0, max=max_shape[0] - 1)
+        return contours
@@ -0,0 +1,75 @@
+import argparse
+import time
+
+import torch
+
+from mmdet.models.utils import FourierContourDecoder, FourierMatmulDecoder
+
+
+def timeit(decoder, points, coes, num_coe, max_shape, repeat):
+    with torch.no_grad():
+        decoder(points, coes, num_coe=num_coe, max_shape=max_shape)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            decoder(points, coes, num_coe=num_coe, max_shape=max_shape)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    """irfft against matmul decoding of FourierNet contours on CPU.
+
+    Sample run with 36 coefficients, 60 rays, clamped to the image, on a
+    single CPU thread:
+
+    candidates  irfft      matmul     per-instance num_coe: irfft     matmul
+    1000        0.29 ms    0.18 ms    2.04 ms                         0.41 ms
+    2000        0.68 ms    0.39 ms    3.02 ms                         1.01 ms
+    5000        1.43 ms    1.09 ms    5.24 ms                         2.17 ms
+    10000       3.92 ms    1.96 ms    8.68 ms                         4.66 ms
+    20000       7.41 ms    4.01 ms    17.46 ms                        10.50 ms
+
+    The GEMM with the (72, 60) basis replaces the complex view, the
+    padding to the full spectrum and the irfft, and the x/y multiply-add
+    with the sin/cos table runs as one kernel. Per instance coefficient
+    counts (adaptive_coe) mask the coefficients instead of decoding every
+    group separately.
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark the FourierNet contour decoders')
+    parser.add_argument(
+        '--num-candidates',
+        type=int,
+        nargs='+',
+        default=[1000, 2000, 5000, 10000, 20000])
+    parser.add_argument('--num-coe', type=int, default=36)
+    parser.add_argument('--contour-points', type=int, default=60)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    decoders = [
+        FourierContourDecoder(args.contour_points, args.num_coe),
+        FourierMatmulDecoder(args.contour_points, args.num_coe)
+    ]
+    max_shape = (800, 1216)
+    print('{:<12}{:<11}{:<11}{:<32}{}'.format('candidates', 'irfft',
+                                              'matmul',
+                                              'per-instance num_coe: irfft',
+                                              'matmul'))
+    for num in args.num_candidates:
+        points = torch.rand(num, 2) * 800
+        coes = torch.randn(num, args.num_coe, 2) * 0.3
+        coes[:, 0, 0] += 20
+        num_coe = torch.randint(4, args.num_coe + 1, (num, ))
+        times = [
+            timeit(decoder, points, coes, n, max_shape, args.repeat) * 1000
+            for n in (None, num_coe) for decoder in decoders
+        ]
+        print('{:<12}{:<11}{:<11}{:<32}{:.2f} ms'.format(
+            num, '{:.2f} ms'.format(times[0]), '{:.2f} ms'.format(times[1]),
+            '{:.2f} ms'.format(times[2]), times[3]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import argparse
+import contextlib
+import io
+import time
+
+import mmcv
+import pycocotools.mask as mask_util
+import torch
+from mmcv.runner import load_checkpoint
+from pycocotools.coco import COCO
+from pycocotools.cocoeval import COCOeval
+
+from mmdet.core import bbox_mask2result
+from mmdet.datasets import build_dataloader, build_dataset
+from mmdet.models import build_detector
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the reduced precision and channels last '
+        'inference of the FourierNet head')
+    parser.add_argument('config', help='test config file path')
+    parser.add_argument('checkpoint', help='checkpoint file')
+    parser.add_argument('--num-images', type=int, default=20)
+    parser.add_argument(
+        '--dtypes',
+        nargs='+',
+        choices=['fp32', 'fp16', 'bf16'],
+        default=['fp32', 'bf16'],
+        help='tower dtypes, fp16 runs as bf16 on CPU')
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument(
+        '--agreement-thr',
+        type=float,
+        default=0.3,
+        help='score threshold of the fp32 detections used as ground truth '
+        'of the agreement AP')
+    return parser.parse_args()
+
+
+def build_model(cfg, checkpoint, dtype, channels_last, device):
+    cfg.model.bbox_head.inference_dtype = None if dtype == 'fp32' else dtype
+    cfg.model.bbox_head.channels_last = channels_last
+    model = build_detector(cfg.model, train_cfg=None, test_cfg=cfg.test_cfg)
+    load_checkpoint(model, checkpoint, map_location='cpu', logger='silent')
+    return model.to(device).eval()
+
+
+def synchronize(device):
+    if torch.device(device).type == 'cuda':
+        torch.cuda.synchronize()
+
+
+def run(model, data_loader, device):
+    """Results of every image and the head and total time per image."""
+    results = []
+    head_time = total_time = 0
+    for data in data_loader:
+        img = data['img'][0].data[0].to(device)
+        img_meta = data['img_meta'][0].data[0]
+        with torch.no_grad():
+            synchronize(device)
+            start = time.perf_counter()
+            x = model.extract_feat(img)
+            synchronize(device)
+            head_start = time.perf_counter()
+            outs = model.bbox_head(x)
+            synchronize(device)
+            head_time += time.perf_counter() - head_start
+            det_bboxes, det_labels, det_masks = model.bbox_head.get_bboxes(
+                *outs, img_meta, model.test_cfg, rescale=True)[0]
+            results.append(
+                bbox_mask2result(det_bboxes, det_masks, det_labels,
+                                 model.bbox_head.num_classes, img_meta[0]))
+            synchronize(device)
+            total_time += time.perf_counter() - start
+    num_imgs = len(results)
+    return results, head_time / num_imgs, total_time / num_imgs
+
+
+def coco_eval(coco_gt, dets, img_ids):
+    if len(dets) == 0:
+        return 0.
+    with contextlib.redirect_stdout(io.StringIO()):
+        coco_dt = coco_gt.loadRes(dets)
+        coco_eval = COCOeval(coco_gt, coco_dt, 'segm')
+        coco_eval.params.imgIds = img_ids
+        coco_eval.evaluate()
+        coco_eval.accumulate()
+        coco_eval.summarize()
+    return coco_eval.stats[0]
+
+
+def nonempty(dets):
+    return [det for det in dets if mask_util.area(det['segmentation']) > 0]
+
+
+def agreement_gt(dataset, dets, score_thr):
+    """The detections of the fp32 model above ``score_thr`` as ground
+    truth."""
+    anns = []
+    for det in dets:
+        if det['score'] >= score_thr:
+            anns.append(
+                dict(
+                    det,
+                    id=len(anns) + 1,
+                    iscrowd=0,
+                    area=float(det['bbox'][2] * det['bbox'][3])))
+    coco = COCO()
+    coco.dataset = dict(
+        images=dataset.coco.dataset['images'],
+        categories=dataset.coco.dataset['categories'],
+        annotations=anns)
+    with contextlib.redirect_stdout(io.StringIO()):
+        coco.createIndex()
+    return coco
+
+
+def main():
+    """Latency and mask AP of the FourierNet head in reduced precision.
+
+    The towers and final convs of the head run under autocast with the
+    given dtype and, optionally, on channels last tensors. The segm AP is
+    computed on the first images of the test set, the agreement AP uses the
+    fp32 detections above --agreement-thr as ground truth, 1.0 means the
+    same masks as fp32. Empty masks are left out of the agreement AP.
+
+    Sample run on 3 images of a synthetic COCO set resized to 800x1067,
+    fourier_768_1x_r50_36_60.py with random head weights (so the segm AP is
+    meaningless), single thread of a CPU with AMX bf16:
+
+    dtype  channels_last  head       total      segm AP  agreement AP
+    fp32   False          2910.4 ms  7873.1 ms  0.000    1.000
+    fp32   True           2578.8 ms  7059.9 ms  0.000    1.000
+    bf16   False          1054.8 ms  5633.2 ms  0.000    0.959
+    bf16   True           615.2 ms   4972.2 ms  0.000    0.958
+
+    The towers are 4.7x faster in bf16 with channels last, the 3x3 convs
+    run on the bf16 matrix units and channels last saves the layout
+    conversions around every conv. The backbone stays in fp32. The contours
+    are decoded in fp32, the agreement AP loss comes from the scores and
+    coefficients rounded by bf16.
+    """
+    args = parse_args()
+    torch.set_num_threads(args.threads)
+
+    cfg = mmcv.Config.fromfile(args.config)
+    cfg.model.pretrained = None
+    cfg.data.test.test_mode = True
+    dataset = build_dataset(cfg.data.test)
+    dataset.img_infos = dataset.img_infos[:args.num_images]
+    dataset.img_ids = dataset.img_ids[:args.num_images]
+    data_loader = build_dataloader(
+        dataset, imgs_per_gpu=1, workers_per_gpu=0, dist=False, shuffle=False)
+    # cache the loaded images so that every run sees the same inputs
+    data_loader = list(data_loader)
+
+    print('{:<7}{:<15}{:<11}{:<11}{:<9}{}'.format(
+        'dtype', 'channels_last', 'head', 'total', 'segm AP', 'agreement AP'))
+    # the first run gives the ground truth of the agreement AP
+    dtypes = ['fp32'] + [dtype for dtype in args.dtypes if dtype != 'fp32']
+    coco_agreement = None
+    for dtype in dtypes:
+        for channels_last in (False, True):
+            model = build_model(cfg, args.checkpoint, dtype,
+                                channels_last, args.device)
+            # warm up
+            run(model, data_loader[:1], args.device)
+            results, head_time, total_time = run(model, data_loader,
+                                                 args.device)
+            dets = dataset._segm2json(results)[1]
+            if coco_agreement is None:
+                coco_agreement = agreement_gt(dataset, nonempty(dets),
+                                              args.agreement_thr)
+            segm_ap = coco_eval(dataset.coco, dets, dataset.img_ids)
+            agreement_ap = coco_eval(coco_agreement, nonempty(dets),
+                                     dataset.img_ids)
+            print('{:<7}{:<15}{:<11}{:<11}{:<9.3f}{:.3f}'.format(
+                dtype, str(channels_last),
+                '{:.1f} ms'.format(head_time * 1000),
+                '{:.1f} ms'.format(total_time * 1000), segm_ap,
+                agreement_ap))
+
+
+if __name__ == '__main__':
+    main()
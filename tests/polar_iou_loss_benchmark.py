@@ -0,0 +1,90 @@
+import argparse
+import time
+
+import torch
+
+from mmdet.models.losses import PolarIOULoss
+
+
+def stacked_polar_iou_loss(pred, target, weight, avg_factor):
+    """The previous implementation."""
+    total = torch.stack([pred, target], -1)
+    l_max = total.max(dim=2)[0]
+    l_min = total.min(dim=2)[0]
+    loss = (l_max.sum(dim=1) / l_min.sum(dim=1)).log()
+    return (loss * weight).sum() / avg_factor
+
+
+def saved_bytes(loss_func, pred, target, weight):
+    """Bytes of the tensors autograd keeps for the backward, not counting
+    the inputs."""
+    inputs = {t.data_ptr() for t in (pred, target, weight)}
+    saved = {}
+
+    def pack(t):
+        if t.data_ptr() not in inputs:
+            saved[t.data_ptr()] = t.numel() * t.element_size()
+        return t
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda t: t):
+        loss_func(pred, target, weight, avg_factor=1.)
+    return sum(saved.values())
+
+
+def timeit(loss_func, pred, target, weight, repeat):
+    loss_func(pred, target, weight, avg_factor=1.).backward()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        loss_func(pred, target, weight, avg_factor=1.).backward()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    """Forward and backward of PolarIOULoss on CPU.
+
+    Sample run with 60 rays, single CPU thread, time and memory kept for
+    the backward besides the inputs:
+
+    positives  stacked             elementwise         fused
+    1000       2.96 ms   0.93 MB   1.80 ms   0.01 MB   0.81 ms   0.01 MB
+    5000       13.09 ms  4.63 MB   9.31 ms   0.06 MB   3.28 ms   0.04 MB
+    20000      55.13 ms  18.54 MB  36.00 ms  0.23 MB   11.79 ms  0.15 MB
+
+    Without the stacked (n, rays, 2) tensor autograd no longer keeps the
+    int64 argmax and argmin of every ray, only the per instance sums. The
+    fused backward computes the gradient with one where instead of the
+    backward of max, min, sum, div and log.
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark the polar IoU loss')
+    parser.add_argument(
+        '--num-pos', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--contour-points', type=int, default=60)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    loss_funcs = [
+        stacked_polar_iou_loss,
+        PolarIOULoss(),
+        PolarIOULoss(fused=True)
+    ]
+    print('{:<11}{:<20}{:<20}{}'.format('positives', 'stacked', 'elementwise',
+                                        'fused'))
+    for num_pos in args.num_pos:
+        pred = (torch.rand(num_pos, args.contour_points) * 50 +
+                1).requires_grad_()
+        target = torch.rand(num_pos, args.contour_points) * 50 + 1
+        weight = torch.rand(num_pos)
+        columns = []
+        for loss_func in loss_funcs:
+            t = timeit(loss_func, pred, target, weight, args.repeat)
+            mem = saved_bytes(loss_func, pred, target, weight)
+            columns.append('{:<10}{:.2f} MB'.format(
+                '{:.2f} ms'.format(t * 1000), mem / 2**20))
+        print('{:<11}{:<20}{:<20}{}'.format(num_pos, *columns))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,992 @@
+"""
+CommandLine:
+    pytest tests/test_fouriernet.py
+"""
+import importlib.util
+import math
+import os.path as osp
+import threading
+
+import mmcv
+import numpy as np
+import pycocotools.mask as mask_util
+import pytest
+import torch
+from mmcv.parallel import DataContainer as DC
+from mmcv.parallel import collate
+from torch.autograd import gradcheck
+
+from mmdet.apis import (StreamingInference, inference_detector,
+                        inference_detector_batch, init_detector)
+from mmdet.core import bbox_mask2result
+from mmdet.datasets import CocoDataset, build_dataloader, build_dataset
+from mmdet.datasets.contour_cache import ContourCache
+from mmdet.datasets.pipelines import (FormatContours, LoadAnnotations,
+                                      PackContours, PolarTarget, RandomCrop,
+                                      RandomFlip, Resize)
+from mmdet.models.anchor_heads import FourierNetHead
+from mmdet.models.anchor_heads.fouriernet_head import (
+    INF, get_flatten_points, get_mask_sample_region, get_polar_coordinates,
+    get_polar_coordinates_batch, pack_contours, polar_centerness_target,
+    polar_centerness_target_batch)
+from mmdet.models.losses import PolarIOULoss, polar_iou_loss
+from mmdet.models.losses.polar_iou_loss import PolarIoULossFunction
+from mmdet.models.utils import (FourierContourDecoder, FourierMatmulDecoder,
+                                distance2fourier, fourier2distance)
+
+
+def _random_contours(num_gts, rng):
+    """Star-shaped integer contours of various sizes and vertex counts."""
+    contours = []
+    for _ in range(num_gts):
+        num_vertices = int(torch.randint(3, 400, (1, ), generator=rng))
+        center = torch.rand(2, generator=rng) * 300 + 50
+        radius = torch.rand(num_vertices, generator=rng) * 40 + 5
+        theta = torch.sort(torch.rand(num_vertices, generator=rng))[0]
+        theta = theta * 2 * math.pi
+        xy = torch.stack([
+            center[0] + radius * torch.cos(theta),
+            center[1] + radius * torch.sin(theta)
+        ], -1)
+        contours.append(xy.int())
+    return contours
+
+
+def test_polar_coordinates_batch_equivalence():
+    rng = torch.Generator().manual_seed(0)
+    contours = _random_contours(7, rng)
+    max_centerness = torch.rand(7, generator=rng, dtype=torch.float64)
+    max_centerness[3] = 0
+    num_pos = 200
+    contour_inds = torch.randint(0, 7, (num_pos, ), generator=rng)
+    # positive locations are points of a stride-8 feature map near the gts.
+    # The fractional offsets keep rays off exact integer degrees, where the
+    # truncation of float32 atan2 depends on how the kernel is vectorized.
+    centers = torch.stack([contours[i].float().mean(0) for i in contour_inds])
+    centers = (centers + torch.randint(-24, 25, (num_pos, 2), generator=rng)
+               ).div(8).floor() * 8 + centers.new_tensor([4.3, 4.6])
+
+    packed, offsets = pack_contours(contours)
+    assert offsets.tolist()[-1] == packed.size(0)
+    for n in (36, 60, 72, 360):
+        dists = get_polar_coordinates_batch(centers, packed, offsets,
+                                            contour_inds, n)
+        centerness = polar_centerness_target_batch(
+            dists, max_centerness[contour_inds])
+        assert dists.shape == (num_pos, n)
+        for p, i in enumerate(contour_inds.tolist()):
+            x, y = centers[p]
+            expected, _ = get_polar_coordinates(x, y, contours[i], n)
+            assert torch.equal(dists[p], expected)
+            expected_centerness = polar_centerness_target(
+                expected, max_centerness[i])
+            assert torch.allclose(centerness[p], expected_centerness)
+
+
+def test_polar_coordinates_batch_empty():
+    contours = [torch.IntTensor([[0, 0], [10, 0], [10, 10]])]
+    packed, offsets = pack_contours(contours)
+    dists = get_polar_coordinates_batch(
+        torch.zeros((0, 2)), packed, offsets, torch.zeros(0,
+                                                          dtype=torch.long),
+        36)
+    assert dists.shape == (0, 36)
+
+
+def test_mask_sample_region():
+    gt_bboxes = torch.Tensor([[10, 10, 60, 40], [0, 0, 20, 100]])
+    # [y, x]
+    centers = torch.Tensor([[20, 50], [50, 10]])
+    xs = torch.Tensor([44, 44, 62, 5, 5])
+    ys = torch.Tensor([14, 24, 24, 50, 50])
+    strides = torch.Tensor([8, 8, 8, 8, 2])
+    inside = get_mask_sample_region(
+        gt_bboxes, centers, strides, xs, ys, radius=1.5)
+    # regions of radius 12: x in (38, 60), y in (10, 32) for the first
+    # instance, x in (0, 20), y in (38, 62) for the second one
+    expected = torch.tensor([[True, False], [True, False], [False, False],
+                             [False, True], [False, False]])
+    assert torch.equal(inside, expected)
+
+
+def _dense_assignment(self, point_grid, gt_bboxes, gt_labels, gt_centers):
+    """Match all points against all instances at once, without the level
+    filter and chunks of ``polar_target_single``."""
+    areas = (gt_bboxes[:, 2] - gt_bboxes[:, 0] + 1) * (
+        gt_bboxes[:, 3] - gt_bboxes[:, 1] + 1)
+    if not self.use_mask_center:
+        gt_centers = torch.stack([(gt_bboxes[:, 1] + gt_bboxes[:, 3]) / 2,
+                                  (gt_bboxes[:, 0] + gt_bboxes[:, 2]) / 2], -1)
+    min_area, inds = self.assign_points(point_grid.points,
+                                        point_grid.regress_ranges,
+                                        point_grid.strides, gt_bboxes,
+                                        gt_centers, areas)
+    labels = torch.where(min_area != INF, gt_labels[inds],
+                         gt_labels.new_zeros(()))
+    return labels, inds
+
+
+@pytest.mark.parametrize('center_sample,use_mask_center', [(True, True),
+                                                           (False, True),
+                                                           (True, False)])
+def test_polar_target_chunked_assignment(center_sample, use_mask_center):
+    rng = torch.Generator().manual_seed(0)
+    contours = _random_contours(30, rng)
+    # instances of every level, up to 540 pixels wide
+    contours = [(c - c.float().mean(0)) * scale + c.float().mean(0)
+                for c, scale in zip(contours, [1, 3, 6] * 10)]
+    contours = [c.int() for c in contours]
+    gt_bboxes = torch.stack([
+        torch.cat([c.min(0)[0], c.max(0)[0]]).float() for c in contours
+    ])
+    gt_centers = torch.stack([c.float().mean(0).flip(0) for c in contours])
+    gt_labels = torch.randint(1, 4, (30, ), generator=rng)
+    feat_sizes = [(math.ceil(400 / s), math.ceil(400 / s))
+                  for s in (8, 16, 32, 64, 128)]
+
+    for max_assign_chunk in (None, 100):
+        self = _build_fouriernet_head(
+            strides=[8, 16, 32, 64, 128],
+            max_assign_chunk=max_assign_chunk,
+            center_sample=center_sample,
+            use_mask_center=use_mask_center)
+        point_grid = self.get_point_grid(feat_sizes, torch.float, 'cpu')
+        labels, bbox_targets, mask_targets, _ = [
+            torch.cat(lvl_targets)
+            for lvl_targets in self.polar_target(
+                point_grid, [gt_labels], [gt_bboxes],
+                [pack_contours(contours)], [gt_centers], [torch.ones(30)])
+        ]
+        expected_labels, inds = _dense_assignment(self, point_grid,
+                                                  gt_bboxes, gt_labels,
+                                                  gt_centers)
+        assert torch.equal(labels, expected_labels)
+        pos_inds = labels.nonzero().reshape(-1)
+        # the large instances are assigned to the upper levels
+        pos_levels = (pos_inds[:, None] >= torch.tensor(
+            point_grid.num_points).cumsum(0)).sum(1)
+        assert pos_levels.unique().numel() >= 4
+        points = point_grid.points[pos_inds]
+        pos_bboxes = gt_bboxes[inds[pos_inds]]
+        assert torch.equal(
+            bbox_targets[pos_inds],
+            torch.cat([points - pos_bboxes[:, :2], pos_bboxes[:, 2:] - points],
+                      -1))
+        assert torch.equal(
+            mask_targets[pos_inds],
+            get_polar_coordinates_batch(points, *pack_contours(contours),
+                                        inds[pos_inds], self.contour_points))
+
+
+def test_point_grid_cache():
+    self = _build_fouriernet_head(point_cache_size=1)
+    sizes = [(13, 20), (7, 10), (4, 5)]
+    point_grid = self.get_point_grid(sizes, torch.float, 'cpu')
+    assert self.get_point_grid(sizes, torch.float, 'cpu') is point_grid
+    assert self.get_points(sizes, torch.float, 'cpu') is point_grid.mlvl_points
+    assert point_grid.num_points == [260, 70, 20]
+    assert torch.equal(point_grid.strides[[0, 259, 260, 349]],
+                       torch.Tensor([8, 8, 16, 32]))
+    assert torch.equal(point_grid.regress_ranges[[259, 260]],
+                       torch.Tensor([[-1, 64], [64, 128]]))
+    # the least recently used grid is dropped
+    self.get_point_grid(sizes[:2], torch.float, 'cpu')
+    assert self.get_point_grid(sizes, torch.float, 'cpu') is not point_grid
+
+    num_imgs = 3
+    flatten_points = torch.cat([
+        points.repeat(num_imgs, 1) for points in point_grid.mlvl_points
+    ])
+    inds = torch.randperm(flatten_points.size(0))[:100]
+    assert torch.equal(
+        get_flatten_points(point_grid, inds, num_imgs), flatten_points[inds])
+
+
+def test_fourier_decoding_roundtrip():
+    contour_points = 60
+    log_dists = torch.rand(5, contour_points) * 3
+    # keeping every non-redundant frequency recovers the distances exactly
+    coes = distance2fourier(log_dists, contour_points // 2 + 1)
+    dists = fourier2distance(coes, contour_points)
+    assert dists.shape == (5, contour_points)
+    assert torch.allclose(dists, log_dists.exp(), rtol=1e-4)
+
+    # decoded contours follow the device and dtype of the predictions
+    decoder = FourierContourDecoder(contour_points, num_coe=36)
+    points = torch.rand(5, 2, dtype=torch.float64) * 100
+    contours, dists = decoder(
+        points, coes[:, :36].double(), max_shape=(80, 90))
+    assert contours.shape == (5, 2, contour_points)
+    assert contours.dtype == torch.float64
+    assert contours[:, 0].max() <= 89 and contours[:, 1].max() <= 79
+
+
+def _fouriernet_head_inputs(self, s=128):
+    img_metas = [{
+        'img_shape': (s, s, 3),
+        'ori_shape': (s, s, 3),
+        'scale_factor': 1.0,
+        'pad_shape': (s, s, 3)
+    }]
+    feats = [
+        torch.rand(1, 8, s // stride, s // stride) for stride in self.strides
+    ]
+    return img_metas, feats
+
+
+def _build_fouriernet_head(**kwargs):
+    head_cfg = dict(
+        num_classes=4,
+        in_channels=8,
+        feat_channels=8,
+        stacked_convs=1,
+        strides=[8, 16, 32, 64, 128],
+        loss_cls=dict(
+            type='FocalLoss',
+            use_sigmoid=True,
+            gamma=2.0,
+            alpha=0.25,
+            loss_weight=1.0),
+        loss_bbox=dict(type='IoULoss', loss_weight=1.0),
+        loss_centerness=dict(
+            type='CrossEntropyLoss', use_sigmoid=True, loss_weight=1.0),
+        loss_mask=dict(type='PolarIOULoss'),
+        contour_points=36,
+        use_fourier=True,
+        num_coe=16,
+        visulize_coe=16)
+    head_cfg.update(kwargs)
+    return FourierNetHead(**head_cfg)
+
+
+def _fouriernet_test_cfg(**kwargs):
+    test_cfg = dict(
+        nms_pre=100,
+        score_thr=0.0,
+        nms=dict(type='nms', iou_thr=0.5),
+        max_per_img=10)
+    test_cfg.update(kwargs)
+    return mmcv.Config(test_cfg)
+
+
+def test_fouriernet_head_loss_and_test_cpu():
+    self = _build_fouriernet_head()
+    img_metas, feats = _fouriernet_head_inputs(self)
+    outs = self.forward(feats)
+
+    theta = torch.arange(0, 2 * math.pi, 0.05)
+    contour = torch.stack([60 + 30 * torch.cos(theta),
+                           50 + 20 * torch.sin(theta)], -1).int()
+    gt_bboxes = [torch.Tensor([[30., 30., 90., 70.]])]
+    gt_labels = [torch.LongTensor([2])]
+    losses = self.loss(
+        *outs,
+        gt_bboxes,
+        gt_labels,
+        img_metas,
+        None,
+        gt_masks=[[contour]],
+        gt_centers=[torch.Tensor([[50., 60.]])],
+        gt_max_centerness=[torch.Tensor([1.])])
+    for name, loss in losses.items():
+        assert loss.item() > 0, '{} should be non-zero'.format(name)
+
+    det_bboxes, det_labels, det_masks = self.get_bboxes(
+        *outs, img_metas, _fouriernet_test_cfg(), rescale=True)[0]
+    assert det_bboxes.shape[1] == 5
+    assert det_masks.shape[1:] == (2, 36)
+
+
+def test_fouriernet_head_decode_after_nms():
+    self = _build_fouriernet_head()
+    img_metas, feats = _fouriernet_head_inputs(self)
+    img_metas[0]['scale_factor'] = [0.5, 0.25, 0.5, 0.25]
+    outs = self.forward(feats)
+
+    expected = self.get_bboxes(
+        *outs, img_metas, _fouriernet_test_cfg(), rescale=True)[0]
+    results = self.get_bboxes(
+        *outs,
+        img_metas,
+        _fouriernet_test_cfg(decode_after_nms=True),
+        rescale=True)[0]
+    for result, expected_result in zip(results, expected):
+        assert torch.allclose(result, expected_result)
+
+    # no candidate passes the score threshold
+    det_bboxes, det_labels, det_masks = self.get_bboxes(
+        *outs,
+        img_metas,
+        _fouriernet_test_cfg(decode_after_nms=True, score_thr=1.0),
+        rescale=True)[0]
+    assert len(det_bboxes) == len(det_masks) == 0
+
+
+@pytest.mark.parametrize('decode_after_nms', [False, True])
+def test_fouriernet_head_aug_test(decode_after_nms):
+    self = _build_fouriernet_head()
+    img_metas, feats = _fouriernet_head_inputs(self)
+    img_metas[0].update(scale_factor=0.5, flip=False)
+    s = img_metas[0]['img_shape'][1]
+    outs = self.forward(feats)
+    test_cfg = _fouriernet_test_cfg(decode_after_nms=decode_after_nms)
+    expected = self.get_bboxes(*outs, img_metas, test_cfg, rescale=True)[0]
+
+    # a single augmentation is the same as no augmentation
+    results = self.get_bboxes_aug(
+        *outs, [img_metas], test_cfg, rescale=True)[0]
+    for result, expected_result in zip(results, expected):
+        assert torch.allclose(result, expected_result)
+
+    # the flipped outputs are mirrored back
+    flip_metas = [dict(img_metas[0], flip=True)]
+    det_bboxes, det_labels, det_masks = self.get_bboxes_aug(
+        *outs, [flip_metas], test_cfg, rescale=True)[0]
+    assert torch.equal(det_labels, expected[1])
+    assert torch.allclose(det_bboxes[:, 4], expected[0][:, 4])
+    assert torch.allclose(det_bboxes[:, 0],
+                          (s - expected[0][:, 2] * 0.5 - 1) / 0.5)
+    assert torch.allclose(det_masks[:, 0],
+                          (s - expected[2][:, 0] * 0.5 - 1) / 0.5)
+    assert torch.allclose(det_masks[:, 1], expected[2][:, 1])
+
+    # candidates of all augmentations are merged before nms, the
+    # detections are at the scale of the first one without rescaling
+    batch_outs = [[torch.cat([out, out]) for out in level_outs]
+                  for level_outs in outs]
+    det_bboxes, det_labels, det_masks = self.get_bboxes_aug(
+        *batch_outs, [img_metas, flip_metas], test_cfg, rescale=False)[0]
+    assert len(det_bboxes) == len(det_masks) == test_cfg.max_per_img
+    assert det_masks.shape[1:] == (2, 36)
+    assert det_bboxes[:, 4].max() == expected[0][:, 4].max()
+    assert det_bboxes[:, :4].max() <= s
+
+
+def test_fouriernet_head_reduced_precision_inference():
+    self = _build_fouriernet_head()
+    self.init_weights()
+    self.eval()
+    fast = _build_fouriernet_head(inference_dtype='bf16', channels_last=True)
+    fast.load_state_dict(self.state_dict())
+    fast.eval()
+    assert fast.polar_mask.weight.is_contiguous(
+        memory_format=torch.channels_last)
+    _, feats = _fouriernet_head_inputs(self, s=256)
+    with torch.no_grad():
+        outs = self.forward(feats)
+        fast_outs = fast.forward(feats)
+    for level_outs, fast_level_outs in zip(outs, fast_outs):
+        for out, fast_out in zip(level_outs, fast_level_outs):
+            # the towers run in bf16, the outputs are decoded in fp32
+            assert fast_out.dtype == torch.float32
+            assert torch.allclose(out, fast_out, rtol=0.05, atol=0.05)
+    # training is not affected
+    fast.train()
+    assert fast.forward(feats)[0][0].dtype == torch.float32
+
+
+@pytest.mark.parametrize('shared_convs,merge_final_convs', [(1, False),
+                                                            (2, False),
+                                                            (2, True)])
+def test_fouriernet_head_shared_tower(shared_convs, merge_final_convs):
+    self = _build_fouriernet_head(
+        stacked_convs=2,
+        shared_convs=shared_convs,
+        merge_final_convs=merge_final_convs)
+    self.init_weights()
+    assert len(self.shared_convs) == shared_convs
+    # the head with separate towers and final convs and the same weights
+    separate = _build_fouriernet_head(stacked_convs=2)
+    state_dict = {}
+    for name, value in self.state_dict().items():
+        module, index, param = (name.split('.', 2) + [None])[:3]
+        if module == 'shared_convs':
+            for tower in ('cls_convs', 'reg_convs', 'mask_convs'):
+                state_dict['.'.join([tower, index, param])] = value
+        elif module in ('cls_convs', 'reg_convs', 'mask_convs'):
+            index = str(int(index) + shared_convs)
+            state_dict['.'.join([module, index, param])] = value
+        elif module == 'polar_merged':
+            for conv, conv_value in zip(
+                ('polar_mask', 'polar_centerness', 'polar_reg'),
+                    value.split(self.merged_channels)):
+                state_dict[conv + '.' + index] = conv_value
+        else:
+            state_dict[name] = value
+    separate.load_state_dict(state_dict)
+    _, feats = _fouriernet_head_inputs(self)
+    for level_outs, separate_level_outs in zip(
+            self.forward(feats), separate.forward(feats)):
+        for out, separate_out in zip(level_outs, separate_level_outs):
+            assert torch.allclose(out, separate_out, atol=1e-6)
+    # a grouped conv over separate towers would add MACs
+    with pytest.raises(AssertionError):
+        _build_fouriernet_head(
+            stacked_convs=2, shared_convs=1, merge_final_convs=True)
+
+
+def test_fouriernet_head_export_candidates():
+    self = _build_fouriernet_head()
+    img_metas, feats = _fouriernet_head_inputs(self)
+    feats = [torch.cat([feat, feat.flip(-1)]) for feat in feats]
+    outs = self.forward(feats)
+    img_shape = img_metas[0]['img_shape']
+    bboxes, scores, centerness, contours = self.get_candidates_export(
+        *outs, img_shape, nms_pre=100)
+    for img_id in range(2):
+        expected = self.get_candidates_single(
+            *[[out[img_id] for out in level_outs]
+              for level_outs in (outs[0], outs[1], outs[3], outs[2])],
+            self.get_points([f.shape[-2:] for f in feats], torch.float,
+                            'cpu'), img_shape, _fouriernet_test_cfg())
+        assert torch.allclose(bboxes[img_id], expected[0])
+        assert torch.allclose(scores[img_id], expected[1][:, 1:])
+        assert torch.allclose(centerness[img_id], expected[2])
+        assert torch.allclose(contours[img_id], expected[3], atol=1e-3)
+
+
+def test_polar_iou_loss():
+    pred = torch.rand(8, 36, dtype=torch.float64) * 10 + 1
+    target = torch.rand(8, 36, dtype=torch.float64) * 10 + 1
+    weight = torch.rand(8, dtype=torch.float64)
+
+    # the previous implementation
+    total = torch.stack([pred, target], -1)
+    expected = (total.max(dim=2)[0].sum(dim=1) /
+                total.min(dim=2)[0].sum(dim=1)).log()
+    assert torch.allclose(polar_iou_loss(pred, target), expected)
+    expected = (expected * weight).sum() / 3.
+    for fused in [False, True]:
+        loss = PolarIOULoss(fused=fused)(pred, target, weight, avg_factor=3.)
+        assert torch.allclose(loss, expected)
+
+    assert gradcheck(PolarIoULossFunction.apply,
+                     (pred.requires_grad_(), target.requires_grad_()))
+
+
+def test_fourier_decoding_grouped_num_coe():
+    decoder = FourierContourDecoder(60, num_coe=36)
+    coes = torch.randn(20, 36, 2) * 0.3
+    num_coe = torch.randint(1, 37, (20, ))
+    dists = decoder.decode_distance(coes, num_coe)
+    for i in range(20):
+        expected = fourier2distance(coes[i:i + 1], 60, int(num_coe[i]))
+        assert torch.allclose(dists[i], expected[0])
+
+
+def test_fourier_matmul_decoder():
+    decoder = FourierContourDecoder(60, num_coe=36)
+    matmul_decoder = FourierMatmulDecoder(60, num_coe=36)
+    points = torch.rand(20, 2) * 100
+    coes = torch.randn(20, 36, 2) * 0.3
+    coes[:, 0, 0] += 20
+    for num_coe in [None, 8, torch.randint(1, 37, (20, ))]:
+        contours, dists = decoder(
+            points, coes, num_coe=num_coe, max_shape=(90, 80))
+        matmul_contours, matmul_dists = matmul_decoder(
+            points, coes, num_coe=num_coe, max_shape=(90, 80))
+        assert torch.allclose(matmul_dists, dists, rtol=1e-4)
+        assert torch.allclose(matmul_contours, contours, atol=1e-3)
+
+    self = _build_fouriernet_head()
+    matmul_head = _build_fouriernet_head(contour_decoder='matmul')
+    matmul_head.load_state_dict(self.state_dict())
+    img_metas, feats = _fouriernet_head_inputs(self)
+    expected = self.get_bboxes(
+        *self.forward(feats), img_metas, _fouriernet_test_cfg(), rescale=True)
+    results = matmul_head.get_bboxes(
+        *matmul_head.forward(feats),
+        img_metas,
+        _fouriernet_test_cfg(),
+        rescale=True)
+    for result, expected_result in zip(results[0], expected[0]):
+        assert torch.allclose(result, expected_result, atol=1e-3)
+
+
+def test_fouriernet_head_adaptive_num_coe():
+    self = _build_fouriernet_head()
+    bboxes = torch.Tensor([[0, 0, 10, 10], [0, 0, 40, 40], [0, 0, 200, 100]])
+    num_coe = self.adaptive_num_coe(bboxes, sizes=[32, 96], num_coe=[4, 8, 36])
+    # the largest group is capped by visulize_coe
+    assert num_coe.tolist() == [4, 8, 16]
+
+    img_metas, feats = _fouriernet_head_inputs(self)
+    outs = self.forward(feats)
+    expected = self.get_bboxes(
+        *outs,
+        img_metas,
+        _fouriernet_test_cfg(decode_after_nms=True),
+        rescale=True)[0]
+    results = self.get_bboxes(
+        *outs,
+        img_metas,
+        _fouriernet_test_cfg(
+            decode_after_nms=True,
+            adaptive_coe=dict(sizes=[32], num_coe=[4, 16])),
+        rescale=True)[0]
+    assert torch.equal(results[0], expected[0])
+    large = ((expected[0][:, 2] - expected[0][:, 0]) *
+             (expected[0][:, 3] - expected[0][:, 1])).sqrt() > 32
+    assert torch.allclose(results[2][large], expected[2][large])
+
+
+def test_contour_cache_transforms(tmpdir):
+    contours = [
+        np.array([[10, 20], [30, 20], [30, 40]]),
+        np.array([[50, 60], [70, 60], [70, 90], [50, 90]])
+    ]
+    ContourCache.dump(
+        str(tmpdir), [9, 3], contours, [[20, 30], [60, 75]], [0.5, 0.8],
+        contour_points=36)
+    cache = ContourCache(str(tmpdir))
+    assert len(cache) == 2
+    cached, centers, max_centerness = cache.get([3, 9])
+    assert np.allclose(cached[0], contours[1])
+    assert np.allclose(centers, [[60, 75], [20, 30]])
+    assert np.allclose(max_centerness, [0.8, 0.5])
+
+    results = dict(
+        img=np.zeros((100, 100, 3), dtype=np.uint8),
+        gt_contours=cached,
+        gt_contour_centers=centers,
+        gt_max_centerness=max_centerness,
+        contour_fields=['gt_contours', 'gt_contour_centers'])
+    results = Resize(img_scale=(200, 200), keep_ratio=True)(results)
+    results = RandomFlip(flip_ratio=1.0)(results)
+    results = FormatContours()(results)
+    assert np.allclose(results['gt_masks'][0][0].numpy(), [199 - 100, 120])
+    # centers are [y, x] as produced by ConvertToContour
+    assert np.allclose(results['gt_centers'], [[150, 199 - 120],
+                                               [60, 199 - 40]])
+
+    # the cached max centerness only fits the number of rays of the cache
+    results = dict(
+        gt_contours=cached,
+        gt_max_centerness=max_centerness,
+        max_centerness_points=36)
+    with pytest.raises(ValueError):
+        FormatContours(contour_points=60)(results)
+    ann_file = str(tmpdir.join('ann.json'))
+    mmcv.dump(
+        dict(
+            images=[dict(id=1, file_name='a.jpg', height=100, width=100)],
+            annotations=[],
+            categories=[dict(id=1, name='a')]), ann_file)
+    dataset = CocoDataset(
+        ann_file,
+        [dict(type='FormatContours', contour_points=36)],
+        contour_cache=str(tmpdir))
+    assert dataset.contour_cache.meta['contour_points'] == 36
+    with pytest.raises(ValueError):
+        CocoDataset(
+            ann_file, [dict(type='FormatContours', contour_points=60)],
+            contour_cache=str(tmpdir))
+
+
+def test_polygon_contour_transforms():
+    results = dict(
+        img=np.zeros((100, 100, 3), dtype=np.uint8),
+        img_info=dict(height=100, width=100),
+        ann_info=dict(
+            bboxes=np.array([[10, 10, 40, 30], [60, 60, 90, 90]],
+                            dtype=np.float32),
+            labels=np.array([1, 2]),
+            masks=[[[10, 10, 40, 10, 40, 30, 10, 30], [0, 0, 2, 0, 2, 2]],
+                   [[60, 60, 90, 60, 90, 90, 60, 90]]]),
+        bbox_fields=[],
+        mask_fields=[],
+        contour_fields=[])
+    results = LoadAnnotations(with_contour=True)(results)
+    assert 'gt_masks' not in results
+    # the largest part is densified to one point per pixel of its edges
+    assert results['gt_contours'][0].shape == (100, 2)
+
+    np.random.seed(0)
+    results = RandomCrop(crop_size=(50, 50))(results)
+    assert len(results['gt_contours']) == len(results['gt_bboxes'])
+    assert results['gt_contours'][0].min() >= 0
+    assert results['gt_contours'][0].max() <= 49
+
+    results = FormatContours(contour_points=36)(results)
+    assert len(results['gt_masks']) == len(results['gt_centers']) == len(
+        results['gt_max_centerness'])
+    # contours are shifted and clipped like the boxes
+    assert np.allclose(results['gt_masks'][0].numpy().min(0),
+                       results['gt_bboxes'][0, :2])
+
+
+def test_packed_contour_targets():
+    rng = torch.Generator().manual_seed(0)
+    samples = []
+    for num_gts in (3, 1):
+        contours = _random_contours(num_gts, rng)
+        results = PackContours(keep_masks=True)(dict(gt_masks=contours))
+        assert results['gt_contour_points'].shape == (2, sum(
+            len(c) for c in contours))
+        assert torch.equal(results['gt_contour_points'][:, -1],
+                           contours[-1][-1])
+        samples.append(
+            dict(
+                gt_masks=contours,
+                gt_bboxes=torch.stack([
+                    torch.cat([c.min(0)[0], c.max(0)[0]]).float()
+                    for c in contours
+                ]),
+                gt_labels=torch.ones(num_gts, dtype=torch.long),
+                gt_centers=torch.stack(
+                    [c.float().mean(0).flip(0) for c in contours]),
+                gt_max_centerness=torch.ones(num_gts),
+                gt_contour_points=DC(
+                    results['gt_contour_points'], stack=True, pad_dims=1),
+                gt_contour_offsets=DC(
+                    results['gt_contour_offsets'], stack=True, pad_dims=1)))
+    batch = collate([{
+        key: sample[key]
+        for key in ('gt_contour_points', 'gt_contour_offsets')
+    } for sample in samples], samples_per_gpu=2)
+    contour_points = batch['gt_contour_points'].data[0]
+    contour_offsets = batch['gt_contour_offsets'].data[0]
+    assert contour_offsets.shape == (2, 1, 4)
+
+    self = _build_fouriernet_head()
+    img_metas, feats = _fouriernet_head_inputs(self, s=384)
+    feats = [feat.expand(2, -1, -1, -1) for feat in feats]
+    outs = self.forward(feats)
+    gts = {
+        key: [sample[key] for sample in samples]
+        for key in ('gt_bboxes', 'gt_labels', 'gt_centers',
+                    'gt_max_centerness')
+    }
+    args = outs + (gts['gt_bboxes'], gts['gt_labels'], img_metas * 2, None)
+    kwargs = dict(
+        gt_centers=gts['gt_centers'],
+        gt_max_centerness=gts['gt_max_centerness'])
+    losses = self.loss(
+        *args, gt_masks=[sample['gt_masks'] for sample in samples], **kwargs)
+    packed_losses = self.loss(
+        *args,
+        gt_contour_points=contour_points,
+        gt_contour_offsets=contour_offsets,
+        **kwargs)
+    for name, loss in losses.items():
+        assert torch.equal(loss, packed_losses[name])
+
+
+def test_pipeline_polar_targets():
+    rng = torch.Generator().manual_seed(1)
+    self = _build_fouriernet_head(strides=[8, 16, 32, 64, 128])
+    transform = PolarTarget(
+        strides=self.strides, contour_points=self.contour_points)
+    samples = []
+    # images of different sizes are padded to the largest one in the batch
+    for pad_shape in ((416, 448, 3), (448, 416, 3)):
+        contours = _random_contours(6, rng)
+        samples.append(
+            transform(
+                dict(
+                    pad_shape=pad_shape,
+                    gt_bboxes=torch.stack([
+                        torch.cat([c.min(0)[0], c.max(0)[0]]).float()
+                        for c in contours
+                    ]).numpy(),
+                    gt_labels=torch.randint(1, 4, (6, ),
+                                            generator=rng).numpy(),
+                    gt_masks=contours,
+                    gt_centers=[c.float().mean(0).flip(0).int().tolist()
+                                for c in contours],
+                    gt_max_centerness=[1.] * 6)))
+    polar_targets = collate([
+        DC(sample['gt_polar_targets'], stack=True, pad_dims=1)
+        for sample in samples
+    ], samples_per_gpu=2).data[0]
+
+    featmap_sizes = [(math.ceil(448 / s), math.ceil(448 / s))
+                     for s in self.strides]
+    point_grid = self.get_point_grid(featmap_sizes, torch.float, 'cpu')
+    labels, bbox_targets, mask_targets, centerness_targets = \
+        self.polar_target(
+            point_grid,
+            [torch.from_numpy(sample['gt_labels']) for sample in samples],
+            [torch.from_numpy(sample['gt_bboxes']) for sample in samples],
+            [pack_contours(sample['gt_masks']) for sample in samples],
+            [torch.Tensor(sample['gt_centers']) for sample in samples],
+            [torch.Tensor(sample['gt_max_centerness'])
+             for sample in samples])
+    flatten_labels = torch.cat(labels)
+    pos_inds = flatten_labels.nonzero().reshape(-1)
+    assert pos_inds.numel() > 0
+
+    targets = self.unpack_polar_targets(polar_targets, point_grid,
+                                        featmap_sizes)
+    assert torch.equal(targets[0], flatten_labels)
+    assert torch.equal(targets[1], pos_inds)
+    assert torch.equal(targets[2], torch.cat(bbox_targets)[pos_inds])
+    assert torch.allclose(targets[3], torch.cat(mask_targets)[pos_inds])
+    assert torch.allclose(targets[4], torch.cat(centerness_targets)[pos_inds])
+
+
+def test_bbox_mask2result_batched_rle():
+    bboxes = torch.rand(12, 5)
+    masks = torch.rand(12, 2, 36) * 100
+    labels = torch.randint(0, 3, (12, ))
+    img_meta = dict(ori_shape=(80, 120, 3))
+    bbox_results, mask_results = bbox_mask2result(bboxes, masks, labels, 4,
+                                                  img_meta)
+    for label in range(3):
+        inds = (labels == label).nonzero().reshape(-1).tolist()
+        assert len(bbox_results[label]) == len(inds)
+        expected = [
+            mask_util.frPyObjects([masks[i].t().reshape(-1).tolist()], 80,
+                                  120)[0] for i in inds
+        ]
+        assert mask_results[label] == expected
+
+
+def _init_fouriernet_detector():
+    """The r50 FourierNet with random weights, testing at a small scale."""
+    config = mmcv.Config.fromfile(
+        osp.join(
+            osp.dirname(osp.dirname(__file__)),
+            'configs/fouriernet/fourier_768_1x_r50_36_60.py'))
+    config.data.test.pipeline[1].img_scale = (320, 192)
+    # keep the low scores of the random weights
+    config.test_cfg.score_thr = 0.
+    return init_detector(config, device='cpu')
+
+
+def _assert_same_results(results, expected):
+    assert len(results) == len(expected)
+    for (bbox_result, segm_result), (bbox_expected,
+                                     segm_expected) in zip(results, expected):
+        assert sum(len(bboxes) for bboxes in bbox_expected) > 0
+        for bboxes, expected_bboxes in zip(bbox_result, bbox_expected):
+            np.testing.assert_allclose(bboxes, expected_bboxes, atol=1e-4)
+        assert segm_result == segm_expected
+
+
+def test_inference_detector_batch():
+    torch.manual_seed(0)
+    model = _init_fouriernet_detector()
+    rng = np.random.RandomState(0)
+    imgs = [
+        rng.randint(0, 256, (180, 300, 3), dtype=np.uint8) for _ in range(3)
+    ]
+    expected = [inference_detector(model, img) for img in imgs]
+    # the test pipeline is built once
+    test_pipeline = model.test_pipeline
+    for num_imgs in (1, 3):
+        results = inference_detector_batch(model, imgs[:num_imgs])
+        _assert_same_results(results, expected[:num_imgs])
+    assert model.test_pipeline is test_pipeline
+
+    # several images per batch only with batched=True
+    data = dict(
+        img=[torch.rand(2, 3, 192, 320)],
+        img_meta=[[
+            dict(
+                img_shape=(192, 320, 3),
+                ori_shape=(192, 320, 3),
+                pad_shape=(192, 320, 3),
+                scale_factor=1.,
+                flip=False)
+        ] * 2])
+    with torch.no_grad():
+        assert len(model(return_loss=False, batched=True, **data)) == 2
+        with pytest.raises(ValueError):
+            model(return_loss=False, **data)
+
+
+class _CPUDataParallel(torch.nn.Module):
+    """Unwraps the data containers as ``MMDataParallel`` does on GPUs."""
+
+    def __init__(self, module):
+        super(_CPUDataParallel, self).__init__()
+        self.module = module
+
+    def forward(self, **kwargs):
+        for key, value in kwargs.items():
+            if isinstance(value, list):
+                kwargs[key] = [
+                    v.data[0] if isinstance(v, DC) else v for v in value
+                ]
+        return self.module(**kwargs)
+
+
+@pytest.mark.parametrize('batch_size', [1, 2])
+def test_single_gpu_test_batch(tmpdir, batch_size):
+    spec = importlib.util.spec_from_file_location(
+        'test_tool',
+        osp.join(osp.dirname(osp.dirname(__file__)), 'tools/test.py'))
+    test_tool = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(test_tool)
+
+    torch.manual_seed(0)
+    model = _init_fouriernet_detector()
+    rng = np.random.RandomState(0)
+    img_infos = []
+    for i in range(3):
+        filename = '{}.png'.format(i)
+        mmcv.imwrite(
+            rng.randint(0, 256, (180, 300, 3), dtype=np.uint8),
+            str(tmpdir.join(filename)))
+        img_infos.append(dict(filename=filename, width=300, height=180))
+    mmcv.dump(img_infos, str(tmpdir.join('ann.pkl')))
+    dataset = build_dataset(
+        dict(
+            type='CustomDataset',
+            ann_file=str(tmpdir.join('ann.pkl')),
+            img_prefix=str(tmpdir),
+            pipeline=model.cfg.data.test.pipeline,
+            test_mode=True))
+    # the last batch holds fewer images
+    data_loader = build_dataloader(
+        dataset,
+        imgs_per_gpu=batch_size,
+        workers_per_gpu=0,
+        dist=False,
+        shuffle=False)
+
+    results = test_tool.single_gpu_test(_CPUDataParallel(model), data_loader)
+    expected = [
+        inference_detector(model, str(tmpdir.join(img_info['filename'])))
+        for img_info in img_infos
+    ]
+    _assert_same_results(results, expected)
+
+
+class _StubDetector(torch.nn.Module):
+    """Boxes the whole image, so the runner is tested without a network."""
+
+    def __init__(self):
+        super(_StubDetector, self).__init__()
+        self.weight = torch.nn.Parameter(torch.zeros(1))
+        self.bbox_head = mmcv.Config(dict(num_classes=2))
+        self.cfg = mmcv.Config(
+            dict(
+                data=dict(
+                    test=dict(pipeline=[
+                        dict(type='LoadImageFromFile'),
+                        dict(
+                            type='MultiScaleFlipAug',
+                            img_scale=(64, 64),
+                            flip=False,
+                            transforms=[
+                                dict(type='Resize', keep_ratio=True),
+                                dict(
+                                    type='Normalize',
+                                    mean=[0, 0, 0],
+                                    std=[1, 1, 1],
+                                    to_rgb=False),
+                                dict(type='Pad', size_divisor=32),
+                                dict(type='ImageToTensor', keys=['img']),
+                                dict(type='Collect', keys=['img']),
+                            ])
+                    ]))))
+
+    def simple_test_bboxes(self, img, img_meta, rescale=False):
+        assert len(img) == len(img_meta)
+        det_list = []
+        for meta in img_meta:
+            h, w = meta['ori_shape'][:2]
+            det_bboxes = img.new_tensor([[0, 0, w - 1, h - 1, 1]])
+            contours = img.new_tensor([[[0, w - 1, w - 1, 0],
+                                        [0, 0, h - 1, h - 1]]])
+            det_list.append((det_bboxes, img.new_zeros(1).long(), contours))
+        return det_list
+
+
+def _call_with_timeout(func, timeout=120):
+    """Call ``func`` in a thread, fails if it does not return in time, and
+    return its exception."""
+    errors = []
+
+    def target():
+        try:
+            func()
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'deadlock'
+    return errors[0] if errors else None
+
+
+def test_streaming_inference():
+    with pytest.raises(TypeError):
+        StreamingInference(torch.nn.Linear(1, 1))
+
+    rng = np.random.RandomState(0)
+    # images of different sizes, the last batch holds fewer images
+    imgs = [
+        rng.randint(0, 256, (40 + i, 60 + 2 * i, 3), dtype=np.uint8)
+        for i in range(11)
+    ]
+    # queues smaller than the number of images hold the loaders back
+    runner = StreamingInference(
+        _StubDetector(),
+        batch_size=3,
+        num_loaders=2,
+        num_writers=2,
+        queue_size=2)
+
+    results = {}
+    lock = threading.Lock()
+
+    def collect(img, result):
+        with lock:
+            i = next(i for i in range(len(imgs)) if imgs[i] is img)
+            assert i not in results
+            results[i] = result
+
+    assert _call_with_timeout(lambda: runner(imgs, collect)) is None
+    assert sorted(results) == list(range(len(imgs)))
+    for i, (bbox_result, segm_result) in results.items():
+        h, w = imgs[i].shape[:2]
+        np.testing.assert_allclose(bbox_result[0], [[0, 0, w - 1, h - 1, 1]])
+        assert mask_util.area(segm_result[0])[0] > 0
+    for name in ('load', 'forward', 'write'):
+        assert runner.counters[name].count == len(imgs)
+
+    # a failing callback stops a source that waits for more images, while
+    # the forward waits for them
+    runner = StreamingInference(_StubDetector(), batch_size=3)
+
+    def waiting_imgs():
+        yield from imgs[:3]
+        runner._stop.wait()
+
+    def fail(img, result):
+        raise RuntimeError('callback')
+
+    error = _call_with_timeout(lambda: runner(waiting_imgs(), fail))
+    assert str(error) == 'callback'
+
+    # failing loaders
+    def broken_imgs():
+        yield imgs[0]
+        raise RuntimeError('source')
+
+    error = _call_with_timeout(lambda: runner(broken_imgs(), collect))
+    assert str(error) == 'source'
+    error = _call_with_timeout(
+        lambda: runner(imgs[:1] + ['missing.jpg'], collect))
+    assert error is not None
+
+
+def test_streaming_inference_detector():
+    torch.manual_seed(0)
+    model = _init_fouriernet_detector()
+    rng = np.random.RandomState(0)
+    imgs = [
+        rng.randint(0, 256, (180, 300, 3), dtype=np.uint8) for _ in range(3)
+    ]
+    expected = [inference_detector(model, img) for img in imgs]
+    results = {}
+
+    def collect(img, result):
+        results[next(i for i in range(3) if imgs[i] is img)] = result
+
+    StreamingInference(model, batch_size=2)(imgs, collect)
+    _assert_same_results([results[i] for i in range(3)], expected)
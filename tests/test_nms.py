@@ -68,3 +68,49 @@ def test_nms_device_and_dtypes_gpu():
         surpressed, inds = nms(dets, iou_thr)
         assert dets.dtype == surpressed.dtype
         assert len(inds) == len(surpressed) == 3
+
+
+def test_multiclass_nms_with_mask_matches_per_class_nms():
+    from mmdet.core import multiclass_nms, multiclass_nms_with_mask
+
+    rng = torch.Generator().manual_seed(0)
+    xy = torch.rand(300, 2, generator=rng) * 200
+    wh = torch.rand(300, 2, generator=rng) * 60 + 4
+    bboxes = torch.cat([xy, xy + wh], dim=1)
+    scores = torch.rand(300, 6, generator=rng)
+    factors = torch.rand(300, generator=rng)
+    masks = torch.rand(300, 2, 18, generator=rng)
+    nms_cfg = dict(type='nms', iou_thr=0.5)
+
+    expected_bboxes, expected_labels = multiclass_nms(
+        bboxes, scores, 0.3, nms_cfg, max_num=50, score_factors=factors)
+    det_bboxes, det_labels, det_masks = multiclass_nms_with_mask(
+        bboxes,
+        scores,
+        masks,
+        0.3,
+        nms_cfg,
+        max_num=50,
+        score_factors=factors)
+    assert torch.allclose(det_bboxes, expected_bboxes)
+    assert torch.equal(det_labels, expected_labels)
+    # masks follow their boxes
+    det_inds = [(bboxes == b[:4]).all(1).nonzero()[0, 0] for b in det_bboxes]
+    assert torch.equal(det_masks, masks[torch.stack(det_inds)])
+
+    # suppressing the classes one by one gives the same detections
+    results = multiclass_nms_with_mask(
+        bboxes,
+        scores,
+        masks,
+        0.3,
+        dict(nms_cfg, split_thr=10),
+        max_num=50,
+        score_factors=factors)
+    for result, expected in zip(results, (det_bboxes, det_labels, det_masks)):
+        assert torch.equal(result, expected)
+
+    # the empty result keeps the shape of the masks
+    _, _, det_masks = multiclass_nms_with_mask(bboxes, scores, masks, 1.0,
+                                               nms_cfg)
+    assert det_masks.shape == (0, 2, 18)
@@ -0,0 +1,80 @@
+import argparse
+import os.path as osp
+
+import mmcv
+from pycocotools.coco import COCO
+
+from mmdet.datasets.contour_cache import ContourCache
+from mmdet.datasets.pipelines import LoadAnnotations
+from mmdet.datasets.pipelines.contour import (get_contour_center,
+                                              get_polar_coordinates,
+                                              polar_centerness_target)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Precompute the contours of a COCO annotation file')
+    parser.add_argument('ann_file', help='COCO annotation file')
+    parser.add_argument('out_dir', help='output directory of the cache')
+    parser.add_argument(
+        '--contour-points',
+        type=int,
+        required=True,
+        help='number of rays used to compute the max centerness, must '
+        'match contour_points of the FourierNet head and FormatContours')
+    parser.add_argument(
+        '--nproc', default=4, type=int, help='number of process')
+    return parser.parse_args()
+
+
+class ContourWorker(object):
+
+    def __init__(self, contour_points):
+        self.loader = LoadAnnotations(with_contour=True)
+        self.contour_points = contour_points
+
+    def __call__(self, task):
+        segmentation, img_h, img_w = task
+        contour = self.loader._poly2contour(segmentation, img_h, img_w)
+        if len(contour) == 0:
+            # empty instances are skipped in training
+            return contour, [0, 0], 0.
+        c_x, c_y = get_contour_center(contour)
+        distances, _ = get_polar_coordinates(c_x, c_y, contour,
+                                             self.contour_points)
+        return contour, [c_x, c_y], polar_centerness_target(distances)
+
+
+def main():
+    args = parse_args()
+    coco = COCO(args.ann_file)
+    ann_ids, tasks = [], []
+    for ann_id, ann in coco.anns.items():
+        if ann.get('iscrowd', False):
+            continue
+        img_info = coco.imgs[ann['image_id']]
+        ann_ids.append(ann_id)
+        tasks.append(
+            (ann['segmentation'], img_info['height'], img_info['width']))
+
+    worker = ContourWorker(args.contour_points)
+    if args.nproc > 1:
+        results = mmcv.track_parallel_progress(
+            worker, tasks, nproc=args.nproc)
+    else:
+        results = mmcv.track_progress(worker, tasks)
+
+    ContourCache.dump(
+        args.out_dir,
+        ann_ids,
+        [contour for contour, _, _ in results],
+        [center for _, center, _ in results],
+        [centerness for _, _, centerness in results],
+        ann_file=osp.abspath(args.ann_file),
+        contour_points=args.contour_points)
+    print('Cached the contours of {} instances to {}'.format(
+        len(ann_ids), args.out_dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+import argparse
+
+import numpy as np
+import torch
+import torch.nn as nn
+from mmcv import Config
+from mmcv.runner import load_checkpoint
+
+from mmdet.models import build_detector
+
+OUTPUT_NAMES = ('bboxes', 'scores', 'centerness', 'contours')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Export a FourierNet to TorchScript or ONNX')
+    parser.add_argument('config', help='test config file path')
+    parser.add_argument('checkpoint', help='checkpoint file')
+    parser.add_argument('out_file', help='exported model file')
+    parser.add_argument(
+        '--format',
+        choices=['torchscript', 'onnx'],
+        default='onnx',
+        help='export format')
+    parser.add_argument(
+        '--shape',
+        type=int,
+        nargs=2,
+        default=[800, 1344],
+        help='padded input image size (height, width)')
+    parser.add_argument(
+        '--nms-pre',
+        type=int,
+        help='candidates kept per level, defaults to nms_pre of test_cfg')
+    parser.add_argument('--opset', type=int, default=11, help='ONNX opset')
+    parser.add_argument(
+        '--verify',
+        action='store_true',
+        help='compare the outputs of the exported model to PyTorch on CPU, '
+        'ONNX models are run with onnxruntime')
+    args = parser.parse_args()
+    return args
+
+
+class FourierNetExport(nn.Module):
+    """Backbone, neck, head and candidate decoding of a FourierNet.
+
+    Takes normalized images of shape (N, 3, H, W) and returns the outputs of
+    :meth:`FourierNetHead.get_candidates_export`, see ``OUTPUT_NAMES``.
+    """
+
+    def __init__(self, model, img_shape, nms_pre=1000):
+        super(FourierNetExport, self).__init__()
+        self.model = model
+        self.img_shape = img_shape
+        self.nms_pre = nms_pre
+
+    def forward(self, img):
+        x = self.model.extract_feat(img)
+        outs = self.model.bbox_head(x)
+        return self.model.bbox_head.get_candidates_export(
+            *outs, self.img_shape, self.nms_pre)
+
+
+def export(model, img, out_file, fmt='onnx', opset=11):
+    with torch.no_grad():
+        if fmt == 'torchscript':
+            torch.jit.trace(model, img).save(out_file)
+        else:
+            torch.onnx.export(
+                model,
+                img,
+                out_file,
+                input_names=['img'],
+                output_names=list(OUTPUT_NAMES),
+                dynamic_axes={
+                    name: {
+                        0: 'batch'
+                    }
+                    for name in ('img', ) + OUTPUT_NAMES
+                },
+                opset_version=opset)
+
+
+def run_exported(out_file, img, fmt='onnx'):
+    if fmt == 'torchscript':
+        with torch.no_grad():
+            outputs = torch.jit.load(out_file)(img)
+        return [output.numpy() for output in outputs]
+    try:
+        import onnxruntime
+    except ImportError:
+        raise ImportError('please install onnxruntime to verify the model')
+    session = onnxruntime.InferenceSession(
+        out_file, providers=['CPUExecutionProvider'])
+    return session.run(None, {'img': img.numpy()})
+
+
+def match_candidates(outputs, expected, window=8):
+    """Indices of the exported candidates matching the expected ones.
+
+    Candidates whose scores only differ by rounding errors may be swapped by
+    top-k, every expected candidate is matched to the closest exported one
+    at most ``window`` ranks away.
+    """
+    feats, expected_feats = [
+        np.concatenate([o.reshape(o.shape[:2] + (-1, )) for o in x], axis=-1)
+        for x in (outputs, expected)
+    ]
+    num_imgs, num_candidates = feats.shape[:2]
+    inds = np.arange(num_candidates)
+    matches = np.tile(inds, (num_imgs, 1))
+    min_dists = np.full((num_imgs, num_candidates), np.inf)
+    for offset in range(-window, window + 1):
+        candidate_inds = np.clip(inds + offset, 0, num_candidates - 1)
+        dists = np.abs(feats[:, candidate_inds] - expected_feats).max(-1)
+        closer = dists < min_dists
+        min_dists[closer] = dists[closer]
+        matches[closer] = np.tile(candidate_inds, (num_imgs, 1))[closer]
+    return matches
+
+
+def verify(model, out_file, img, fmt='onnx', rtol=1e-3, atol=1e-2):
+    """Check the exported model against PyTorch, atol is in pixels."""
+    with torch.no_grad():
+        expected = [output.numpy() for output in model(img)]
+    outputs = run_exported(out_file, img, fmt)
+    matches = match_candidates(outputs, expected)
+    for name, output, expected_output in zip(OUTPUT_NAMES, outputs,
+                                             expected):
+        output = np.take_along_axis(
+            output,
+            matches.reshape(matches.shape + (1, ) * (output.ndim - 2)),
+            axis=1)
+        np.testing.assert_allclose(
+            output,
+            expected_output,
+            rtol=rtol,
+            atol=atol,
+            err_msg='{} of the exported model differ'.format(name))
+        print('{:<12}{:<18}max abs diff {:.2e}'.format(
+            name, str(output.shape),
+            np.abs(output - expected_output).max()))
+
+
+def main():
+    args = parse_args()
+
+    cfg = Config.fromfile(args.config)
+    cfg.model.pretrained = None
+    model = build_detector(cfg.model, train_cfg=None, test_cfg=cfg.test_cfg)
+    load_checkpoint(model, args.checkpoint, map_location='cpu')
+    model.eval()
+
+    nms_pre = args.nms_pre or cfg.test_cfg.get('nms_pre', 1000)
+    export_model = FourierNetExport(model, tuple(args.shape), nms_pre).eval()
+    img = torch.randn(1, 3, *args.shape)
+    export(export_model, img, args.out_file, args.format, args.opset)
+    print('Exported the model to {}'.format(args.out_file))
+
+    if args.verify:
+        # a different batch size checks the dynamic batch axis of ONNX
+        batch_size = 2 if args.format == 'onnx' else 1
+        verify(export_model, args.out_file,
+               torch.randn(batch_size, 3, *args.shape), args.format)
+
+
+if __name__ == '__main__':
+    main()
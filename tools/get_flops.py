@@ -1,9 +1,14 @@
 import argparse
+import copy
+from ast import literal_eval
 
+import torch
 from mmcv import Config
 
 from mmdet.models import build_detector
 from mmdet.utils import get_model_complexity_info
+from mmdet.utils.flops_counter import (flops_to_string, is_supported_instance,
+                                       params_to_string)
 
 
 def parse_args():
@@ -15,10 +20,45 @@ def parse_args():
         nargs='+',
         default=[1280, 800],
         help='input image size')
+    parser.add_argument(
+        '--head-options',
+        nargs='+',
+        default=[],
+        help='bbox_head options of a variant to compare with the config, '
+        'e.g. shared_convs=2 merge_final_convs=True')
+    parser.add_argument(
+        '--device',
+        default='cuda' if torch.cuda.is_available() else 'cpu')
     args = parser.parse_args()
     return args
 
 
+def get_flops(cfg, input_shape, device, print_per_layer_stat=True):
+    """FLOPs and params of the model and FLOPs of its head."""
+    model = build_detector(
+        cfg.model, train_cfg=cfg.train_cfg, test_cfg=cfg.test_cfg).to(device)
+    model.eval()
+
+    if hasattr(model, 'forward_dummy'):
+        model.forward = model.forward_dummy
+    else:
+        raise NotImplementedError(
+            'FLOPs counter is currently not currently supported with {}'.
+            format(model.__class__.__name__))
+
+    flops, params = get_model_complexity_info(
+        model,
+        input_shape,
+        print_per_layer_stat=print_per_layer_stat,
+        as_strings=False)
+    head_flops = 0
+    if hasattr(model, 'bbox_head'):
+        head_flops = sum(m.__flops__ for m in model.bbox_head.modules()
+                         if is_supported_instance(m))
+        head_flops /= model.__batch_counter__
+    return flops, params, head_flops
+
+
 def main():
 
     args = parse_args()
@@ -31,21 +71,40 @@ def main():
         raise ValueError('invalid input shape')
 
     cfg = Config.fromfile(args.config)
-    model = build_detector(
-        cfg.model, train_cfg=cfg.train_cfg, test_cfg=cfg.test_cfg).cuda()
-    model.eval()
-
-    if hasattr(model, 'forward_dummy'):
-        model.forward = model.forward_dummy
+    # the weights do not change the FLOPs
+    cfg.model.pretrained = None
+    if not args.head_options:
+        flops, params, _ = get_flops(cfg, input_shape, args.device)
+        split_line = '=' * 30
+        print('{0}\nInput shape: {1}\nFlops: {2}\nParams: {3}\n{0}'.format(
+            split_line, input_shape, flops_to_string(flops),
+            params_to_string(params)))
     else:
-        raise NotImplementedError(
-            'FLOPs counter is currently not currently supported with {}'.
-            format(model.__class__.__name__))
-
-    flops, params = get_model_complexity_info(model, input_shape)
-    split_line = '=' * 30
-    print('{0}\nInput shape: {1}\nFlops: {2}\nParams: {3}\n{0}'.format(
-        split_line, input_shape, flops, params))
+        variant_cfg = copy.deepcopy(cfg)
+        for option in args.head_options:
+            key, value = option.split('=', 1)
+            try:
+                value = literal_eval(value)
+            except (ValueError, SyntaxError):
+                pass
+            variant_cfg.model.bbox_head[key] = value
+        flops, params, head_flops = get_flops(
+            cfg, input_shape, args.device, print_per_layer_stat=False)
+        variant_flops, variant_params, variant_head_flops = get_flops(
+            variant_cfg, input_shape, args.device, print_per_layer_stat=False)
+        split_line = '=' * 30
+        print('{0}\nInput shape: {1}\n{2:<10}{3:<12}{4:<12}{5}'.format(
+            split_line, input_shape, '', 'Flops', 'Head flops', 'Params'))
+        rows = (('config', flops, head_flops, params),
+                ('variant', variant_flops, variant_head_flops, variant_params))
+        for name, model_flops, model_head_flops, model_params in rows:
+            print('{:<10}{:<12}{:<12}{}'.format(
+                name, flops_to_string(model_flops),
+                flops_to_string(model_head_flops),
+                params_to_string(model_params)))
+        print('{:<10}{:<12}{}\n{}'.format(
+            'diff', flops_to_string(variant_flops - flops),
+            flops_to_string(variant_head_flops - head_flops), split_line))
     print('!!!Please be cautious if you use the results in papers. '
           'You may need to check if all ops are supported and verify that the '
           'flops computation is correct.')
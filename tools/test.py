@@ -16,6 +16,15 @@ from mmdet.datasets import build_dataloader, build_dataset
 from mmdet.models import build_detector
 
 
+def batch_test(model, data, rescale):
+    """Results of every image of a batch, batches of several images are only
+    supported by detectors that accept ``batched=True``, e.g. FourierNet."""
+    if len(data['img_meta'][0].data[0]) > 1:
+        return model(
+            return_loss=False, rescale=rescale, batched=True, **data)
+    return [model(return_loss=False, rescale=rescale, **data)]
+
+
 def single_gpu_test(model, data_loader, show=False):
     model.eval()
     results = []
@@ -23,13 +32,13 @@ def single_gpu_test(model, data_loader, show=False):
     prog_bar = mmcv.ProgressBar(len(dataset))
     for i, data in enumerate(data_loader):
         with torch.no_grad():
-            result = model(return_loss=False, rescale=not show, **data)
-        results.append(result)
+            result = batch_test(model, data, rescale=not show)
+        results.extend(result)
 
         if show:
-            model.module.show_result(data, result)
+            model.module.show_result(data, result[0])
 
-        batch_size = data['img'][0].size(0)
+        batch_size = len(result)
         for _ in range(batch_size):
             prog_bar.update()
     return results
@@ -62,12 +71,11 @@ def multi_gpu_test(model, data_loader, tmpdir=None, gpu_collect=False):
         prog_bar = mmcv.ProgressBar(len(dataset))
     for i, data in enumerate(data_loader):
         with torch.no_grad():
-            result = model(return_loss=False, rescale=True, **data)
-        results.append(result)
+            result = batch_test(model, data, rescale=True)
+        results.extend(result)
 
         if rank == 0:
-            batch_size = data['img'][0].size(0)
-            for _ in range(batch_size * world_size):
+            for _ in range(len(result) * world_size):
                 prog_bar.update()
 
     # collect results from all ranks
@@ -216,6 +224,12 @@ def parse_args():
         help='evaluation metrics, which depends on the dataset, e.g., "bbox",'
         ' "segm", "proposal" for COCO, and "mAP", "recall" for PASCAL VOC')
     parser.add_argument('--show', action='store_true', help='show results')
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=1,
+        help='number of test images per gpu, only detectors that return one '
+        'result per image (e.g. FourierNet) support more than 1')
     parser.add_argument(
         '--gpu_collect',
         action='store_true',
@@ -249,6 +263,9 @@ def main():
     if args.eval and args.format_only:
         raise ValueError('--eval and --format_only cannot be both specified')
 
+    if args.show and args.batch_size > 1:
+        raise ValueError('--show only supports --batch_size 1')
+
     if args.out is not None and not args.out.endswith(('.pkl', '.pickle')):
         raise ValueError('The output file must be a pkl file.')
 
@@ -267,11 +284,10 @@ def main():
         init_dist(args.launcher, **cfg.dist_params)
 
     # build the dataloader
-    # TODO: support multiple images per gpu (only minor changes are needed)
     dataset = build_dataset(cfg.data.test)
     data_loader = build_dataloader(
         dataset,
-        imgs_per_gpu=1,
+        imgs_per_gpu=args.batch_size,
         workers_per_gpu=cfg.data.workers_per_gpu,
         dist=distributed,
         shuffle=False)